@@ -1,59 +1,133 @@
 #!/usr/bin/env python3
+"""Cancel the ecFlow tasks that can no longer run because a task failed.
+
+    abort_dep_tasks.py [--suite <name>] [--max-failures <N>] [--fail-file <file>]
+
+A task has failed once it aborted in its last try (ECF_TRIES).  Every task
+whose trigger needs a failed task, directly or through other tasks, is
+cancelled: queued tasks are set to aborted, submitted and active ones are
+killed first.  With --max-failures, all unfinished tasks are cancelled once
+N tasks have failed.  The cancelled tasks are appended to --fail-file, in
+the format of the fail_test files rt.sh lists at the end of its log.
+"""
 from __future__ import print_function
 import ecflow as ecflow
 import re
+import argparse
+
+TRIGGER_TASK_RE = re.compile(r'(\S+) ==')
+
+FINISHED = (ecflow.State.complete, ecflow.State.aborted)
+RUNNING = (ecflow.State.submitted, ecflow.State.active)
 
-# this script will work ONLY for standalone nmmb regression test ecflow workflow
 
 class DefsTraverser:
 
-    def __init__(self, defs, ci):
+    def __init__(self, defs, ci, suite_name=None):
         assert (isinstance(defs, ecflow.Defs)),"Expected ecflow.Defs as first argument"
         assert (isinstance(ci, ecflow.Client)),"Expected ecflow.Client as second argument"
         self.__defs = defs
         self.__ci = ci
-        self.__suite = None
+        self.__suite_name = suite_name
+        self.cancelled = []
 
-    def force_abort(self):
+    def force_abort(self, max_failures=None):
         for suite in self.__defs.suites:
-            self.__suite = suite
-            self.__walk_node(suite)
+            if self.__suite_name and suite.name() != self.__suite_name:
+                continue
+            tasks = {}
+            self.__walk_node(suite, tasks)
+            self.__abort_suite(suite, tasks, max_failures)
 
-    def __walk_node(self, node_container):
+    def __walk_node(self, node_container, tasks):
         for node in node_container.nodes:
             if isinstance(node, ecflow.Task):
-                self.__check_task(node)
+                tasks[node.name()] = node
             else:
-                self.__walk_node(node)
-
-    def __check_task(self, node):
-        trigger_expr = node.get_trigger()
-        if trigger_expr:
-            tasks = re.findall( r'(\S*) ==', trigger_expr.get_expression())
-            for t in tasks:
-                task = self.__defs.find_abs_node( self.__suite.get_abs_node_path() + "/" + t)
-                if task.get_state() == ecflow.State.aborted:
-                    if node.get_state() != ecflow.State.aborted:
-                        print("Will force aborted state for task", node.get_abs_node_path())
-                        self.__ci.force_state(node.get_abs_node_path(), ecflow.State.aborted)
-
-try:
-    # Create the client. This will read the default environment variables
-    ci = ecflow.Client()
-
-    # Get the node tree suite definition as stored in the server
-    # The definition is retrieved and stored on the variable 'ci'
-    ci.sync_local()
-
-    # access the definition retrieved from the server
-    server_defs = ci.get_defs()
-
-    if server_defs == None :
-        print("The server has no definition")
-        exit(1)
-
-    traverser = DefsTraverser(server_defs, ci)
-    traverser.force_abort()
-
-except RuntimeError as e:
-    print("failed: " + str(e))
+                self.__walk_node(node, tasks)
+
+    @staticmethod
+    def __failed(task):
+        if task.get_state() != ecflow.State.aborted:
+            return False
+        tries = task.find_parent_variable('ECF_TRIES').value() or '2'
+        try_no = task.get_try_no()
+        # tasks aborted by this script never ran
+        return try_no > 0 and try_no >= int(tries)
+
+    def __abort_suite(self, suite, tasks, max_failures):
+        dependents = {}
+        for name, task in tasks.items():
+            trigger_expr = task.get_trigger()
+            if trigger_expr:
+                for t in TRIGGER_TASK_RE.findall(trigger_expr.get_expression()):
+                    dependents.setdefault(t.lstrip('('), []).append(name)
+
+        failed = sorted(name for name, task in tasks.items() if self.__failed(task))
+
+        if max_failures and len(failed) >= max_failures:
+            print("{} tasks failed, cancelling suite {}".format(len(failed), suite.name()))
+            for name in sorted(tasks):
+                self.__cancel(tasks[name], '{} failures'.format(len(failed)))
+            return
+
+        # all tasks that need a failed task, in one pass
+        for root in failed:
+            todo = list(dependents.get(root, []))
+            while todo:
+                name = todo.pop()
+                if name in tasks:
+                    self.__cancel(tasks[name], root)
+                    todo.extend(dependents.get(name, []))
+
+    def __cancel(self, task, cause):
+        state = task.get_state()
+        if state in FINISHED:
+            return
+        path = task.get_abs_node_path()
+        print("Will force aborted state for task", path)
+        if state in RUNNING:
+            self.__ci.kill(path)
+        self.__ci.force_state(path, ecflow.State.aborted)
+        self.cancelled.append((task.name(), cause))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--suite', help='only this suite (default all)')
+    parser.add_argument('--max-failures', type=int,
+                        help='cancel all tasks once this many failed')
+    parser.add_argument('--fail-file',
+                        help='append the cancelled tasks to this file')
+    args = parser.parse_args()
+
+    traverser = None
+    try:
+        # Create the client. This will read the default environment variables
+        ci = ecflow.Client()
+
+        # Get the node tree suite definition as stored in the server
+        # The definition is retrieved and stored on the variable 'ci'
+        ci.sync_local()
+
+        # access the definition retrieved from the server
+        server_defs = ci.get_defs()
+
+        if server_defs == None :
+            print("The server has no definition")
+            exit(1)
+
+        traverser = DefsTraverser(server_defs, ci, args.suite)
+        traverser.force_abort(args.max_failures)
+
+    except RuntimeError as e:
+        print("failed: " + str(e))
+
+    if args.fail_file and traverser and traverser.cancelled:
+        with open(args.fail_file, 'a') as f:
+            for name, cause in traverser.cancelled:
+                f.write("{} cancelled after {}\n".format(name, cause))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,65 @@
 #! /usr/bin/env bash
+
+__ATPARSE_PY=$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )/atparse.py
+
+# Expand @[var] templates.  Between atparse_start and atparse_stop,
+# atparse.py renders them in one python process, started once, and reports
+# an undefined variable with the template line it is used on; it is sent
+# the values of the variables each template uses.  Otherwise, and in
+# subshells, which do not share the process, the shell loop atparse_bash
+# renders them.
 function atparse {
+    if [[ -z ${ATPARSE_SERVER_BASHPID:-} || $BASHPID != "$ATPARSE_SERVER_BASHPID" ]] ; then
+        atparse_bash "$@"
+        return
+    fi
+    local __set_x
+    [ -o xtrace ] && __set_x='set -x' || __set_x='set +x'
+    set +x
+    local __text __name __status __output
+    for __text in "$@" ; do
+        if [[ $__text =~ ^([a-zA-Z][a-zA-Z0-9_]*)=(.*)$ ]] ; then
+            eval "local ${BASH_REMATCH[1]}"
+            eval "${BASH_REMATCH[1]}="'"${BASH_REMATCH[2]}"'
+        else
+            echo "ERROR: Ignoring invalid argument $__text\n" 1>&2
+        fi
+    done
+    IFS= read -r -d '' __text || true
+    printf '%s\0' "$__text" >&${ATPARSE[1]}
+    while IFS= read -r -d '' __name <&${ATPARSE[0]} && [[ -n $__name ]] ; do
+        if [[ -v $__name ]] ; then
+            printf '=%s\0' "${!__name}"
+        else
+            printf -- '-\0'
+        fi
+    done >&${ATPARSE[1]}
+    IFS= read -r -d '' __status <&${ATPARSE[0]} || true
+    IFS= read -r -d '' __output <&${ATPARSE[0]} || true
+    eval "$__set_x"
+    if [[ $__status != 0 ]] ; then
+        echo "ERROR: ${__output:-atparse.py ended}" 1>&2
+        return 1
+    fi
+    printf %s "$__output"
+}
+
+# Start atparse.py for the templates atparse renders from here on.
+function atparse_start {
+    command -v python3 >/dev/null 2>&1 || return 0
+    coproc ATPARSE { exec python3 -S "$__ATPARSE_PY" --serve ; }
+    ATPARSE_SERVER_BASHPID=$BASHPID
+}
+
+function atparse_stop {
+    [[ -n ${ATPARSE_SERVER_BASHPID:-} ]] || return 0
+    local -r pid=$ATPARSE_PID
+    exec {ATPARSE[1]}>&- {ATPARSE[0]}<&-
+    wait $pid || true
+    ATPARSE_SERVER_BASHPID=''
+}
+
+function atparse_bash {
     local __set_x
     [ -o xtrace ] && __set_x='set -x' || __set_x='set +x'
     set +x
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""Expand @[var] templates the way atparse.bash does.
+
+    atparse.py [--vars <file>] [name=value ...] < template > output
+    atparse.py --serve
+    atparse.py --check <template> [...]
+
+A template line may contain
+    @[name]        the value of variable name
+    @['text']      text, verbatim
+    @[@]           a single @
+and any other @ is copied as is.  Variables come from the environment, from
+--vars (a file of NUL separated name=value pairs, as the atparse shell
+function writes all shell variables to it) and from name=value arguments,
+later ones taking precedence.  A variable that is not defined is an error,
+as it is for atparse under "set -u".  Like "read" in atparse, a last line
+without a newline is dropped.
+
+With --serve, it renders any number of templates for the atparse shell
+function, which starts it once per test (atparse_start), so that a test
+pays for one python start and each template is compiled once.  Requests
+and replies on stdin and stdout are NUL terminated fields:
+    -> template text
+    <- the names of the variables it uses, then an empty field
+    -> for each name, "=" and its value, or "-" if it is not set
+    <- "0" and the rendered text, or "1" and the error message
+
+--check prints the variables each template uses.
+"""
+import os
+import re
+import sys
+import argparse
+import functools
+
+TOKEN_RE = re.compile(r"@\[([a-zA-Z_][a-zA-Z_0-9]*)\]|@\['([^']*)'\]|@\[@\]|@")
+ASSIGN_RE = re.compile(r'^([a-zA-Z][a-zA-Z0-9_]*)=(.*)$', re.S)
+
+
+class UndefinedVariable(Exception):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def compile_template(text):
+    """Return the lines of a template as tuples of text and variable parts.
+
+    A variable part is a 1-tuple (name,); everything else is text.
+    """
+    lines = []
+    for line in text.split('\n')[:-1]:
+        parts = []
+        pos = 0
+        for m in TOKEN_RE.finditer(line):
+            literal = line[pos:m.start()]
+            if m.group(1) is not None:
+                parts += [literal, (m.group(1),)]
+            elif m.group(2) is not None:
+                parts.append(literal + m.group(2))
+            else:
+                parts.append(literal + '@')
+            pos = m.end()
+        parts.append(line[pos:] + '\n')
+        lines.append(tuple(parts))
+    return tuple(lines)
+
+
+def render(text, variables, name='<stdin>'):
+    """Return the template text with its variables expanded."""
+    out = []
+    for number, parts in enumerate(compile_template(text), 1):
+        for part in parts:
+            if isinstance(part, tuple):
+                try:
+                    out.append(variables[part[0]])
+                except KeyError:
+                    raise UndefinedVariable(
+                        f'{name}:{number}: @[{part[0]}]: {part[0]} is not defined')
+            else:
+                out.append(part)
+    return ''.join(out)
+
+
+def template_variables(text):
+    """Return the names of the variables a template uses, in order."""
+    names = []
+    for parts in compile_template(text):
+        for part in parts:
+            if isinstance(part, tuple) and part[0] not in names:
+                names.append(part[0])
+    return names
+
+
+def decode(data):
+    return data.decode('utf-8', 'surrogateescape')
+
+
+def read_vars(path):
+    """Return {name: value} of a file of NUL separated name=value pairs."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    variables = {}
+    for item in data.split(b'\0'):
+        name, sep, value = decode(item).partition('=')
+        if sep:
+            variables[name] = value
+    return variables
+
+
+def fields(stream):
+    """Yield the NUL terminated fields read from a binary stream."""
+    data = b''
+    while True:
+        chunk = stream.read1(65536)
+        if not chunk:
+            return
+        data += chunk
+        *done, data = data.split(b'\0')
+        for field in done:
+            yield decode(field)
+
+
+def serve(stdin, stdout):
+    """Render the templates the atparse shell function sends until EOF."""
+    requests = fields(stdin)
+
+    def reply(*items):
+        stdout.write(b''.join(item.encode('utf-8', 'surrogateescape') + b'\0'
+                              for item in items))
+        stdout.flush()
+
+    for text in requests:
+        names = template_variables(text)
+        reply(*names, '')
+        variables = {}
+        for name in names:
+            value = next(requests)
+            if value.startswith('='):
+                variables[name] = value[1:]
+        try:
+            reply('0', render(text, variables))
+        except UndefinedVariable as e:
+            reply('1', str(e))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--vars', help='file of NUL separated name=value pairs')
+    parser.add_argument('--check', action='store_true',
+                        help='print the variables the templates use')
+    parser.add_argument('--serve', action='store_true',
+                        help='render templates for the atparse shell function')
+    parser.add_argument('args', nargs='*', metavar='name=value')
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(sys.stdin.buffer, sys.stdout.buffer)
+        return
+
+    if args.check:
+        for path in args.args:
+            with open(path, 'rb') as f:
+                print(f'{path}: {" ".join(template_variables(decode(f.read())))}')
+        return
+
+    variables = {decode(os.fsencode(k)): decode(os.fsencode(v))
+                 for k, v in os.environ.items()}
+    if args.vars:
+        variables.update(read_vars(args.vars))
+    for arg in args.args:
+        m = ASSIGN_RE.match(arg)
+        if m:
+            variables[m.group(1)] = m.group(2)
+        else:
+            print(f'ERROR: Ignoring invalid argument {arg}', file=sys.stderr)
+
+    try:
+        output = render(decode(sys.stdin.buffer.read()), variables)
+    except UndefinedVariable as e:
+        sys.exit(f'ERROR: {e}')
+    sys.stdout.buffer.write(output.encode('utf-8', 'surrogateescape'))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ import datetime
 import logging
 import os
 import sys
+from . import mirror
 from . import rt
 
 def run(job_obj):
@@ -11,9 +12,11 @@ def run(job_obj):
     pr_repo_loc, repo_dir_str = clone_pr_repo(job_obj, workdir)
     bldate = get_bl_date(job_obj, pr_repo_loc)
     bldir = f'{blstore}/develop-{bldate}/{job_obj.compiler.upper()}'
-    bldirbool = check_for_bl_dir(bldir, job_obj)
-    run_regression_test(job_obj, pr_repo_loc)
-    post_process(job_obj, pr_repo_loc, repo_dir_str, rtbldir, bldir)
+    # rt.sh -c creates the baselines of a compiler in the same rtbldir
+    with job_obj.executor.lock(rtbldir):
+        bldirbool = check_for_bl_dir(bldir, job_obj)
+        run_regression_test(job_obj, pr_repo_loc)
+        post_process(job_obj, pr_repo_loc, repo_dir_str, rtbldir, bldir)
 
 
 def set_directories(job_obj):
@@ -100,14 +103,16 @@ def create_bl_dir(bldir, job_obj):
 
 def run_regression_test(job_obj, pr_repo_loc):
     logger = logging.getLogger('BL/RUN_REGRESSION_TEST')
-    if job_obj.compiler == 'gnu':
-        rt_command = [[f'export RT_COMPILER="{job_obj.compiler}" && cd tests '
-                       '&& /bin/bash --login ./rt.sh -e -c -l rt_gnu.conf',
-                       pr_repo_loc]]
-    elif job_obj.compiler == 'intel':
-        rt_command = [[f'export RT_COMPILER="{job_obj.compiler}" && cd tests '
-                       '&& /bin/bash --login ./rt.sh -e -c', pr_repo_loc]]
-    job_obj.run_commands(logger, rt_command)
+    with job_obj.executor.rt_slot(job_obj.compiler) as limits:
+        if job_obj.compiler == 'gnu':
+            rt_command = [[f'{limits}export RT_COMPILER="{job_obj.compiler}" '
+                           '&& cd tests && /bin/bash --login ./rt.sh -e -c '
+                           '-l rt_gnu.conf', pr_repo_loc]]
+        elif job_obj.compiler == 'intel':
+            rt_command = [[f'{limits}export RT_COMPILER="{job_obj.compiler}" '
+                           '&& cd tests && /bin/bash --login ./rt.sh -e -c',
+                           pr_repo_loc]]
+        job_obj.run_commands(logger, rt_command)
 
 
 def remove_pr_data(job_obj, pr_repo_loc, repo_dir_str, rt_dir):
@@ -133,10 +138,11 @@ def clone_pr_repo(job_obj, workdir):
                    f'{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}'
     pr_repo_loc = f'{repo_dir_str}/{repo_name}'
     job_obj.comment_text_append(f'Repo location: {pr_repo_loc}')
+    clone_opts, submodule_opts = mirror.clone_options(job_obj, workdir)
     create_repo_commands = [
         [f'mkdir -p "{repo_dir_str}"', os.getcwd()],
-        [f'git clone -b {branch} {git_url}', repo_dir_str],
-        ['git submodule update --init --recursive',
+        [f'git clone {clone_opts}-b {branch} {git_url}', repo_dir_str],
+        [f'git {submodule_opts}submodule update --init --recursive',
          f'{repo_dir_str}/{repo_name}'],
         ['git config user.email "brian.curtis@noaa.gov"',
          f'{repo_dir_str}/{repo_name}'],
@@ -155,16 +161,19 @@ def post_process(job_obj, pr_repo_loc, repo_dir_str, rtbldir, bldir):
     rt_log = f'tests/RegressionTests_{job_obj.machine}'\
              f'.{job_obj.compiler}.log'
     filepath = f'{pr_repo_loc}/{rt_log}'
-    rt_dir, logfile_pass = process_logfile(job_obj, filepath)
+    rt_dir, logfile_pass = rt.process_logfile(job_obj, filepath)
     if logfile_pass:
         create_bl_dir(bldir, job_obj)
-        move_bl_command = [[f'mv {rtbldir}/* {bldir}/', pr_repo_loc]]
+        # links or renames on the same filesystem, verified copies otherwise
+        move_bl_command = [[f'python3 tests/baseline_stage.py --tree --move '
+                            f'--jobs 8 {rtbldir} {bldir}', pr_repo_loc]]
         if job_obj.machine == 'orion':
             move_bl_command.append([f'/bin/bash --login adjust_permissions.sh orion develop-{bldate}', blstore])
         job_obj.run_commands(logger, move_bl_command)
         job_obj.comment_text_append('Baseline creation and move successful')
         logger.info('Starting RT Job')
-        rt.run(job_obj)
+        # the new baselines are checked with the full suite
+        rt.run(job_obj, full_suite=True)
         logger.info('Finished with RT Job')
         remove_pr_data(job_obj, pr_repo_loc, repo_dir_str, rt_dir)
 
@@ -197,31 +206,3 @@ def get_bl_date(job_obj, pr_repo_loc):
     logger.info('Finished get_bl_date')
 
     return bldate
-
-
-def process_logfile(job_obj, logfile):
-    logger = logging.getLogger('BL/PROCESS_LOGFILE')
-    rt_dir = []
-    fail_string_list = ['Test', 'failed']
-    if os.path.exists(logfile):
-        with open(logfile) as f:
-            for line in f:
-                if all(x in line for x in fail_string_list):
-                # if 'FAIL' in line and 'Test' in line:
-                    job_obj.comment_text_append(f'{line.rstrip(chr(10))}')
-                elif 'working dir' in line and not rt_dir:
-                    logger.info(f'Found "working dir" in line: {line}')
-                    rt_dir = os.path.split(line.split()[-1])[0]
-                    logger.info(f'It is: {rt_dir}')
-                    job_obj.comment_text_append(f'Please manually delete: '
-                                                f'{rt_dir}')
-                elif 'SUCCESSFUL' in line:
-                    logger.info('RT Successful')
-                    return rt_dir, True
-        logger.critical(f'Log file exists but is not complete')
-        job_obj.job_failed(logger, f'{job_obj.preq_dict["action"]}')
-    else:
-        logger.critical(f'Could not find {job_obj.machine}'
-                        f'.{job_obj.compiler} '
-                        f'{job_obj.preq_dict["action"]} log')
-        raise FileNotFoundError
@@ -0,0 +1,76 @@
+# Imports
+import fcntl
+import logging
+import os
+import subprocess
+import time
+
+# A mirror fetched less than this many seconds ago is used as it is
+FETCH_INTERVAL = 600
+
+# Submodules borrow the objects of the mirror's submodule of the same name
+SUBMODULE_ALTERNATES = ('-c submodule.alternateLocation=superproject '
+                        '-c submodule.alternateErrorStrategy=info')
+
+
+def mirror_root(workdir):
+    ''' The mirrors are kept next to the directory PRs are cloned into '''
+    return os.path.join(os.path.dirname(workdir.rstrip('/')), 'mirror')
+
+
+def git(logger, args, cwd):
+    logger.info(f'Running `git {" ".join(args)}` in "{cwd}"')
+    subprocess.run(['git'] + args, cwd=cwd, check=True,
+                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+
+def update_mirror(url, root, branch):
+    ''' Create or fetch the mirror of a repository and all its submodules.
+        The mirror is a clone of branch with its submodules checked out,
+        so that their objects are in <mirror>/.git/modules/<name> where
+        submodule.alternateLocation=superproject looks for them. Returns
+        the path of the mirror. '''
+    logger = logging.getLogger('MIRROR/UPDATE_MIRROR')
+    path = os.path.join(root, os.path.basename(url.rstrip('/')))
+    os.makedirs(root, exist_ok=True)
+    with open(f'{path}.lock', 'w') as lock:
+        # clones of concurrent jobs wait for one update of the mirror
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        stamp = f'{path}.fetched'
+        if os.path.exists(stamp) and \
+                time.time() - os.path.getmtime(stamp) < FETCH_INTERVAL:
+            return path
+        if not os.path.isdir(os.path.join(path, '.git')):
+            logger.info(f'Creating mirror of {url} in {path}')
+            git(logger, ['clone', '-b', branch, url, path], root)
+        else:
+            logger.info(f'Fetching mirror {path}')
+            git(logger, ['fetch', '--prune', 'origin'], path)
+            git(logger, ['checkout', '-q', '--detach', f'origin/{branch}'],
+                path)
+            git(logger, ['submodule', 'sync', '--recursive'], path)
+        git(logger, ['submodule', 'update', '--init', '--recursive'], path)
+        # the branches of all submodules, for PRs pointing elsewhere
+        git(logger, ['submodule', 'foreach', '--recursive',
+                     'git fetch --prune origin'], path)
+        with open(stamp, 'w'):
+            pass
+    return path
+
+
+def clone_options(job_obj, workdir):
+    ''' Return the options of `git clone` and of `git submodule update`
+        that take the objects they can from the mirror of the base repo
+        of the PR. Without a mirror, they are empty and the clone fetches
+        everything. '''
+    logger = logging.getLogger('MIRROR/CLONE_OPTIONS')
+    base = job_obj.preq_dict['preq'].base
+    try:
+        path = update_mirror(base.repo.html_url, mirror_root(workdir),
+                             base.ref)
+    except (OSError, subprocess.CalledProcessError) as e:
+        output = getattr(e, 'output', b'') or b''
+        logger.warning(f'Cannot update the mirror, cloning without it: {e} '
+                       f'{output.decode("utf8", "replace")}')
+        return '', ''
+    return f'--reference-if-able {path} ', f'{SUBMODULE_ALTERNATES} '
@@ -2,14 +2,20 @@
 import datetime
 import logging
 import os
+import sys
+from . import mirror
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+import rt_log
 
-def run(job_obj):
+
+def run(job_obj, full_suite=False):
     logger = logging.getLogger('RT/RUN')
     workdir = set_directories(job_obj)
     branch, pr_repo_loc, repo_dir_str = clone_pr_repo(job_obj, workdir)
-    run_regression_test(job_obj, pr_repo_loc)
-    post_process(job_obj, pr_repo_loc, repo_dir_str, branch)
+    run_regression_test(job_obj, pr_repo_loc, full_suite)
+    post_process(job_obj, pr_repo_loc, repo_dir_str, branch, full_suite)
 
 
 def set_directories(job_obj):
@@ -34,16 +40,26 @@ def set_directories(job_obj):
     return workdir
 
 
-def run_regression_test(job_obj, pr_repo_loc):
+def run_regression_test(job_obj, pr_repo_loc, full_suite=False):
     logger = logging.getLogger('RT/RUN_REGRESSION_TEST')
-    if job_obj.compiler == 'gnu':
-        rt_command = [[f'export RT_COMPILER="{job_obj.compiler}" && cd tests '
-                       '&& /bin/bash --login ./rt.sh -e -l rt_gnu.conf',
-                       pr_repo_loc]]
-    elif job_obj.compiler == 'intel':
-        rt_command = [[f'export RT_COMPILER="{job_obj.compiler}" && cd tests '
-                       '&& /bin/bash --login ./rt.sh -e', pr_repo_loc]]
-    job_obj.run_commands(logger, rt_command)
+    impact = ''
+    if not full_suite:
+        # only run the tests affected by the changes of the PR (rt.sh -i)
+        base = job_obj.preq_dict['preq'].base
+        fetch_command = [[f'git fetch {base.repo.html_url} {base.ref}',
+                          pr_repo_loc]]
+        job_obj.run_commands(logger, fetch_command)
+        impact = '-i FETCH_HEAD '
+    with job_obj.executor.rt_slot(job_obj.compiler) as limits:
+        if job_obj.compiler == 'gnu':
+            rt_command = [[f'{limits}export RT_COMPILER="{job_obj.compiler}" '
+                           f'&& cd tests && /bin/bash --login ./rt.sh -e '
+                           f'{impact}-l rt_gnu.conf', pr_repo_loc]]
+        elif job_obj.compiler == 'intel':
+            rt_command = [[f'{limits}export RT_COMPILER="{job_obj.compiler}" '
+                           f'&& cd tests && /bin/bash --login ./rt.sh -e '
+                           f'{impact}', pr_repo_loc]]
+        job_obj.run_commands(logger, rt_command)
 
 
 def remove_pr_data(job_obj, pr_repo_loc, repo_dir_str, rt_dir):
@@ -69,10 +85,11 @@ def clone_pr_repo(job_obj, workdir):
                    f'{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}'
     pr_repo_loc = f'{repo_dir_str}/{repo_name}'
     job_obj.comment_text_append(f'Repo location: {pr_repo_loc}')
+    clone_opts, submodule_opts = mirror.clone_options(job_obj, workdir)
     create_repo_commands = [
         [f'mkdir -p "{repo_dir_str}"', os.getcwd()],
-        [f'git clone -b {branch} {git_url}', repo_dir_str],
-        ['git submodule update --init --recursive',
+        [f'git clone {clone_opts}-b {branch} {git_url}', repo_dir_str],
+        [f'git {submodule_opts}submodule update --init --recursive',
          f'{repo_dir_str}/{repo_name}'],
         ['git config user.email "brian.curtis@noaa.gov"',
          f'{repo_dir_str}/{repo_name}'],
@@ -86,19 +103,29 @@ def clone_pr_repo(job_obj, workdir):
     return branch, pr_repo_loc, repo_dir_str
 
 
-def post_process(job_obj, pr_repo_loc, repo_dir_str, branch):
-    ''' This is the callback function associated with the "RT" command '''
+def post_process(job_obj, pr_repo_loc, repo_dir_str, branch, full_suite=False):
+    ''' This is the callback function associated with the "RT" command.
+        Without full_suite only the tests affected by the PR ran, and the
+        log is committed as a partial run; if no test is affected, nothing
+        ran and nothing is committed. '''
     logger = logging.getLogger('RT/MOVE_RT_LOGS')
     rt_log = f'tests/RegressionTests_{job_obj.machine}'\
              f'.{job_obj.compiler}.log'
     filepath = f'{pr_repo_loc}/{rt_log}'
     rt_dir, logfile_pass = process_logfile(job_obj, filepath)
-    if logfile_pass:
+    if logfile_pass is None:
+        job_obj.comment_text_append('No tests are affected by the changes '
+                                    'of this PR, no regression test ran')
+        job_obj.preq_dict['preq'].create_issue_comment(job_obj.comment_text)
+        remove_pr_data(job_obj, pr_repo_loc, repo_dir_str, rt_dir)
+    elif logfile_pass:
         if job_obj.preq_dict['preq'].maintainer_can_modify:
+            passed = 'RT JOBS PASSED' if full_suite else \
+                'RT JOBS PASSED (PARTIAL RUN, only the tests affected by the PR)'
             move_rt_commands = [
                 [f'git pull --ff-only origin {branch}', pr_repo_loc],
                 [f'git add {rt_log}', pr_repo_loc],
-                [f'git commit -m "RT JOBS PASSED: {job_obj.machine}'
+                [f'git commit -m "{passed}: {job_obj.machine}'
                  f'.{job_obj.compiler}. Log file uploaded.\n\n'
                   'on-behalf-of @ufs-community"',
                  pr_repo_loc],
@@ -116,26 +143,34 @@ def post_process(job_obj, pr_repo_loc, repo_dir_str, branch):
 
 
 def process_logfile(job_obj, logfile):
+    ''' Read the RegressionTests log in one pass; comment the failed tests
+        and the run directory to delete, and return it with whether the
+        regression test was successful, None if it ran no tests '''
     logger = logging.getLogger('RT/PROCESS_LOGFILE')
-    rt_dir = []
-    fail_string_list = ['Test', 'failed']
-    if os.path.exists(logfile):
-        with open(logfile) as f:
-            for line in f:
-                if all(x in line for x in fail_string_list):
-                # if 'FAIL' in line and 'Test' in line:
-                    job_obj.comment_text_append(f'{line.rstrip(chr(10))}')
-                elif 'working dir' in line and not rt_dir:
-                    rt_dir = os.path.split(line.split()[-1])[0]
-                    job_obj.comment_text_append(f'Please manually delete: '
-                                                f'{rt_dir}')
-                elif 'SUCCESSFUL' in line:
-                    return rt_dir, True
-        job_obj.job_failed(logger, f'{job_obj.preq_dict["action"]}')
-    else:
+    if not os.path.exists(logfile):
         logger.critical(f'Could not find {job_obj.machine}'
                         f'.{job_obj.compiler} '
                         f'{job_obj.preq_dict["action"]} log')
         print(f'Could not find {job_obj.machine}.{job_obj.compiler} '
               f'{job_obj.preq_dict["action"]} log')
         raise FileNotFoundError
+    log = rt_log.parse_log(logfile)
+    rt_dir = []
+    run_dir = next((t.run_dir for t in log.tests if t.run_dir), None)
+    if run_dir:
+        rt_dir = os.path.split(run_dir)[0]
+        logger.info(f'rt_dir is: {rt_dir}')
+        job_obj.comment_text_append(f'Please manually delete: {rt_dir}')
+    if log.summary is None:
+        logger.critical('Log file exists but is not complete')
+    elif not log.summary.ran:
+        logger.info('RT ran no tests')
+        return rt_dir, None
+    else:
+        for failed in log.summary.failed:
+            job_obj.comment_text_append(f'Test {failed} failed')
+        if log.summary.successful:
+            logger.info('RT Successful')
+            return rt_dir, True
+    job_obj.job_failed(logger, f'{job_obj.preq_dict["action"]}')
+    return rt_dir, False
@@ -12,7 +12,11 @@ import subprocess
 import re
 import os
 import logging
+import argparse
+import threading
 import importlib
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 
 
 class GHInterface:
@@ -75,6 +79,94 @@ def set_action_from_label(machine, actions, label):
     return label_compiler, action_match
 
 
+def machine_limits(machine, compiler):
+    ''' Return the maximum number of compile and run jobs rt.sh submits
+        on a machine at a time, as rt.sh sets them for ecFlow '''
+    max_builds, max_jobs = 10, 30
+    # licensing limits of the intel compilers
+    if compiler == 'intel' and machine == 'jet':
+        max_builds = 5
+    elif compiler == 'intel' and machine == 's4':
+        max_builds = 1
+    return max_builds, max_jobs
+
+
+class JobExecutor:
+    '''
+    This class runs Jobs concurrently within the budget of the machine.
+    Cloning, log processing and commenting run freely in each job; at most
+    max_concurrent jobs run rt.sh at a time, each with an equal share of
+    the compile and run jobs the machine allows.  Where a limit is too small
+    to share, the jobs it applies to run rt.sh one at a time.
+    ...
+
+    Attributes
+    ----------
+    machine: str
+        Name of the machine the jobs run on
+    max_concurrent: int
+        Number of regression tests that may run at the same time
+    '''
+
+    def __init__(self, machine, max_concurrent):
+        self.logger = logging.getLogger('JOBEXECUTOR')
+        self.machine = machine
+        self.max_concurrent = max(1, max_concurrent)
+        self.rt_slots = threading.BoundedSemaphore(self.max_concurrent)
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+
+    def lock(self, name):
+        ''' Return the lock of a resource jobs must not use concurrently '''
+        with self.locks_lock:
+            return self.locks.setdefault(name, threading.Lock())
+
+    @contextlib.contextmanager
+    def rt_slot(self, compiler):
+        ''' Wait for a slot to run rt.sh in, and yield the shell commands
+            setting its share of the compile and run job limits '''
+        max_builds, max_jobs = machine_limits(self.machine, compiler)
+        # A limit smaller than max_concurrent has no share of at least one
+        # job.  rt.sh then runs for one PR at a time, which gets the whole
+        # limit: one PR of the compiler for the compile jobs of its
+        # compiler, one PR of any compiler for the run jobs of the machine.
+        serial = []
+        if max_jobs < self.max_concurrent:
+            serial.append('rt.sh')
+        else:
+            max_jobs //= self.max_concurrent
+        if max_builds < self.max_concurrent:
+            serial.append(f'rt.sh {compiler}')
+        else:
+            max_builds //= self.max_concurrent
+        with contextlib.ExitStack() as stack:
+            for name in serial:
+                self.logger.info(f'Waiting for the lock of {name}')
+                stack.enter_context(self.lock(name))
+            self.logger.info('Waiting for a regression test slot')
+            stack.enter_context(self.rt_slots)
+            self.logger.info(f'Got a regression test slot: {max_builds} '
+                             f'compile jobs, {max_jobs} jobs')
+            yield (f'export RT_MAX_BUILDS={max_builds} '
+                   f'RT_MAX_JOBS={max_jobs} && ')
+
+    def run(self, jobs):
+        ''' Run all jobs and wait for them to finish '''
+        if not jobs:
+            return
+        for job in jobs:
+            job.executor = self
+        with ThreadPoolExecutor(max_workers=len(jobs),
+                                thread_name_prefix='job') as pool:
+            futures = [pool.submit(job.run) for job in jobs]
+            for job, future in zip(jobs, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    self.logger.critical(f'Job {job.preq_dict["label"]} '
+                                         f'FAILED. Exception:{e}')
+
+
 def get_preqs_with_actions(repos, machine, ghinterface_obj, actions):
     ''' Create list of dictionaries of a pull request
         and its machine label and action '''
@@ -127,6 +219,7 @@ class Job:
         self.compiler = compiler
         self.comment_text = ''
         self.failed_tests = []
+        self.executor = None
 
     def comment_text_append(self, newtext):
         self.comment_text += f'{newtext}\n'
@@ -244,11 +337,20 @@ def setup_env():
 
 def main():
 
+    parser = argparse.ArgumentParser(description='UFS regression testing '
+                                     'of labeled pull requests')
+    parser.add_argument('--max-concurrent', type=int, default=2,
+                        help='regression tests running at the same time '
+                             '(default 2)')
+    args = parser.parse_args()
+
     # handle logging
     log_filename = f'rt_auto_'\
                    f'{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}.log'
     logging.basicConfig(filename=log_filename, filemode='w',
-                        level=logging.INFO)
+                        level=logging.INFO,
+                        format='%(threadName)s:%(levelname)s:%(name)s:'
+                               '%(message)s')
     logger = logging.getLogger('MAIN')
     logger.info('Starting Script')
 
@@ -266,7 +368,7 @@ def main():
                 'labels and actions applicable to this machine.')
     jobs = get_preqs_with_actions(repos, machine,
                                        ghinterface_obj, actions)
-    [job.run() for job in jobs]
+    JobExecutor(machine, args.max_concurrent).run(jobs)
 
     logger.info('Script Finished')
 
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Content-hash manifest of a baseline directory.
+
+Every baseline directory (${NEW_BASELINE}/${CNTL_DIR}) created by
+``rt.sh -c`` carries a manifest with the size, inode number, modification
+time and a BLAKE2 hash of each of its files.  When a test is compared
+against that baseline only the new run output has to be read and hashed;
+the baseline file itself is read only if the hashes differ.  A baseline
+file with another inode or modification time than recorded, e.g. in a copy
+of the baseline tree or after a write to it, is hashed again to check its
+entry.
+
+    baseline_manifest.py update <baseline_dir> <file> [<file> ...]
+    baseline_manifest.py verify <baseline_dir>
+"""
+import os
+import sys
+import json
+import fcntl
+import hashlib
+import argparse
+
+MANIFEST = '.baseline_manifest.json'
+HASH_NAME = 'blake2b'
+READ_SIZE = 4 * 1024 * 1024
+
+
+def file_hash(path):
+    """Return the hex digest of a file's content."""
+    h = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(READ_SIZE)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_entry(path, digest=None):
+    """Return the manifest entry describing a file."""
+    st = os.stat(path)
+    return {
+        'size': st.st_size,
+        'ino': st.st_ino,
+        'mtime_ns': st.st_mtime_ns,
+        HASH_NAME: digest or file_hash(path),
+    }
+
+
+def load_manifest(baseline_dir):
+    """Return the manifest of a baseline directory, empty if there is none."""
+    try:
+        with open(os.path.join(baseline_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def update_manifest(baseline_dir, entries):
+    """Merge entries ({name: entry}) into the manifest of baseline_dir.
+
+    Several tests may write to the same baseline directory, so the update
+    is done under a lock of the directory itself, leaving no lock file in
+    the baseline, and the manifest replaced atomically.
+    """
+    path = os.path.join(baseline_dir, MANIFEST)
+    fd = os.open(baseline_dir, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        manifest = load_manifest(baseline_dir)
+        manifest.update(entries)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(path + '.tmp', path)
+    finally:
+        os.close(fd)
+    return manifest
+
+
+def lookup(manifest, name, baseline):
+    """Return the manifest entry of a baseline file, or None if it is stale.
+
+    The entry holds while the file has the recorded size, inode and
+    modification time; a file of that size with another inode or time is
+    hashed to check the entry.
+    """
+    entry = manifest.get(name)
+    if entry is None or HASH_NAME not in entry:
+        return None
+    try:
+        st = os.stat(baseline)
+        if st.st_size != entry['size']:
+            return None
+        unchanged = (st.st_ino == entry.get('ino') and
+                     st.st_mtime_ns == entry.get('mtime_ns'))
+        if not unchanged and file_hash(baseline) != entry[HASH_NAME]:
+            return None
+    except OSError:
+        return None
+    return entry
+
+
+def matches(entry, path):
+    """Return True if the file at path has the content recorded in entry."""
+    if os.path.getsize(path) != entry['size']:
+        return False
+    return file_hash(path) == entry[HASH_NAME]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+    p = sub.add_parser('update', help='add files to the manifest')
+    p.add_argument('baseline_dir')
+    p.add_argument('files', nargs='+')
+    p = sub.add_parser('verify', help='check files against the manifest')
+    p.add_argument('baseline_dir')
+    args = parser.parse_args()
+
+    if args.command == 'update':
+        entries = {}
+        for name in args.files:
+            path = os.path.join(args.baseline_dir, name)
+            if os.path.isfile(path):
+                entries[name] = file_entry(path)
+            else:
+                print(f'WARNING: {path} does not exist, not added to manifest')
+        update_manifest(args.baseline_dir, entries)
+
+    elif args.command == 'verify':
+        manifest = load_manifest(args.baseline_dir)
+        bad = 0
+        for name, entry in sorted(manifest.items()):
+            path = os.path.join(args.baseline_dir, name)
+            ok = os.path.isfile(path) and matches(entry, path)
+            print(f'{name} {"OK" if ok else "NOT OK"}')
+            bad += not ok
+        sys.exit(2 if bad else 0)
+
+
+if __name__ == '__main__':
+    main()
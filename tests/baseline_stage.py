@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""Stage files into a baseline directory without copying them if possible.
+
+Each file is reflinked (copy-on-write clone) into the baseline where the
+filesystem supports it, so its data is not written a second time.
+Otherwise it is copied, several files in parallel, and the copy is checked
+against the hash of the source.  The hashes are recorded in the baseline
+manifest (see baseline_manifest.py) as the files are staged.
+
+Hard links (--method link) share the inode of the source, so a later write
+to the source would change the baseline; they are only made on request,
+and the staged file is made read-only.
+
+    baseline_stage.py [--log <log>] <run_dir> <baseline_dir> <file> [...]
+    baseline_stage.py --tree [--move] <src_dir> <dest_dir>
+
+The first form stages the output files of a test, as check_results does
+when creating baselines; it exits with 2 if a file is missing.  --tree
+stages a whole directory tree, e.g. new baselines into the baseline store,
+and --move removes the sources once they are staged.
+"""
+import os
+import sys
+import fcntl
+import shutil
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import baseline_manifest
+
+FICLONE = 0x40049409            # _IOW(0x94, 9, int) from linux/fs.h
+METHODS = ('reflink', 'link', 'copy')
+DEFAULT_METHODS = ('reflink', 'copy')
+
+
+def reflink(src, dest):
+    with open(src, 'rb') as s, open(dest, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    shutil.copystat(src, dest)
+
+
+def verified_copy(src, dest):
+    """Copy src to dest and return the hash, checking the copy by it."""
+    h = hashlib.new(baseline_manifest.HASH_NAME)
+    with open(src, 'rb') as s, open(dest, 'wb') as d:
+        while True:
+            block = s.read(baseline_manifest.READ_SIZE)
+            if not block:
+                break
+            h.update(block)
+            d.write(block)
+    shutil.copystat(src, dest)
+    digest = h.hexdigest()
+    if baseline_manifest.file_hash(dest) != digest:
+        raise OSError(f'{dest} differs from {src} after copying')
+    return digest
+
+
+def read_only(path):
+    mode = os.stat(path).st_mode
+    os.chmod(path, mode & ~0o222)
+
+
+def stage(src, dest, methods=DEFAULT_METHODS, move=False):
+    """Stage src as dest with the first of methods that works.
+
+    Returns (method, hash of the content or None if it was not read).
+    With move, a file on the same filesystem is renamed, and the source is
+    removed once staged.
+    """
+    if os.path.lexists(dest):
+        os.remove(dest)
+    same_fs = os.stat(src).st_dev == os.stat(os.path.dirname(dest)).st_dev
+    if move and same_fs:
+        os.rename(src, dest)
+        return 'move', None
+    for method in methods:
+        digest = None
+        try:
+            if method == 'reflink':
+                reflink(src, dest)
+            elif method == 'link':
+                if not same_fs:
+                    continue
+                os.link(src, dest)
+                read_only(dest)
+            else:
+                digest = verified_copy(src, dest)
+        except OSError:
+            if method == 'copy':
+                raise
+            if os.path.lexists(dest):
+                os.remove(dest)
+            continue
+        if move:
+            os.remove(src)
+        return method, digest
+    raise OSError(f'cannot stage {src}')
+
+
+def stage_files(run_dir, baseline_dir, names, methods, jobs):
+    """Stage files of run_dir into baseline_dir.
+
+    Returns {name: (method, entry)}, with method None for a missing file
+    and the error message as entry if staging failed.
+    """
+    def one(name):
+        src = os.path.join(run_dir, name)
+        if not os.path.isfile(src):
+            return name, (None, None)
+        dest = os.path.join(baseline_dir, name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        try:
+            method, digest = stage(src, dest, methods)
+            return name, (method, baseline_manifest.file_entry(dest, digest))
+        except OSError as e:
+            return name, (None, str(e))
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return dict(pool.map(one, names))
+
+
+def stage_tree(src_dir, dest_dir, methods, jobs, move):
+    """Stage all files below src_dir into dest_dir; return {method: count}.
+
+    The manifests are staged with the files, and the entries of the files
+    get their new inode numbers, with the hash of the copy or, for linked
+    and moved files whose content is the same, the hash already recorded.
+    """
+    pairs = []
+    for root, dirs, files in os.walk(src_dir):
+        rel = os.path.relpath(root, src_dir)
+        os.makedirs(os.path.join(dest_dir, rel), exist_ok=True)
+        for name in files:
+            if name.startswith(baseline_manifest.MANIFEST):
+                continue
+            pairs.append((os.path.join(root, name),
+                          os.path.normpath(os.path.join(dest_dir, rel, name))))
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(lambda p: stage(p[0], p[1], methods, move),
+                                pairs))
+
+    # manifests last, so that their entries stay valid
+    for root, dirs, files in os.walk(src_dir):
+        if baseline_manifest.MANIFEST in files:
+            rel = os.path.relpath(root, src_dir)
+            src = os.path.join(root, baseline_manifest.MANIFEST)
+            dest = os.path.join(dest_dir, rel, baseline_manifest.MANIFEST)
+            shutil.copy2(src, dest)
+            if move:
+                os.remove(src)
+    manifests = {}
+    by_dir = {}
+    for (src, dest), (method, digest) in zip(pairs, results):
+        directory, name = os.path.split(dest)
+        if not os.path.exists(os.path.join(directory, baseline_manifest.MANIFEST)):
+            continue
+        if directory not in manifests:
+            manifests[directory] = baseline_manifest.load_manifest(directory)
+        recorded = manifests[directory].get(name, {})
+        digest = digest or recorded.get(baseline_manifest.HASH_NAME)
+        if digest is not None:
+            by_dir.setdefault(directory, {})[name] = \
+                baseline_manifest.file_entry(dest, digest)
+    for directory, entries in by_dir.items():
+        baseline_manifest.update_manifest(directory, entries)
+
+    if move:
+        for root, dirs, files in os.walk(src_dir, topdown=False):
+            for d in dirs:
+                try:
+                    os.rmdir(os.path.join(root, d))
+                except OSError:
+                    pass
+
+    counts = {}
+    for method, _ in results:
+        counts[method] = counts.get(method, 0) + 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--log', help='append the report to this file')
+    parser.add_argument('--jobs', type=int, default=4,
+                        help='files copied in parallel (default 4)')
+    parser.add_argument('--method', choices=METHODS,
+                        help='only stage with this method or copy')
+    parser.add_argument('--tree', action='store_true',
+                        help='stage all files below the source directory')
+    parser.add_argument('--move', action='store_true',
+                        help='with --tree, remove the staged sources')
+    parser.add_argument('src_dir')
+    parser.add_argument('dest_dir')
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args()
+
+    methods = (args.method, 'copy') if args.method else DEFAULT_METHODS
+
+    if args.tree:
+        try:
+            counts = stage_tree(args.src_dir, args.dest_dir, methods,
+                                args.jobs, args.move)
+        except OSError as e:
+            sys.exit(f'ERROR: {e}')
+        print(f'Staged {args.src_dir} into {args.dest_dir}: ' + ', '.join(
+            f'{n} {m}' for m, n in sorted(counts.items())))
+        return
+
+    results = stage_files(args.src_dir, args.dest_dir, args.files, methods,
+                          args.jobs)
+    lines = []
+    missing = 0
+    for name in args.files:
+        method, entry = results[name]
+        if method is None:
+            missing += 1
+            reason = entry or f'Missing  {os.path.join(args.src_dir, name)}'
+            lines.append(f' Moving {name} .........NOT OK. {reason}')
+        else:
+            lines.append(f' Moving {name} .........OK ({method})')
+    report = '\n'.join(lines) + '\n'
+    sys.stdout.write(report)
+    if args.log:
+        with open(args.log, 'a') as f:
+            f.write(report)
+
+    entries = {name: entry for name, (method, entry) in results.items()
+               if method is not None}
+    if entries:
+        baseline_manifest.update_manifest(args.dest_dir, entries)
+    sys.exit(2 if missing else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""Cache of ufs-weather-model executables, keyed by what they are built from.
+
+The key of a build is a hash of the machine, the build options (MAKE_OPT),
+the modulefile compile.sh loads for them and the module versions it
+resolves to (--modules-env, from build_modules_env in rt_utils.sh), and the
+state of the source
+subtrees the build uses: the top level build system and driver, and the
+components cmake/configure_apps.cmake switches on for its -DAPP.  The state
+of a subtree is its committed content plus any local changes, in the
+superproject and in every submodule checked out below it.
+
+    build_cache.py key --machine <MACHINE_ID> --make-opt="<MAKE_OPT>"
+                       [--modules-env="<loaded modules>"]
+    build_cache.py fetch (--key <key> | --machine <MACHINE_ID> --make-opt=..)
+                         --exe <fv3.exe> --modules <modules.fv3>
+    build_cache.py store --key <key> --exe <fv3.exe> --modules <modules.fv3>
+    build_cache.py list
+    build_cache.py evict [--quota <GB>]
+
+fetch exits with 1 if the build is not in the cache; on a hit, it reflinks
+or copies the build, so that writing to exe or modules never changes the
+cached files, which are read-only.  run_compile.sh fetches and stores the
+builds, outside of the compile job.  The cache is a local directory,
+RT_BUILD_CACHE (default ~/.cache/rt_build_cache); the least recently used
+builds are removed once it grows beyond RT_BUILD_CACHE_QUOTA GB (default
+50).
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import argparse
+import subprocess
+
+import rt_plan
+import rt_impact
+import baseline_stage
+
+PATHRT = os.path.dirname(os.path.abspath(__file__))
+PATHTR = os.path.dirname(PATHRT)
+
+KEY_VERSION = 2
+CACHE_DIR = os.getenv('RT_BUILD_CACHE') or os.path.join(
+    os.getenv('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'rt_build_cache')
+DEFAULT_QUOTA_GB = float(os.getenv('RT_BUILD_CACHE_QUOTA') or 50)
+
+# top level paths that never go into an executable
+EXCLUDED = ('doc', 'tests', '.github', '.readthedocs.yaml', '.dockerignore')
+
+# scripts in tests/ that decide how the model is built
+BUILD_SCRIPTS = ('compile.sh', 'module-setup.sh')
+
+
+def git(directory, *args):
+    return subprocess.run(['git', '-C', directory] + list(args), check=True,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL).stdout
+
+
+def source_state(h, directory, paths=()):
+    """Add the committed and local state of paths in a git checkout to h.
+
+    Submodules below the paths are added recursively with their checked out
+    commit and local changes.
+    """
+    h.update(git(directory, 'ls-tree', 'HEAD', '--', *paths))
+    for line in git(directory, 'ls-files', '-s', '-z', '--', *paths).split(b'\0'):
+        if not line.startswith(b'160000 '):
+            continue
+        sub = line.split(b'\t', 1)[1].decode()
+        h.update(sub.encode())
+        if os.path.exists(os.path.join(directory, sub, '.git')):
+            source_state(h, os.path.join(directory, sub))
+        else:
+            h.update(b'not checked out')
+    h.update(git(directory, 'diff', 'HEAD', '--binary',
+                 '--ignore-submodules=all', '--', *paths))
+    untracked = git(directory, 'ls-files', '--others', '--exclude-standard',
+                    '-z', '--', *paths)
+    for name in sorted(untracked.split(b'\0')):
+        path = os.path.join(directory, name.decode())
+        if name and os.path.isfile(path):
+            h.update(name)
+            with open(path, 'rb') as f:
+                h.update(hashlib.sha1(f.read()).digest())
+
+
+def source_paths(make_opt):
+    """Return the top level paths of the source tree a build uses."""
+    app, _ = rt_impact.compile_flags(make_opt)
+    components = rt_impact.app_components(app)
+    unused = {path for c, path in rt_impact.COMPONENT_PATHS.items()
+              if c not in components}
+    paths = []
+    for name in git(PATHTR, 'ls-tree', '--name-only', '-z', 'HEAD').split(b'\0'):
+        name = name.decode()
+        if not name or name in EXCLUDED or name in unused or name.endswith('.md'):
+            continue
+        paths.append(name)
+    return paths
+
+
+def modulefile(machine_id, make_opt):
+    """Return the path of the modulefile compile.sh loads for a build."""
+    path = os.path.join(PATHTR, 'modulefiles', f'ufs_{machine_id}')
+    if '-DDEBUG=ON' in make_opt and os.path.exists(path + '_debug'):
+        path += '_debug'
+    return path
+
+
+def build_key(machine_id, make_opt, modules_env=''):
+    """Return the cache key of a build."""
+    h = hashlib.sha1()
+    options = rt_plan.canonical_options(make_opt)
+    h.update(f'{KEY_VERSION}\0{machine_id}\0{options}\0{modules_env}\0'.encode())
+    try:
+        with open(modulefile(machine_id, make_opt), 'rb') as f:
+            h.update(f.read())
+    except OSError:
+        h.update(b'no modulefile')
+    for name in BUILD_SCRIPTS:
+        with open(os.path.join(PATHRT, name), 'rb') as f:
+            h.update(f.read())
+    source_state(h, PATHTR, source_paths(make_opt))
+    return h.hexdigest()
+
+
+class Cache:
+    """A directory with one subdirectory of files per build key."""
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock_file = open(os.path.join(directory, '.lock'), 'a')
+
+    def lock(self, exclusive):
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def unlock(self):
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def entries(self):
+        """Return [(last use, size in bytes, key)] of the cached builds."""
+        entries = []
+        for key in os.listdir(self.directory):
+            path = os.path.join(self.directory, key)
+            if key.startswith('.') or '.tmp.' in key or not os.path.isdir(path):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f))
+                       for f in os.listdir(path))
+            entries.append((os.stat(path).st_mtime, size, key))
+        return entries
+
+    def fetch(self, key, exe, modules):
+        """Reflink or copy a cached build to exe and modules; False on a miss."""
+        path = os.path.join(self.directory, key)
+        self.lock(exclusive=False)
+        try:
+            if not os.path.isdir(path):
+                return False
+            for name, dest, mode in (('fv3.exe', exe, 0o755),
+                                     ('modules.fv3', modules, 0o644)):
+                if os.path.lexists(dest):
+                    os.remove(dest)
+                # never a hard link, which a later cp to dest writes through
+                try:
+                    baseline_stage.reflink(os.path.join(path, name), dest)
+                except OSError:
+                    if os.path.lexists(dest):
+                        os.remove(dest)
+                    shutil.copy2(os.path.join(path, name), dest)
+                os.chmod(dest, mode)
+            os.utime(path)
+            return True
+        finally:
+            self.unlock()
+
+    def store(self, key, exe, modules, meta):
+        """Add a build to the cache."""
+        path = os.path.join(self.directory, key)
+        tmp = f'{path}.tmp.{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        shutil.copy2(exe, os.path.join(tmp, 'fv3.exe'))
+        shutil.copy2(modules, os.path.join(tmp, 'modules.fv3'))
+        with open(os.path.join(tmp, 'build.json'), 'w') as f:
+            json.dump(meta, f, indent=1)
+        for name, mode in (('fv3.exe', 0o555), ('modules.fv3', 0o444),
+                           ('build.json', 0o444)):
+            os.chmod(os.path.join(tmp, name), mode)
+        self.lock(exclusive=True)
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(tmp)
+            else:
+                os.rename(tmp, path)
+            os.utime(path)
+        finally:
+            self.unlock()
+
+    def evict(self, quota_bytes):
+        """Remove the least recently used builds until the cache fits quota.
+
+        Returns the keys removed.
+        """
+        removed = []
+        self.lock(exclusive=True)
+        try:
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, key in entries:
+                if total <= quota_bytes:
+                    break
+                shutil.rmtree(os.path.join(self.directory, key))
+                total -= size
+                removed.append(key)
+        finally:
+            self.unlock()
+        return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--cache', default=CACHE_DIR,
+                        help=f'cache directory (default {CACHE_DIR})')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+    p = sub.add_parser('key', help='cache key of a build')
+    p.add_argument('--machine', required=True)
+    p.add_argument('--make-opt', required=True)
+    p.add_argument('--modules-env', default='',
+                   help='loaded modules with their versions')
+    p = sub.add_parser('fetch', help='get a build from the cache')
+    p.add_argument('--key')
+    p.add_argument('--machine')
+    p.add_argument('--make-opt')
+    p.add_argument('--exe', required=True)
+    p.add_argument('--modules', required=True)
+    p = sub.add_parser('store', help='add a build to the cache')
+    p.add_argument('--key', required=True)
+    p.add_argument('--exe', required=True)
+    p.add_argument('--modules', required=True)
+    p.add_argument('--machine', default='')
+    p.add_argument('--make-opt', default='')
+    p.add_argument('--quota', type=float, default=DEFAULT_QUOTA_GB,
+                   help=f'GB (default {DEFAULT_QUOTA_GB:g})')
+    sub.add_parser('list', help='cached builds, most recently used first')
+    p = sub.add_parser('evict', help='remove the least recently used builds')
+    p.add_argument('--quota', type=float, default=DEFAULT_QUOTA_GB,
+                   help=f'GB (default {DEFAULT_QUOTA_GB:g})')
+    args = parser.parse_args()
+
+    if args.command == 'key':
+        print(build_key(args.machine, args.make_opt, args.modules_env))
+        return
+
+    cache = Cache(args.cache)
+
+    if args.command == 'fetch':
+        key = args.key
+        if key is None:
+            if args.machine is None or args.make_opt is None:
+                parser.error('fetch needs --key or --machine and --make-opt')
+            key = build_key(args.machine, args.make_opt)
+        if not cache.fetch(key, args.exe, args.modules):
+            sys.exit(1)
+        print(f'Using build {key} from {cache.directory}')
+
+    elif args.command == 'store':
+        cache.store(args.key, args.exe, args.modules,
+                    {'machine': args.machine, 'make_opt': args.make_opt,
+                     'created': time.strftime('%Y-%m-%d %H:%M:%S')})
+        for key in cache.evict(args.quota * 1e9):
+            print(f'Removed build {key} from {cache.directory}')
+
+    elif args.command == 'list':
+        for used, size, key in sorted(cache.entries(), reverse=True):
+            try:
+                with open(os.path.join(cache.directory, key, 'build.json')) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                meta = {}
+            print(f'{key}  {time.strftime("%Y-%m-%d %H:%M", time.localtime(used))}'
+                  f'  {size / 1e6:8.1f} MB  {meta.get("machine", "")}'
+                  f'  {meta.get("make_opt", "")}')
+
+    elif args.command == 'evict':
+        for key in cache.evict(args.quota * 1e9):
+            print(f'Removed build {key} from {cache.directory}')
+
+
+if __name__ == '__main__':
+    main()
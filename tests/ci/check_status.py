@@ -3,122 +3,187 @@ import os
 import re
 import sys
 import json
-import time
+import asyncio
+from urllib.error import HTTPError, URLError
 from urllib.request import urlopen, Request
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
+# seconds between polls: MIN_INTERVAL after a response changed, growing by
+# BACKOFF per unchanged poll up to the interval of the mode
+MIN_INTERVAL = 10
+BACKOFF = 1.5
 
-def check_build(request):
+
+class Client:
+    """GitHub API client making conditional requests.
+
+    Each response is kept with its ETag and the next request for the same
+    URL sends it in If-None-Match; GitHub answers 304 Not Modified, which
+    does not count against the rate limit, if nothing changed.
+    """
+
+    def __init__(self, token=None, workers=8):
+        self.headers = {}
+        if token:
+            self.headers['Authorization'] = 'token %s' % token
+        self.cache = {}
+        self.rate_remaining = None
+        self.rate_reset = None
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def _rate_limit(self, headers):
+        if headers.get('X-RateLimit-Remaining') is not None:
+            self.rate_remaining = int(headers['X-RateLimit-Remaining'])
+            self.rate_reset = int(headers.get('X-RateLimit-Reset', 0))
+
+    def fetch(self, url):
+        """Return (data, changed) of an API URL."""
+        headers = dict(self.headers)
+        cached = self.cache.get(url)
+        if cached:
+            headers['If-None-Match'] = cached[0]
+        try:
+            with urlopen(Request(url, headers=headers), timeout=60) as response:
+                self._rate_limit(response.headers)
+                data = json.loads(response.read().decode())
+                etag = response.headers.get('ETag')
+        except HTTPError as e:
+            if e.code == 304 and cached:
+                self._rate_limit(e.headers)
+                return cached[1], False
+            raise
+        if etag:
+            self.cache[url] = (etag, data)
+        return data, True
+
+    async def fetch_all(self, urls):
+        """Fetch urls concurrently; return ({url: data}, any changed)."""
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *[loop.run_in_executor(self.pool, self.fetch, url) for url in urls])
+        return ({url: data for url, (data, _) in zip(urls, results)},
+                any(changed for _, changed in results))
+
+    def rate_limit_wait(self, requests):
+        """Seconds to wait before making requests without exceeding the limit."""
+        if self.rate_remaining is None or self.rate_remaining >= requests:
+            return 0
+        return max(0, self.rate_reset - datetime.now().timestamp()) + 1
+
+
+async def poll(client, urls, check, max_interval):
+    """Fetch urls() until check({url: data}) returns something but None.
+
+    Polls come every MIN_INTERVAL seconds while responses change and back
+    off to max_interval while they do not.  Network and server errors are
+    retried.
+    """
+    interval = MIN_INTERVAL
+    while True:
+        current = urls()
+        try:
+            data, changed = await client.fetch_all(current)
+        except (URLError, OSError, ValueError) as e:
+            if isinstance(e, HTTPError) and e.code < 500 and e.code != 403:
+                raise
+            print("retrying after error:", e, file=sys.stderr)
+            data, changed = None, False
+        if data is not None:
+            result = check(data)
+            if result is not None:
+                return result
+        interval = MIN_INTERVAL if changed else min(interval * BACKOFF,
+                                                    max_interval)
+        await asyncio.sleep(max(interval,
+                                client.rate_limit_wait(len(urls()))))
+
+
+def check_build(client, url):
     """Check if all build jobs are completed successfully.
     API endpoint: api.github.com/repos/{owner}/{repo}/actions/runs/{run_id}/jobs
     """
-    all_completed = False
-    while not all_completed:
-        time.sleep(20)
-        response = urlopen(request)
-        data = json.loads(response.read().decode())["jobs"]
+    def check(responses):
+        data = responses[url]["jobs"]
         ids = [x["id"] for x in data if re.search("Build", x["name"])]
-        if len(ids) == 1 and next(re.search("matrix", x["name"]) for x in data if x["id"] in ids):
-            break
         if len(ids) == 0:
-            continue
-        all_completed = all(
-            [x["status"] == "completed" for x in data if x["id"] in ids])
-    return all([x["conclusion"] == "success" for x in data if x["id"] in ids])
+            return None
+        matrix = len(ids) == 1 and next(re.search("matrix", x["name"]) for x in data if x["id"] in ids)
+        if not matrix and not all([x["status"] == "completed" for x in data if x["id"] in ids]):
+            return None
+        return all([x["conclusion"] == "success" for x in data if x["id"] in ids])
+    return poll(client, lambda: [url], check, 20)
 
 
-def check_completion(request, job_name):
+def check_completion(client, url, job_name):
     """Check if a job is completed successfully.
     API endpoint: api.github.com/repos/{owner}/{repo}/actions/runs/{run_id}/jobs
     """
-    completed = False
-    while not completed:
-        time.sleep(60)
-        response = urlopen(request)
-        data = json.loads(response.read().decode())["jobs"]
-        cid = next((x["id"]
-                   for x in data if x["name"] == job_name), "not found")
-        if cid == "not found":
-            continue
-        completed = next(
-            x["status"] == "completed" for x in data if x["id"] == cid)
-    return next(x["conclusion"] == "success" for x in data if x["id"] == cid)
-
-
-def check_test(request):
+    def check(responses):
+        data = responses[url]["jobs"]
+        job = next((x for x in data if x["name"] == job_name), None)
+        if job is None or job["status"] != "completed":
+            return None
+        return job["conclusion"] == "success"
+    return poll(client, lambda: [url], check, 60)
+
+
+def check_test(client, url):
     """Wait for a workflow run to be completed.
     API endpoint: api.github.com/repos/{owner}/{repo}/actions/runs/{run_id}
     """
-    completed = False
-    while not completed:
-        time.sleep(20)
-        response = urlopen(request)
-        data = json.loads(response.read().decode())
-        completed = (data["status"] == "completed")
+    def check(responses):
+        return True if responses[url]["status"] == "completed" else None
+    return poll(client, lambda: [url], check, 20)
 
 
-def check_ec2(url, request, myid):
+async def check_ec2(client, url, myid):
     """Wait for all previous workflow runs to finish using ec2 instances.
     API endpoint: api.github.com/repos/{owner}/{repo}/actions/runs
     """
-    response = urlopen(request)
-    data = json.loads(response.read().decode())["workflow_runs"]
+    data, _ = await client.fetch_all([url])
+    data = data[url]["workflow_runs"]
     tformat = "%Y-%m-%dT%H:%M:%SZ"
     mytime = datetime.strptime(next(x["created_at"]
                                for x in data if x["id"] == myid), tformat)
 
-    workflows = {}
-    in_progress = []
+    in_progress = {}
     for x in data:
         oldtime = datetime.strptime(x["created_at"], tformat)
         dt = mytime - oldtime
         if x["name"] == "Helpers" and dt >= timedelta() and x["id"] != myid:
-            request = Request(url+"/"+str(x["id"])+"/jobs")
-            token = os.environ["AUTH"]
-            request.add_header("Authorization", "token %s" % token)
-            workflows[x["id"]] = request
-            in_progress.append(x["id"])
+            in_progress[url+"/"+str(x["id"])+"/jobs"] = x["id"]
 
-    while True:
-        print("in_progress: ", in_progress)
-        if len(in_progress) == 0:
-            break
-        time.sleep(20)
+    def check(responses):
         done = []
-        for cid in reversed(in_progress):
-            data = json.loads(urlopen(workflows[cid]).read().decode())["jobs"]
-            start_status = next(
-                (x["status"] for x in data if x["name"] == "Start runners"), "not found")
-            stop_status = next(
-                (x["status"] for x in data if x["name"] == "Stop runners"), "not found")
-            if start_status == "not found" or stop_status == "not found":
-                break
-            if start_status == "completed" and stop_status == "completed":
-                done.append(cid)
+        for jobs_url, data in responses.items():
+            status = {x["name"]: x["status"] for x in data["jobs"]}
+            if (status.get("Start runners") == "completed"
+                    and status.get("Stop runners") == "completed"):
+                done.append(in_progress.pop(jobs_url))
         print("done: ", done)
-        if len(done) != 0:
-            [workflows.pop(k) for k in done]
-            [in_progress.remove(k) for k in done]
+        print("in_progress: ", list(in_progress.values()))
+        return True if len(in_progress) == 0 else None
+
+    print("in_progress: ", list(in_progress.values()))
+    if in_progress:
+        await poll(client, lambda: list(in_progress), check, 20)
 
 
 def main():
     url = sys.stdin.read()
-    request = Request(url)
-    try:
-        token = os.environ["AUTH"]
-        request.add_header("Authorization", "token %s" % token)
-    except KeyError:
-        pass
+    client = Client(os.environ.get("AUTH"))
 
     if sys.argv[1] == "build":
-        print("success") if check_build(request) else print("failure")
+        success = asyncio.run(check_build(client, url))
+        print("success") if success else print("failure")
     elif sys.argv[1] == "completion":
-        print("success") if check_completion(
-            request, sys.argv[2]) else print("failure")
+        success = asyncio.run(check_completion(client, url, sys.argv[2]))
+        print("success") if success else print("failure")
     elif sys.argv[1] == "ec2":
-        check_ec2(url, request, int(sys.argv[2]))
+        asyncio.run(check_ec2(client, url, int(sys.argv[2])))
     elif sys.argv[1] == "test":
-        check_test(request)
+        asyncio.run(check_test(client, url))
 
 
 if __name__ == "__main__":
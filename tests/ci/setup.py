@@ -1,11 +1,34 @@
 #!/usr/bin/env python3
+import os
+import sys
 import json
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rt_plan
+
+
+def build_options(plan, test, build_case):
+    """Return the canonical build options opnReqTest uses for a case."""
+    compile_entry = plan.compile_for(test)
+    if compile_entry is None:
+        return None
+    opts = compile_entry.make_opt.split()
+    if build_case == 'bit':
+        if '-D32BIT=ON' in opts:
+            opts.remove('-D32BIT=ON')
+        else:
+            opts.append('-D32BIT=ON')
+    elif build_case == 'dbg':
+        opts.append('-DDEBUG=ON')
+    return rt_plan.canonical_options(' '.join(opts))
+
 
 def main():
     with open('ci.test', 'r') as setup_file:
         input_str = setup_file.read().splitlines()
 
+    plan = rt_plan.load_plan(os.path.join('..', 'rt.conf'), use_cache=False)
+
     tests = []
     cases = []
     for i, e in enumerate(input_str):
@@ -16,6 +39,26 @@ def main():
 
     bj = {'bld_set': [], 'include': []}
     tj = {'test_set': [], 'include': []}
+    # (build case, options) -> bld_set building them; the executable in an
+    # artifact is named after the build case, so only builds of the same
+    # case are shared between tests
+    builds = {}
+    shared = {}
+
+    def add_build(test, bld_set):
+        if bld_set in bj['bld_set']:
+            return bld_set
+        if bld_set in shared:
+            return shared[bld_set]
+        key = (bld_set[-3:], build_options(plan, test, bld_set[-3:]))
+        if key[1] is not None and key in builds:
+            shared[bld_set] = builds[key]
+            return builds[key]
+        builds[key] = bld_set
+        bj['bld_set'].append(bld_set)
+        bj['include'].append(
+            {'bld_set': bld_set, 'name': test, 'case': bld_set[-3:]})
+        return bld_set
 
     for i in range(len(tests)):
         for j in range(len(cases[i])):
@@ -23,23 +66,17 @@ def main():
             case = cases[i][j]
 
             if any(e in case for e in ['thr', 'mpi', 'dcp', 'rst']):
-                std = test+'_std'
-                if not bj['bld_set'] or not any(std == e for e in bj['bld_set']):
-                    bj['bld_set'].append(std)
-                    bj['include'].append(
-                        {'bld_set': std, 'name': test, 'case': std[-3:]})
-                aj = {'test_set': case, 'name': test,
-                      'case': case[-3:], 'artifact': std}
+                artifact = add_build(test, test+'_std')
             else:
-                bj['bld_set'].append(case)
-                bj['include'].append(
-                    {'bld_set': case, 'name': test, 'case': case[-3:]})
-                aj = {'test_set': case, 'name': test,
-                      'case': case[-3:], 'artifact': case}
+                artifact = add_build(test, case)
+            aj = {'test_set': case, 'name': test,
+                  'case': case[-3:], 'artifact': artifact}
 
             tj['test_set'].append(case)
             tj['include'].append(aj)
 
+    print(f'{len(shared)} builds saved by sharing identical executables',
+          file=sys.stderr)
     print(json.dumps(bj), "|", json.dumps(tj))
 
 
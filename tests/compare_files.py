@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""Compare the output files of a regression test against its baseline.
+
+All files are compared concurrently on a process pool, and the results are
+reported in LIST_FILES order with the same " Comparing <file> .....OK" lines
+check_results has always written, both to stdout and to the test log.
+
+If the baseline directory has a manifest (see baseline_manifest.py), the run
+output is hashed and checked against it, and the baseline file is only read
+when the hashes differ.
+
+With --report (or --stats, to keep them in the --state file only), netCDF
+files that differ bytewise are compared by value with
+compare_ncfile.compare_stats(), which reads every variable in full, and the
+per variable statistics of all files are written to a JSON report.
+Otherwise the value comparison stops at the first differing hyperslab.
+--tolerances passes per variable tolerances to the comparison, which then
+stops at the first point exceeding them unless statistics are wanted.
+Tolerances apply on every machine: with them, netCDF files that differ
+bytewise are compared by value even without --alt-check.
+
+With --watch, the netCDF files are compared while the model is still
+running: each one is compared once its size and modification time have not
+changed for --settle seconds, and the result is appended to the --state
+file.  Other files, which the model may still append to, are left to the
+comparison after the job.  The watch ends when the file given to --watch
+exists, i.e. the job finished, or when the process --ppid (run_test.sh) is
+gone.  A netCDF file whose values differ, and that did not change while it
+was compared, is listed in the --mismatch file, for submit_and_wait to kill
+the job; a bytewise difference alone is not enough, as the file may still
+be open in the model.  A later run with the same --state only compares the
+files that were not compared yet or changed since, and reports all files as
+usual.
+
+Exit status: 0 if all files match, 2 if any file is missing or differs,
+1 if a comparison could not be carried out, even if others differ.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import baseline_manifest
+
+CMP_BUFSIZE = 1024 * 1024
+
+OK = 'OK'
+NOT_OK = 'NOT OK'
+MISSING = 'MISSING'
+SKIP = 'SKIP'
+ERROR = 'ERROR'
+
+
+def files_differ(file1, file2):
+    """Byte by byte comparison, the equivalent of cmp(1)."""
+    if os.path.getsize(file1) != os.path.getsize(file2):
+        return True
+    with open(file1, 'rb') as f1, open(file2, 'rb') as f2:
+        while True:
+            b1 = f1.read(CMP_BUFSIZE)
+            b2 = f2.read(CMP_BUFSIZE)
+            if b1 != b2:
+                return True
+            if not b1:
+                return False
+
+
+def compare_file(args):
+    """Compare one file.
+
+    Returns (status, text appended to its log line, statistics report or None).
+    """
+    name, baseline_dir, run_dir, options = args
+    baseline = os.path.join(baseline_dir, name)
+    output = os.path.join(run_dir, name)
+
+    if not os.path.isfile(output):
+        return MISSING, '.......MISSING file', None
+    if not os.path.isfile(baseline):
+        return MISSING, '.......MISSING baseline', None
+    if options['compiler'] == 'gnu' and name == 'RESTART/fv_core.res.nc':
+        # Although identical in ncdiff, RESTART/fv_core.res.nc differs in byte 469, line 3,
+        # for the fv3_control_32bit test between each run (without changing the source code)
+        # for GNU compilers - skip comparison.
+        return SKIP, '.......SKIP for gnu compilers', None
+
+    try:
+        entry = baseline_manifest.lookup(options['manifest'], name, baseline)
+        if entry is not None:
+            differ = not baseline_manifest.matches(entry, output)
+        else:
+            differ = files_differ(baseline, output)
+    except OSError:
+        return ERROR, '....CMP ERROR', None
+
+    text = ''
+    report = None
+    if differ and (options['alt_check'] or options['tolerances']) \
+            and name.endswith('.nc'):
+        text = '.......ALT CHECK..'
+        try:
+            import compare_ncfile
+            budget = compare_ncfile.DEFAULT_CHUNK_MB * 1024 * 1024
+            if options['stats'] or options['tolerances']:
+                report = compare_ncfile.compare_stats(
+                    baseline, output, budget, options['tolerances'],
+                    first_failure=not options['stats'])
+                differ = report['failed']
+                if not options['stats']:
+                    report = None
+            else:
+                differ = compare_ncfile.compare(baseline, output,
+                                                budget) is not None
+        except Exception:
+            return ERROR, text + '....ERROR', None
+
+    if differ:
+        return NOT_OK, text + '....NOT OK', report
+    return OK, text + '....OK', report
+
+
+def watch_compare(args):
+    """compare_file for watch.
+
+    Returns (status, text, report, whether the values of a netCDF file
+    differ); the values are compared even without --alt-check.
+    """
+    name, baseline_dir, run_dir, options = args
+    status, text, report = compare_file(args)
+    if status != NOT_OK:
+        return status, text, report, False
+    if report is not None:
+        return status, text, report, report['failed']
+    try:
+        import compare_ncfile
+        budget = compare_ncfile.DEFAULT_CHUNK_MB * 1024 * 1024
+        values = compare_ncfile.compare_stats(os.path.join(baseline_dir, name),
+                                              os.path.join(run_dir, name),
+                                              budget, options['tolerances'])
+    except Exception:
+        return status, text, report, False
+    return status, text, report, values['failed']
+
+
+def file_key(path):
+    """Return (size, mtime in ns) of a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def load_state(path):
+    """Return {name: (key, status, text, report)} of the files compared by
+    a watch; compare_files compares the key with the file to tell if it
+    changed since."""
+    state = {}
+    if not path or not os.path.exists(path):
+        return state
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue    # a line the watch was writing when it ended
+            state[entry['name']] = (tuple(entry['key']), entry['status'],
+                                    entry['text'], entry['report'])
+    return state
+
+
+def save_result(f, name, key, status, text, report):
+    f.write(json.dumps({'name': name, 'key': key, 'status': status,
+                        'text': text, 'report': report}) + '\n')
+    f.flush()
+
+
+def make_options(baseline_dir, compiler, alt_check, stats, tolerances):
+    return {
+        'compiler': compiler,
+        'alt_check': alt_check,
+        'stats': stats,
+        'tolerances': tolerances,
+        'manifest': baseline_manifest.load_manifest(baseline_dir),
+    }
+
+
+def compare_files(files, baseline_dir, run_dir, compiler='intel',
+                  alt_check=False, workers=None, stats=False, tolerances=None,
+                  state=None):
+    """Yield (name, status, text, report) for each file, in the order given.
+
+    Files with an entry in state (see load_state) that have not changed
+    since are not compared again.
+    """
+    options = make_options(baseline_dir, compiler, alt_check, stats, tolerances)
+    state = state or {}
+    done = {name: state[name][1:] for name in files if name in state and
+            state[name][0] == file_key(os.path.join(run_dir, name))}
+    todo = [name for name in files if name not in done]
+    tasks = [(name, baseline_dir, run_dir, options) for name in todo]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = dict(zip(todo, pool.map(compare_file, tasks)))
+        for name in files:
+            yield (name,) + (done[name] if name in done else results[name])
+
+
+def parent_alive(ppid):
+    if ppid is None:
+        return True
+    try:
+        os.kill(ppid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def watch(files, baseline_dir, run_dir, done_file, state_file,
+          mismatch_file=None, compiler='intel', alt_check=False, workers=None,
+          stats=False, tolerances=None, interval=10, settle=30, ppid=None):
+    """Compare the netCDF files as they are completed, until done_file
+    exists.
+
+    Returns the number of files compared.
+    """
+    options = make_options(baseline_dir, compiler, alt_check, stats, tolerances)
+    files = [name for name in files if name.endswith('.nc')]
+    state = load_state(state_file)
+    seen = {}           # name -> (key, time the key was first seen)
+    running = {}        # name -> (key, future)
+    compared = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            open(state_file, 'a') as out:
+        while True:
+            finished = os.path.exists(done_file) or not parent_alive(ppid)
+            now = time.time()
+            for name in files:
+                if name in running or name in state:
+                    continue
+                key = file_key(os.path.join(run_dir, name))
+                if key is None:
+                    continue
+                if seen.get(name, (None,))[0] != key:
+                    seen[name] = (key, now)
+                elif now - seen[name][1] >= settle and not finished:
+                    future = pool.submit(watch_compare,
+                                         (name, baseline_dir, run_dir, options))
+                    running[name] = (key, future)
+
+            for name, (key, future) in list(running.items()):
+                if not future.done() and not finished:
+                    continue
+                status, text, report, values_differ = future.result()
+                del running[name]
+                # a file that changed while it was compared is compared again
+                if status == ERROR or file_key(os.path.join(run_dir, name)) != key:
+                    seen.pop(name, None)
+                    continue
+                state[name] = (key, status, text, report)
+                save_result(out, name, key, status, text, report)
+                compared += 1
+                print(f' Comparing {name} .....{text}', flush=True)
+                if values_differ and mismatch_file:
+                    with open(mismatch_file, 'a') as f:
+                        f.write(f'{name}\n')
+
+            if finished and not running:
+                return compared
+            time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare regression test output files against a baseline')
+    parser.add_argument('baseline_dir')
+    parser.add_argument('run_dir')
+    # a test with an empty LIST_FILES has nothing to compare, and passes
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--log', help='append results to this log file')
+    parser.add_argument('--compiler', default='intel')
+    parser.add_argument('--alt-check', action='store_true',
+                        help='compare differing netCDF files by value')
+    parser.add_argument('--report',
+                        help='write per variable statistics of differing '
+                             'netCDF files as JSON to this file')
+    parser.add_argument('--stats', action='store_true',
+                        help='compute the statistics of --report, without '
+                             'writing a report (for --watch)')
+    parser.add_argument('--tolerances',
+                        help='JSON file with per variable atol/rtol')
+    parser.add_argument('-j', '--workers', type=int,
+                        default=int(os.getenv('COMPARE_WORKERS', 4)),
+                        help='number of concurrent comparisons')
+    parser.add_argument('--state',
+                        help='results of the files compared by --watch')
+    parser.add_argument('--watch', metavar='DONE_FILE',
+                        help='compare the files as the model writes them, '
+                             'until this file exists')
+    parser.add_argument('--mismatch',
+                        help='with --watch, list the differing files here')
+    parser.add_argument('--settle', type=int, default=30,
+                        help='with --watch, seconds a file must not change '
+                             'before it is compared (default 30)')
+    parser.add_argument('--interval', type=int, default=10,
+                        help='with --watch, seconds between looks at the '
+                             'run directory (default 10)')
+    parser.add_argument('--ppid', type=int,
+                        help='with --watch, end when this process is gone')
+    args = parser.parse_args()
+
+    tolerances = None
+    if args.tolerances:
+        with open(args.tolerances) as f:
+            tolerances = json.load(f)
+    stats = bool(args.report or args.stats)
+
+    if args.watch:
+        if not args.state:
+            parser.error('--watch needs --state')
+        compared = watch(args.files, args.baseline_dir, args.run_dir,
+                         args.watch, args.state, args.mismatch, args.compiler,
+                         args.alt_check, args.workers, stats, tolerances,
+                         args.interval, args.settle, args.ppid)
+        print(f'{compared} files compared while the model was running')
+        return
+
+    log = open(args.log, 'a') if args.log else None
+    reports = {}
+    exit_status = 0
+    try:
+        for name, status, text, report in compare_files(
+                args.files, args.baseline_dir, args.run_dir,
+                args.compiler, args.alt_check, args.workers,
+                stats, tolerances, load_state(args.state)):
+            line = f' Comparing {name} .....{text}'
+            print(line, flush=True)
+            if log:
+                log.write(line + '\n')
+                log.flush()
+            if report:
+                reports[name] = report
+                import compare_ncfile
+                for detail in compare_ncfile.format_report(report):
+                    print(f'   {detail}')
+            # the other files are still compared and logged
+            if status == ERROR:
+                exit_status = 1
+            elif status in (NOT_OK, MISSING) and exit_status == 0:
+                exit_status = 2
+    finally:
+        if log:
+            log.close()
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(reports, f, indent=2)
+    sys.exit(exit_status)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,267 @@
 #!/usr/bin/env python
-import sys 
+"""Compare two netCDF files variable by variable.
+
+Variables are read in hyperslabs aligned to the storage chunking of the
+file, so peak memory is bounded by the chunk budget (--chunk-mb) and not by
+the size of the largest variable.  By default the comparison stops at the
+first differing hyperslab.
+
+With --stats (or --report) every variable is read once and its maximum
+absolute and relative error, RMS difference and number of differing points
+are reported.  Variables only fail if a point differs by more than
+atol + rtol * |baseline|; tolerances default to zero and may be given per
+variable in a JSON file:  {"<varname>": {"atol": 1e-6, "rtol": 0.0}, ...}
+As in the default comparison, points masked (_FillValue) in either file
+are skipped and a NaN in either file is a difference.  With
+--strict-missing, a point masked or NaN in one file only is a difference
+and one masked or NaN in both files is equal.
+
+Exit status: 0 if the files are identical (or within tolerance), 2 if they
+differ, 1 on error.
+"""
+import sys
+import json
+import argparse
+import itertools
 import numpy as np
 from netCDF4 import Dataset
 
-with Dataset(sys.argv[1]) as nc1, Dataset(sys.argv[2]) as nc2:
-  # Check if the list of variables are the same
-  if nc1.variables.keys()!=nc2.variables.keys():
-    print("Variables are different")
-    sys.exit(2)
-
-  for varname in nc1.variables.keys():
-    # First check if each variable has the same dimension
-    if np.shape(nc1[varname][:])!=np.shape(nc2[varname][:]):
-      print(varname,"dimension is different")
-      sys.exit(2)
-    # If dimension is the same, compare data
-    else:
-      diff = nc2[varname][:]-nc1[varname][:]
-
-      if (np.abs(diff)).max() != 0:
-        print(varname,"is different")
+DEFAULT_CHUNK_MB = 64
+
+
+def hyperslabs(shape, chunking, itemsize, budget):
+    """Yield tuples of slices that cover an array of the given shape.
+
+    Slabs are taken along the outermost axis whose storage chunk still fits
+    in the budget (bytes), in whole multiples of that chunk.  Axes outside
+    of it are walked one index at a time.
+    """
+    ndim = len(shape)
+    if ndim == 0:
+        yield Ellipsis
+        return
+    if any(n == 0 for n in shape):
+        return
+    if not isinstance(chunking, (list, tuple)):
+        # contiguous storage
+        chunking = [1] * ndim
+
+    inner = [itemsize * int(np.prod(shape[k+1:], dtype=np.int64))
+             for k in range(ndim)]
+    axis = next((k for k in range(ndim)
+                 if inner[k] * chunking[k] <= budget), ndim - 1)
+    step = max(chunking[axis],
+               budget // inner[axis] // chunking[axis] * chunking[axis])
+
+    outer = [range(n) for n in shape[:axis]]
+    tail = [slice(None)] * (ndim - axis - 1)
+    for index in itertools.product(*outer):
+        for start in range(0, shape[axis], step):
+            yield tuple(index) + (slice(start, start + step),) + tuple(tail)
+
+
+def variables_differ(var1, var2, budget):
+    """Return True at the first hyperslab where var1 and var2 differ."""
+    itemsize = getattr(var1.dtype, 'itemsize', 8)
+    for slab in hyperslabs(var1.shape, var1.chunking(), itemsize, budget):
+        diff = var2[slab] - var1[slab]
+        if np.size(diff) and (np.abs(diff)).max() != 0:
+            return True
+    return False
+
+
+class VariableStats:
+    """Difference statistics of one variable, accumulated over hyperslabs."""
+
+    def __init__(self, atol=0.0, rtol=0.0, strict_missing=False):
+        self.atol = atol
+        self.rtol = rtol
+        self.strict_missing = strict_missing
+        self.npoints = 0
+        self.ncommon = 0        # points valid in both files, for the rms
+        self.ndiff = 0
+        self.nexceed = 0
+        self.max_abs = 0.0
+        self.max_rel = 0.0
+        self.sum_sq = 0.0
+
+    def update(self, base, test):
+        base = np.ma.asarray(base, dtype=np.float64)
+        test = np.ma.asarray(test, dtype=np.float64)
+        masked_base = np.ma.getmaskarray(base)
+        masked_test = np.ma.getmaskarray(test)
+        nan_base = np.isnan(base.data)
+        nan_test = np.isnan(test.data)
+        if self.strict_missing:
+            # a point missing in one file only counts as an infinite difference
+            missing_base = masked_base | nan_base
+            missing_test = masked_test | nan_test
+            onesided = missing_base != missing_test
+            both = ~(missing_base | missing_test)
+        else:
+            # masked points are skipped, NaN differs from everything
+            valid = ~(masked_base | masked_test)
+            onesided = valid & (nan_base | nan_test)
+            both = valid & ~(nan_base | nan_test)
+
+        b = base.data[both]
+        absdiff = np.abs(test.data[both] - b)
+        self.npoints += int(both.sum()) + int(onesided.sum())
+        self.ncommon += int(both.sum())
+        self.ndiff += int(np.count_nonzero(absdiff)) + int(onesided.sum())
+        self.nexceed += int(np.count_nonzero(
+            absdiff > self.atol + self.rtol * np.abs(b))) + int(onesided.sum())
+        if absdiff.size:
+            self.max_abs = max(self.max_abs, float(absdiff.max()))
+            nonzero = b != 0
+            if nonzero.any():
+                self.max_rel = max(self.max_rel, float(
+                    (absdiff[nonzero] / np.abs(b[nonzero])).max()))
+            self.sum_sq += float(np.square(absdiff).sum())
+
+    @property
+    def failed(self):
+        return self.nexceed > 0
+
+    @property
+    def rms(self):
+        return (self.sum_sq / self.ncommon) ** 0.5 if self.ncommon else 0.0
+
+    def as_dict(self):
+        return {
+            'max_abs': self.max_abs,
+            'max_rel': self.max_rel,
+            'rms': self.rms,
+            'ndiff': self.ndiff,
+            'npoints': self.npoints,
+            'fraction': self.ndiff / self.npoints if self.npoints else 0.0,
+            'atol': self.atol,
+            'rtol': self.rtol,
+            'failed': self.failed,
+        }
+
+
+def compare_stats(file1, file2, budget, tolerances=None, atol=0.0, rtol=0.0,
+                  strict_missing=False, first_failure=False):
+    """Return a report with difference statistics for every variable.
+
+    With first_failure, the report ends at the first hyperslab that fails,
+    for a pass/fail answer within tolerances without reading the rest.
+    """
+    tolerances = tolerances or {}
+    report = {'file1': file1, 'file2': file2, 'failed': False,
+              'error': None, 'variables': {}}
+    with Dataset(file1) as nc1, Dataset(file2) as nc2:
+        if nc1.variables.keys() != nc2.variables.keys():
+            report['failed'] = True
+            report['error'] = 'Variables are different'
+            return report
+
+        for varname in nc1.variables.keys():
+            var1, var2 = nc1[varname], nc2[varname]
+            if var1.shape != var2.shape:
+                report['failed'] = True
+                report['variables'][varname] = {
+                    'error': 'dimension is different', 'failed': True}
+                continue
+            tol = tolerances.get(varname, {})
+            stats = VariableStats(tol.get('atol', atol), tol.get('rtol', rtol),
+                                  strict_missing)
+            itemsize = getattr(var1.dtype, 'itemsize', 8)
+            for slab in hyperslabs(var1.shape, var1.chunking(), itemsize,
+                                   budget):
+                stats.update(var1[slab], var2[slab])
+                if first_failure and stats.failed:
+                    break
+            report['variables'][varname] = stats.as_dict()
+            report['failed'] = report['failed'] or stats.failed
+            if first_failure and report['failed']:
+                break
+    return report
+
+
+def format_report(report):
+    """Return human readable lines for the differing variables of a report."""
+    lines = []
+    if report['error']:
+        lines.append(report['error'])
+    for varname, stats in report['variables'].items():
+        if 'error' in stats:
+            lines.append(f'{varname} {stats["error"]}')
+        elif stats['ndiff']:
+            lines.append(
+                f'{varname} max_abs={stats["max_abs"]:.6g} '
+                f'max_rel={stats["max_rel"]:.6g} rms={stats["rms"]:.6g} '
+                f'ndiff={stats["ndiff"]} ({100 * stats["fraction"]:.4f}%)'
+                f'{" exceeds tolerance" if stats["failed"] else ""}')
+    return lines
+
+
+def compare(file1, file2, budget):
+    """Return the name of the first differing variable and the reason, or None."""
+    with Dataset(file1) as nc1, Dataset(file2) as nc2:
+        # Check if the list of variables are the same
+        if nc1.variables.keys() != nc2.variables.keys():
+            return None, "Variables are different"
+
+        for varname in nc1.variables.keys():
+            # First check if each variable has the same dimension
+            if nc1[varname].shape != nc2[varname].shape:
+                return varname, "dimension is different"
+            # If dimension is the same, compare data
+            if variables_differ(nc1[varname], nc2[varname], budget):
+                return varname, "is different"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two netCDF files')
+    parser.add_argument('file1')
+    parser.add_argument('file2')
+    parser.add_argument('--chunk-mb', type=float, default=DEFAULT_CHUNK_MB,
+                        help='memory budget per variable read, in MB '
+                             f'(default {DEFAULT_CHUNK_MB})')
+    parser.add_argument('--stats', action='store_true',
+                        help='report difference statistics for all variables')
+    parser.add_argument('--report', help='write the statistics as JSON '
+                                         'to this file (implies --stats)')
+    parser.add_argument('--atol', type=float, default=0.0,
+                        help='absolute tolerance (default 0)')
+    parser.add_argument('--rtol', type=float, default=0.0,
+                        help='relative tolerance (default 0)')
+    parser.add_argument('--tolerances',
+                        help='JSON file with per variable atol/rtol')
+    parser.add_argument('--strict-missing', action='store_true',
+                        help='with --stats, a point masked or NaN in one file '
+                             'only differs, in both files it is equal')
+    args = parser.parse_args()
+    budget = int(args.chunk_mb * 1024 * 1024)
+
+    if args.stats or args.report:
+        tolerances = None
+        if args.tolerances:
+            with open(args.tolerances) as f:
+                tolerances = json.load(f)
+        report = compare_stats(args.file1, args.file2, budget, tolerances,
+                               args.atol, args.rtol, args.strict_missing)
+        for line in format_report(report):
+            print(line)
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(report, f, indent=2)
+        if report['failed']:
+            sys.exit(2)
+        return
+
+    result = compare(args.file1, args.file2, budget)
+    if result is not None:
+        varname, reason = result
+        if varname is None:
+            print(reason)
+        else:
+            print(varname, reason)
         sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
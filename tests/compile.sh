@@ -133,6 +133,8 @@ export CMAKE_FLAGS
 
 bash -x ${PATHTR}/build.sh
 
+# never write through a file left by an earlier build
+rm -f ${PATHTR}/tests/${BUILD_NAME}.exe ${PATHTR}/tests/modules.${BUILD_NAME}
 mv ${BUILD_DIR}/ufs_model ${PATHTR}/tests/${BUILD_NAME}.exe
 if [[ "${MAKE_OPT}" == "-DDEBUG=ON" ]]; then
   cp ${PATHTR}/modulefiles/ufs_${MACHINE_ID}_debug ${PATHTR}/tests/modules.${BUILD_NAME}
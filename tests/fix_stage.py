@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Stage shared fix files into run directories from a content-addressed cache.
+
+The files matching a set of patterns in a source directory are copied once
+per rt.sh run into <cache>/objects/<hash>, each copy checked against the
+hash of its source, and made read-only.  The first test needing a set
+creates it; every other test finds its list of files in <cache>/sets and
+only hard links (or, across filesystems, symlinks) the objects into its run
+directory.
+
+    fix_stage.py [--no-clobber] <cache> <run_dir> <src_dir> <pattern> [...]
+
+Patterns are globs relative to src_dir, and files are placed in run_dir
+under their base name, as "cp <src_dir>/<pattern> <run_dir>" would.  With
+--no-clobber, files already in run_dir are kept.
+"""
+import os
+import sys
+import glob
+import json
+import fcntl
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import baseline_stage
+
+
+def set_key(src_dir, patterns):
+    text = '\0'.join([os.path.abspath(src_dir)] + list(patterns))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def materialize(cache, src_dir, patterns, jobs=4):
+    """Return {name: [hash, size]} of an input set, copying it into the
+    cache if no earlier test did."""
+    sets = os.path.join(cache, 'sets')
+    objects = os.path.join(cache, 'objects')
+    os.makedirs(sets, exist_ok=True)
+    os.makedirs(objects, exist_ok=True)
+    path = os.path.join(sets, set_key(src_dir, patterns) + '.json')
+
+    with open(path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        sources = {}
+        for pattern in patterns:
+            matched = [p for p in sorted(glob.glob(os.path.join(src_dir, pattern)))
+                       if os.path.isfile(p)]
+            if not matched:
+                raise OSError(f'no files match {os.path.join(src_dir, pattern)}')
+            for p in matched:
+                sources[os.path.basename(p)] = p
+
+        def add(item):
+            name, src = item
+            tmp = os.path.join(objects, f'.{name}.{os.getpid()}')
+            digest = baseline_stage.verified_copy(src, tmp)
+            obj = os.path.join(objects, digest)
+            if os.path.exists(obj):
+                os.remove(tmp)
+            else:
+                os.chmod(tmp, 0o444)
+                os.rename(tmp, obj)
+            return name, [digest, os.path.getsize(obj)]
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            files = dict(pool.map(add, sorted(sources.items())))
+        with open(path + '.tmp', 'w') as f:
+            json.dump(files, f, indent=1, sort_keys=True)
+        os.replace(path + '.tmp', path)
+        return files
+
+
+def populate(cache, run_dir, files, no_clobber=False):
+    """Link the files of an input set into run_dir; return the number linked."""
+    linked = 0
+    for name, (digest, size) in sorted(files.items()):
+        obj = os.path.join(cache, 'objects', digest)
+        if os.path.getsize(obj) != size:
+            raise OSError(f'{obj} ({name}) has changed in the fix file cache')
+        dest = os.path.join(run_dir, name)
+        if os.path.lexists(dest):
+            if no_clobber:
+                continue
+            os.remove(dest)
+        try:
+            os.link(obj, dest)
+        except OSError:
+            os.symlink(os.path.abspath(obj), dest)
+        linked += 1
+    return linked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--no-clobber', action='store_true',
+                        help='keep files that are already in run_dir')
+    parser.add_argument('cache')
+    parser.add_argument('run_dir')
+    parser.add_argument('src_dir')
+    parser.add_argument('patterns', nargs='+')
+    args = parser.parse_args()
+
+    try:
+        files = materialize(args.cache, args.src_dir, args.patterns)
+        linked = populate(args.cache, args.run_dir, files, args.no_clobber)
+    except OSError as e:
+        sys.exit(f'ERROR: {e}')
+    print(f'Linked {linked} of {len(files)} files from {args.src_dir} '
+          f'({" ".join(args.patterns)})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Shared job status monitor for submit_and_wait.
+
+Instead of every test polling the batch system for its own job, rt.sh starts
+one monitor.  Tests register their job ids in <dir>/jobs/, the monitor asks
+the scheduler about all registered jobs with a single qstat/squeue/bjobs
+call per interval and publishes each job's status line in <dir>/status/<id>,
+exactly as the scheduler command prints it for that job.  A status file that
+exists but is empty means the scheduler no longer lists the job.  If the
+scheduler command fails or times out, the status files are left as they
+are and the query is retried after RETRY_INTERVAL seconds; the heartbeat is
+only written after successful queries, so that submit_and_wait asks the
+scheduler itself if they keep failing.
+
+    job_monitor.py <dir> --scheduler slurm [--interval 60] [--ppid PID]
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+
+MAX_IDS_PER_QUERY = 100
+QUERY_TIMEOUT = 120
+RETRY_INTERVAL = 10
+
+# what the schedulers print for jobs they no longer know, with a non-zero
+# exit status that does not mean the query failed
+GONE_RE = re.compile(r'Unknown Job Id|Job has finished|Invalid job id|'
+                     r'Job <\S+> is not found')
+
+
+def query_command(scheduler, ids, command=None):
+    """Return the scheduler command listing the given job ids."""
+    if scheduler == 'pbs':
+        return [command or 'qstat'] + ids
+    if scheduler == 'slurm':
+        return [command or 'squeue', '-u', os.getenv('USER', ''),
+                '-j', ','.join(ids)]
+    if scheduler == 'lsf':
+        return [command or 'bjobs'] + ids
+    raise ValueError(f'Unknown SCHEDULER {scheduler}')
+
+
+def query_failed(proc):
+    """Return True unless a non-zero exit only reports jobs that are gone."""
+    if proc.returncode == 0:
+        return False
+    errors = [line for line in proc.stderr.splitlines() if line.strip()]
+    return not errors or not all(GONE_RE.search(line) for line in errors)
+
+
+def query(scheduler, ids, command=None):
+    """Return {job id: status line} for the jobs the scheduler lists, or
+    None if the scheduler command failed."""
+    lines = {}
+    for i in range(0, len(ids), MAX_IDS_PER_QUERY):
+        try:
+            proc = subprocess.run(
+                query_command(scheduler, ids[i:i+MAX_IDS_PER_QUERY], command),
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True, timeout=QUERY_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f'{time.strftime("%H:%M:%S")} query failed: {e}', flush=True)
+            return None
+        if query_failed(proc):
+            print(f'{time.strftime("%H:%M:%S")} query failed with exit status '
+                  f'{proc.returncode}: {proc.stderr.strip()}', flush=True)
+            return None
+        for line in proc.stdout.splitlines():
+            fields = line.split()
+            if not fields:
+                continue
+            # pbs job ids are <number>.<server>
+            jobid = fields[0].split('.')[0]
+            if jobid in ids:
+                lines[jobid] = line
+    return lines
+
+
+def publish(status_dir, jobid, line):
+    """Atomically replace the status file of a job."""
+    path = os.path.join(status_dir, jobid)
+    with open(path + '.tmp', 'w') as f:
+        f.write(line + '\n' if line else '')
+    os.replace(path + '.tmp', path)
+
+
+def parent_alive(ppid):
+    if ppid is None:
+        return True
+    try:
+        os.kill(ppid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def update(monitor_dir, scheduler, command=None):
+    """Query the registered jobs once and publish their status.
+
+    Returns False, leaving the status files as they are, if the query failed.
+    """
+    jobs_dir = os.path.join(monitor_dir, 'jobs')
+    status_dir = os.path.join(monitor_dir, 'status')
+    os.makedirs(jobs_dir, exist_ok=True)
+    os.makedirs(status_dir, exist_ok=True)
+
+    ids = sorted(os.listdir(jobs_dir))
+    lines = query(scheduler, ids, command) if ids else {}
+    if lines is None:
+        return False
+    for jobid in ids:
+        publish(status_dir, jobid, lines.get(jobid, ''))
+    with open(os.path.join(monitor_dir, 'heartbeat'), 'w') as f:
+        f.write(f'{int(time.time())} {len(ids)}\n')
+    return True
+
+
+def run(monitor_dir, scheduler, interval, ppid=None, command=None):
+    while parent_alive(ppid):
+        if update(monitor_dir, scheduler, command):
+            time.sleep(interval)
+        else:
+            time.sleep(min(interval, RETRY_INTERVAL))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Batch job status queries for all running tests')
+    parser.add_argument('monitor_dir')
+    parser.add_argument('--scheduler', required=True,
+                        choices=['pbs', 'slurm', 'lsf'])
+    parser.add_argument('--interval', type=float, default=60,
+                        help='seconds between scheduler queries (default 60)')
+    parser.add_argument('--ppid', type=int,
+                        help='exit when this process (rt.sh) is gone')
+    parser.add_argument('--command',
+                        help='use this command instead of qstat/squeue/bjobs')
+    args = parser.parse_args()
+
+    try:
+        run(args.monitor_dir, args.scheduler, args.interval, args.ppid,
+            args.command)
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""Run job cards as local processes, for machines without a batch system.
+
+rt.sh starts one daemon per run (SCHEDULER=local).  submit_and_wait hands
+it job cards, each with the number of cores it uses (TASKS x THRD of a
+test, BUILD_JOBS of a compile).  The daemon starts the queued jobs, oldest
+first, until the oldest one left does not fit on the free cores, so that
+smaller jobs submitted later cannot hold back a large one; a job needing
+more cores than the machine has runs alone.  A job runs in the directory
+of its card, with its output in out and err there, as with the batch
+systems.
+
+With rt.sh -a, the daemon runs inside a slurm allocation and the job cards
+it starts launch their srun steps in it.  When the daemon exits, at the end
+of the allocation, its running jobs fail, its queued ones are cancelled and
+it leaves a file "stopped"; jobs submitted after that are cancelled at once.
+Running jobs get SIGTERM, and SIGKILL if they have not ended KILL_TIMEOUT
+seconds later.  With --end, the time the allocation ends, a queued job whose
+--minutes would take it past the end is cancelled instead of started; the
+daemon writes the end to the file "end".
+
+    local_scheduler.py start <dir> [--cores N] [--ppid PID] [--end EPOCH]
+    local_scheduler.py submit <dir> --cores N [--name NAME] [--minutes M]
+                              <job_card>
+    local_scheduler.py status <dir> <id> [...]
+    local_scheduler.py cancel <dir> <id> [...]
+
+submit prints "Submitted local job <id>".  status prints one line per job
+in the columns of squeue, "<id> local <name> <user> <state> <exit code>",
+the state being Q (queued), R (running), C (completed), F (failed) or CA
+(cancelled); a job the daemon does not know is not listed.
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import signal
+import argparse
+import subprocess
+
+POLL_INTERVAL = 1
+KILL_TIMEOUT = 30
+
+
+def parent_alive(ppid):
+    if ppid is None:
+        return True
+    try:
+        os.kill(ppid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def write_atomic(path, text):
+    with open(path + '.tmp', 'w') as f:
+        f.write(text)
+    os.replace(path + '.tmp', path)
+
+
+def status_line(jobid, job, state, code=''):
+    return (f'{jobid} local {job["name"]} {os.getenv("USER", "-")} '
+            f'{state} {code}'.rstrip() + '\n')
+
+
+def submit(directory, card, cores, name=None, minutes=0):
+    """Queue a job card; return its id."""
+    os.makedirs(os.path.join(directory, 'queue'), exist_ok=True)
+    os.makedirs(os.path.join(directory, 'status'), exist_ok=True)
+    with open(os.path.join(directory, 'next_id'), 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        jobid = int(f.read().strip() or 1)
+        f.seek(0)
+        f.truncate()
+        f.write(f'{jobid + 1}\n')
+    jobid = str(jobid)
+    card = os.path.abspath(card)
+    job = {'card': card, 'cwd': os.path.dirname(card), 'cores': max(1, cores),
+           'name': name or os.path.basename(os.path.dirname(card)),
+           'minutes': minutes, 'submitted': time.time()}
+    # the status first, so that the job is listed as soon as it is queued
+    write_atomic(os.path.join(directory, 'status', jobid),
+                 status_line(jobid, job, 'Q'))
+    write_atomic(os.path.join(directory, 'queue', jobid + '.json'),
+                 json.dumps(job))
+    # checked after queueing, the daemon may have exited in between
+    if os.path.exists(os.path.join(directory, 'stopped')):
+        os.remove(os.path.join(directory, 'queue', jobid + '.json'))
+        write_atomic(os.path.join(directory, 'status', jobid),
+                     status_line(jobid, job, 'CA'))
+    return jobid
+
+
+def status(directory, ids):
+    """Return the status lines of the jobs the daemon knows."""
+    lines = []
+    for jobid in ids:
+        try:
+            with open(os.path.join(directory, 'status', jobid)) as f:
+                lines.append(f.read())
+        except OSError:
+            pass
+    return lines
+
+
+def cancel(directory, ids):
+    os.makedirs(os.path.join(directory, 'cancel'), exist_ok=True)
+    for jobid in ids:
+        open(os.path.join(directory, 'cancel', jobid), 'w').close()
+
+
+class Daemon:
+    """Starts queued jobs on free cores and records their states."""
+
+    def __init__(self, directory, cores, end=None):
+        self.directory = directory
+        self.cores = cores
+        self.end = end
+        self.running = {}          # id -> (job, Popen)
+        self.cancelled = set()     # ids of running jobs that were killed
+        for sub in ('queue', 'status', 'cancel'):
+            os.makedirs(os.path.join(directory, sub), exist_ok=True)
+
+    def free_cores(self):
+        return self.cores - sum(min(job['cores'], self.cores)
+                                for job, _ in self.running.values())
+
+    def set_state(self, jobid, job, state, code=''):
+        write_atomic(os.path.join(self.directory, 'status', jobid),
+                     status_line(jobid, job, state, code))
+        print(f'{time.strftime("%H:%M:%S")} job {jobid} {job["name"]} '
+              f'({job["cores"]} cores) {state} {code}', flush=True)
+
+    def queued(self):
+        queue_dir = os.path.join(self.directory, 'queue')
+        jobs = []
+        for name in os.listdir(queue_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(queue_dir, name)) as f:
+                    jobs.append((name[:-5], json.load(f)))
+            except (OSError, ValueError):
+                continue
+        return sorted(jobs, key=lambda j: (j[1]['submitted'], int(j[0])))
+
+    def start(self, jobid, job):
+        with open(os.path.join(job['cwd'], 'out'), 'w') as out, \
+                open(os.path.join(job['cwd'], 'err'), 'w') as err:
+            proc = subprocess.Popen(['/bin/bash', job['card']], cwd=job['cwd'],
+                                    stdout=out, stderr=err,
+                                    start_new_session=True)
+        os.remove(os.path.join(self.directory, 'queue', jobid + '.json'))
+        self.running[jobid] = (job, proc)
+        self.set_state(jobid, job, 'R')
+
+    def step(self):
+        cancel_dir = os.path.join(self.directory, 'cancel')
+        cancelled = set(os.listdir(cancel_dir))
+        for jobid in cancelled:
+            os.remove(os.path.join(cancel_dir, jobid))
+
+        for jobid, (job, proc) in list(self.running.items()):
+            if jobid in cancelled:
+                self.kill(proc)
+                self.cancelled.add(jobid)
+            code = proc.poll()
+            if code is None:
+                continue
+            del self.running[jobid]
+            if jobid in self.cancelled:
+                self.cancelled.remove(jobid)
+                state = 'CA'
+            else:
+                state = 'C' if code == 0 else 'F'
+            self.set_state(jobid, job, state, code)
+
+        queued = []
+        for jobid, job in self.queued():
+            # a job that would not end before the allocation never starts
+            too_long = self.end is not None and \
+                time.time() + job.get('minutes', 0) * 60 > self.end
+            if jobid in cancelled or too_long:
+                os.remove(os.path.join(self.directory, 'queue', jobid + '.json'))
+                self.set_state(jobid, job, 'CA')
+            else:
+                queued.append((jobid, job))
+        for jobid, job in queued:
+            # a job larger than the machine runs alone
+            if min(job['cores'], self.cores) > self.free_cores():
+                break
+            self.start(jobid, job)
+
+    @staticmethod
+    def kill(proc, sig=signal.SIGTERM):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def run(self, ppid=None):
+        if self.end is not None:
+            write_atomic(os.path.join(self.directory, 'end'), f'{self.end}\n')
+        try:
+            while parent_alive(ppid):
+                self.step()
+                write_atomic(os.path.join(self.directory, 'heartbeat'),
+                             f'{int(time.time())} {len(self.running)}\n')
+                time.sleep(POLL_INTERVAL)
+        finally:
+            open(os.path.join(self.directory, 'stopped'), 'w').close()
+            for job, proc in self.running.values():
+                self.kill(proc)
+            deadline = time.time() + KILL_TIMEOUT
+            for jobid, (job, proc) in self.running.items():
+                try:
+                    code = proc.wait(max(0, deadline - time.time()))
+                except subprocess.TimeoutExpired:
+                    self.kill(proc, signal.SIGKILL)
+                    code = proc.wait()
+                self.set_state(jobid, job, 'F', code)
+            for jobid, job in self.queued():
+                os.remove(os.path.join(self.directory, 'queue', jobid + '.json'))
+                self.set_state(jobid, job, 'CA')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+    p = sub.add_parser('start', help='run the daemon')
+    p.add_argument('dir')
+    p.add_argument('--cores', type=int, default=os.cpu_count(),
+                   help=f'cores to run jobs on (default {os.cpu_count()})')
+    p.add_argument('--ppid', type=int,
+                   help='exit when this process (rt.sh) is gone')
+    p.add_argument('--end', type=int,
+                   help='time the allocation ends, seconds since the epoch')
+    p = sub.add_parser('submit', help='queue a job card')
+    p.add_argument('dir')
+    p.add_argument('--cores', type=int, required=True)
+    p.add_argument('--name')
+    p.add_argument('--minutes', type=int, default=0,
+                   help='wall clock limit of the job')
+    p.add_argument('card')
+    for command in ('status', 'cancel'):
+        p = sub.add_parser(command, help=f'{command} of jobs')
+        p.add_argument('dir')
+        p.add_argument('ids', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'start':
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            Daemon(args.dir, args.cores, args.end).run(args.ppid)
+        except KeyboardInterrupt:
+            sys.exit(0)
+    elif args.command == 'submit':
+        jobid = submit(args.dir, args.card, args.cores, args.name, args.minutes)
+        print(f'Submitted local job {jobid}')
+    elif args.command == 'status':
+        sys.stdout.write(''.join(status(args.dir, args.ids)))
+    elif args.command == 'cancel':
+        cancel(args.dir, args.ids)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Wait until a test has written the restart files another test reads.
+
+run_test.sh starts one per test restarting from the test it runs (rt.sh
+with ecFlow or Rocoto), so that the restart test can start while its
+DEP_RUN is still running.  Once every pattern matches at least one file in
+run_dir and none of the matched files has changed for --settle seconds,
+ready_file is created and the script exits 0.  It exits 1 if the process
+--ppid (run_test.sh) ends first; the restart test then waits for DEP_RUN
+to complete as before.
+
+    restart_ready.py <run_dir> <ready_file> <pattern> [...] [--settle 60] [--interval 10] [--ppid PID]
+
+The patterns are paths relative to run_dir.  A plain name is a file that
+must exist, such as RESTART/20210322.120000.coupler.res, which FV3 writes
+after the other restart files of that time; a glob, such as
+RESTART/20210322.120000.*, must match at least one file.  Settling alone
+does not tell that a model is done writing, so the patterns should name
+every file the restart test reads, or a file written after them.
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+
+
+def parent_alive(ppid):
+    if ppid is None:
+        return True
+    try:
+        os.kill(ppid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def file_key(path):
+    """What tells that a file changed: its size and modification time."""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def matched_files(run_dir, patterns):
+    """Return {path: file_key} of the matches, or None if a pattern has none."""
+    files = {}
+    for pattern in patterns:
+        paths = glob.glob(os.path.join(run_dir, pattern))
+        if not paths:
+            return None
+        for path in paths:
+            try:
+                files[path] = file_key(path)
+            except OSError:
+                return None
+    return files
+
+
+def wait_ready(run_dir, patterns, settle=60, interval=10, ppid=None):
+    """Return True once the files are there and settled, False if ppid ended."""
+    last, since = None, None
+    while parent_alive(ppid):
+        files = matched_files(run_dir, patterns)
+        now = time.time()
+        if files != last:
+            last, since = files, now
+        elif files is not None and now - since >= settle:
+            return True
+        time.sleep(interval)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('run_dir')
+    parser.add_argument('ready_file')
+    parser.add_argument('patterns', nargs='+')
+    parser.add_argument('--settle', type=float, default=60,
+                        help='seconds the files must be unchanged (default 60)')
+    parser.add_argument('--interval', type=float, default=10,
+                        help='seconds between checks (default 10)')
+    parser.add_argument('--ppid', type=int,
+                        help='give up when this process (run_test.sh) is gone')
+    args = parser.parse_args()
+
+    if not wait_ready(args.run_dir, args.patterns, args.settle, args.interval,
+                      args.ppid):
+        print(f'process {args.ppid} ended before {" ".join(args.patterns)} were written')
+        sys.exit(1)
+    open(args.ready_file, 'w').close()
+    print(f'{time.strftime("%H:%M:%S")} {" ".join(args.patterns)} written, '
+          f'created {args.ready_file}')
+
+
+if __name__ == '__main__':
+    main()
@@ -9,15 +9,21 @@ die() { echo "$@" >&2; exit 1; }
 usage() {
   set +x
   echo
-  echo "Usage: $0 -c | -e | -h | -k | -w  | -l <file> | -m | -n <name> | -r "
+  echo "Usage: $0 -a <nodes> | -b | -c | -e | -f <N> | -h | -i <ref> | -k | -w  | -l <file> | -m | -n <name> | -o | -p | -r "
   echo
+  echo "  -a  run the tests needing at most <nodes> nodes in one allocation of <nodes> nodes (slurm)"
+  echo "  -b  reuse executables of identical earlier builds (build cache)"
   echo "  -c  create new baseline results"
   echo "  -e  use ecFlow workflow manager"
+  echo "  -f  with -e, cancel all remaining jobs once <N> jobs have failed"
   echo "  -h  display this help"
+  echo "  -i  run only the tests affected by the changes since git revision <ref>"
   echo "  -k  keep run directory"
   echo "  -l  runs test specified in <file>"
   echo "  -m  compare against new baseline results"
   echo "  -n  run single test <name>"
+  echo "  -o  order jobs by critical path, using timings of the previous run"
+  echo "  -p  report tests that are slower than in earlier runs (PERF)"
   echo "  -r  use Rocoto workflow manager"
   echo "  -w  for weekly_test, skip comparing baseline results"
   echo
@@ -28,33 +34,7 @@ usage() {
 [[ $# -eq 0 ]] && usage
 
 rt_single() {
-  local compile_line=''
-  local run_line=''
-  while read -r line || [ "$line" ]; do
-    line="${line#"${line%%[![:space:]]*}"}"
-    [[ ${#line} == 0 ]] && continue
-    [[ $line == \#* ]] && continue
-
-    if [[ $line == COMPILE* ]] ; then
-      MACHINES=$(echo $line | cut -d'|' -f3 | sed -e 's/^ *//' -e 's/ *$//')
-      if [[ ${MACHINES} == '' ]]; then
-        compile_line=$line
-      elif [[ ${MACHINES} == -* ]]; then
-        [[ ${MACHINES} =~ ${MACHINE_ID} ]] || compile_line=$line
-      elif [[ ${MACHINES} == +* ]]; then
-        [[ ${MACHINES} =~ ${MACHINE_ID} ]] && compile_line=$line
-      fi
-    fi
-
-    if [[ $line =~ RUN ]]; then
-      tmp_test=$(echo $line | cut -d'|' -f2 | sed -e 's/^ *//' -e 's/ *$//')
-      if [[ $SINGLE_NAME == $tmp_test && $compile_line != '' ]]; then
-        echo $compile_line >$TESTS_FILE
-        echo $line >>$TESTS_FILE
-        break
-      fi
-    fi
-  done <'rt.conf'
+  ${PATHRT}/rt_plan.py single rt.conf $SINGLE_NAME --machine ${MACHINE_ID} > $TESTS_FILE || rm -f $TESTS_FILE
 
   if [[ ! -f $TESTS_FILE ]]; then
     echo "$SINGLE_NAME does not exist or cannot be run on $MACHINE_ID"
@@ -81,8 +61,22 @@ rt_trap() {
   cleanup
 }
 
+job_monitor_stop() {
+  [[ -n ${JOB_MONITOR_PID:-} ]] && kill ${JOB_MONITOR_PID} 2>/dev/null || true
+  JOB_MONITOR_PID=''
+}
+
+local_scheduler_stop() {
+  [[ -n ${LOCAL_SCHEDULER_PID:-} ]] && kill ${LOCAL_SCHEDULER_PID} 2>/dev/null || true
+  LOCAL_SCHEDULER_PID=''
+  [[ -n ${PACK_JOB_ID:-} ]] && scancel ${PACK_JOB_ID} 2>/dev/null || true
+  PACK_JOB_ID=''
+}
+
 cleanup() {
   rm -rf ${LOCKDIR}
+  job_monitor_stop
+  local_scheduler_stop
   [[ ${ECFLOW:-false} == true ]] && ecflow_stop
   trap 0
   exit
@@ -386,10 +380,28 @@ elif [[ $MACHINE_ID = expanse.* ]]; then
   SCHEDULER=slurm
   cp fv3_conf/fv3_slurm.IN_expanse fv3_conf/fv3_slurm.IN
 
+elif [[ $MACHINE_ID = linux.* ]]; then
+
+  ECFLOW_START=
+  QUEUE=
+  COMPILE_QUEUE=
+  PARTITION=
+  dprefix=${RT_DPREFIX:-$HOME/ufs-weather-model/run}
+  DISKNM=${RT_DISKNM:-$HOME/ufs-weather-model/RT}
+  STMP=$dprefix
+  PTMP=$dprefix
+  SCHEDULER=local
+
 else
   die "Unknown machine ID, please edit detect_machine.sh file"
 fi
 
+# Run the jobs as local processes instead of submitting them, e.g. on a
+# node allocated interactively
+if [[ ${RT_SCHEDULER:-} = local ]]; then
+  SCHEDULER=local
+fi
+
 mkdir -p ${STMP}/${USER}
 
 # Different own baseline directories for different compilers on Theia/Cheyenne
@@ -408,15 +420,33 @@ ECFLOW=false
 KEEP_RUNDIR=false
 SINGLE_NAME=''
 TEST_35D=false
+CRITICAL_PATH_ORDER=false
+PERF_CHECK=false
+IMPACT_REF=''
+IMPACT_NOTE=''
+IMPACT_NONE=false
+MAX_FAILURES=${RT_MAX_FAILURES:-}
+PACK_NODES=${RT_PACK_NODES:-}
 export skip_check_results=false
 
 TESTS_FILE='rt.conf'
 
-while getopts ":cl:mn:wkreh" opt; do
+while getopts ":a:bcf:l:mn:opwkrehi:" opt; do
   case $opt in
+    a)
+      PACK_NODES=$OPTARG
+      [[ $PACK_NODES =~ ^[1-9][0-9]*$ ]] || die "-a needs a number of nodes, not $OPTARG"
+      ;;
+    b)
+      export RT_BUILD_CACHE=${RT_BUILD_CACHE:-${XDG_CACHE_HOME:-${HOME}/.cache}/rt_build_cache}
+      ;;
     c)
       CREATE_BASELINE=true
       ;;
+    f)
+      MAX_FAILURES=$OPTARG
+      [[ $MAX_FAILURES =~ ^[1-9][0-9]*$ ]] || die "-f needs a number of failed jobs, not $OPTARG"
+      ;;
     l)
       TESTS_FILE=$OPTARG
       ;;
@@ -429,6 +459,12 @@ while getopts ":cl:mn:wkreh" opt; do
       TESTS_FILE='rt.conf.single'
       rm -f $TESTS_FILE
       ;;
+    o)
+      CRITICAL_PATH_ORDER=true
+      ;;
+    p)
+      PERF_CHECK=true
+      ;;
     w)
       export skip_check_results=true
       ;;
@@ -443,6 +479,9 @@ while getopts ":cl:mn:wkreh" opt; do
       ECFLOW=true
       ROCOTO=false
       ;;
+    i)
+      IMPACT_REF=$OPTARG
+      ;;
     h)
       usage
       ;;
@@ -461,6 +500,23 @@ if [[ $SINGLE_NAME != '' ]]; then
   rt_single
 fi
 
+if [[ $IMPACT_REF != '' ]]; then
+  if [[ $CREATE_BASELINE == true ]]; then
+    echo "Baselines are created for all tests, -i ${IMPACT_REF} is ignored"
+  else
+    ${PATHRT}/rt_impact.py $TESTS_FILE --ref ${IMPACT_REF} --machine ${MACHINE_ID} > ${TESTS_FILE}.impact \
+      || die "cannot find the tests affected by the changes since ${IMPACT_REF}"
+    # a subset of the tests passing is not a passing regression test
+    if [[ $( head -1 ${TESTS_FILE}.impact ) != '# all tests'* ]]; then
+      IMPACT_NOTE="PARTIAL RUN:$( head -1 ${TESTS_FILE}.impact | cut -c2- )"
+    fi
+    if ! grep -q '^ *\(COMPILE\|RUN\) *|' ${TESTS_FILE}.impact; then
+      IMPACT_NONE=true
+    fi
+    TESTS_FILE=${TESTS_FILE}.impact
+  fi
+fi
+
 if [[ $TESTS_FILE =~ '35d' ]]; then
   TEST_35D=true
 fi
@@ -493,17 +549,44 @@ else
   REGRESSIONTEST_LOG=${PATHRT}/RegressionTests_$MACHINE_ID.log
 fi
 
+# the performance history the tests are compared with (-p) and their wall
+# clock times are predicted from (RT_WLCLK_MARGIN) includes all committed logs
+if [[ $PERF_CHECK == true || -n ${RT_WLCLK_MARGIN:-} ]]; then
+  ${PATHRT}/rt_perfdb.py ingest-git || echo "WARNING: could not read the performance history from git"
+fi
+
+# keep the timings of the previous run for ordering the jobs (-o)
+if [[ $CRITICAL_PATH_ORDER == true && -f ${REGRESSIONTEST_LOG} ]]; then
+  cp ${REGRESSIONTEST_LOG} ${RUNDIR_ROOT}/RegressionTests_previous.log
+fi
+
 date > ${REGRESSIONTEST_LOG}
 echo "Start Regression test" >> ${REGRESSIONTEST_LOG}
 echo                         >> ${REGRESSIONTEST_LOG}
+if [[ -n ${IMPACT_NOTE} ]]; then
+  echo "${IMPACT_NOTE}"      >> ${REGRESSIONTEST_LOG}
+  echo                       >> ${REGRESSIONTEST_LOG}
+fi
+
+# running no tests neither passes nor fails the regression test
+if [[ ${IMPACT_NONE} == true ]]; then
+   echo ; echo "REGRESSION TEST WAS NOT RUN: no tests affected"
+  (echo ; echo "REGRESSION TEST WAS NOT RUN: no tests affected") >> ${REGRESSIONTEST_LOG}
+  date >> ${REGRESSIONTEST_LOG}
+  rm -f ${TESTS_FILE}
+  exit 0
+fi
 
 source default_vars.sh
 
 JOB_NR=0
 TEST_NR=0
 COMPILE_NR=0
+NUM_COMPILES=0
+BUILDS_SAVED=0
+declare -A COMPILE_NR_OF_JOB
 COMPILE_PREV_WW3_NR=''
-rm -f fail_test* fail_compile*
+rm -f fail_test* fail_compile* perf_test*
 
 export LOG_DIR=${PATHRT}/log_$MACHINE_ID
 rm -rf ${LOG_DIR}
@@ -575,9 +658,10 @@ fi
 
 if [[ $ECFLOW == true ]]; then
 
-  # Default maximum number of compile and run jobs
-  MAX_BUILDS=10
-  MAX_JOBS=30
+  # Default maximum number of compile and run jobs, lower if set in the
+  # environment, e.g. by rt_auto.py running several rt.sh at a time
+  MAX_BUILDS=${RT_MAX_BUILDS:-10}
+  MAX_JOBS=${RT_MAX_JOBS:-30}
 
   # Default number of tries to run jobs - on wcoss, no error tolerance
   ECF_TRIES=2
@@ -586,7 +670,7 @@ if [[ $ECFLOW == true ]]; then
   fi
 
   # Reduce maximum number of compile jobs on jet.intel and s4.intel because of licensing issues
-  if [[ $MACHINE_ID = jet.intel ]]; then
+  if [[ $MACHINE_ID = jet.intel ]] && [[ $MAX_BUILDS -gt 5 ]]; then
     MAX_BUILDS=5
   elif [[ $MACHINE_ID = s4.intel ]]; then
     MAX_BUILDS=1
@@ -647,6 +731,65 @@ else
 
 fi
 
+##
+## one job monitor queries the scheduler for all tests submitted by
+## submit_and_wait (Rocoto submits and tracks its jobs itself)
+##
+
+JOB_MONITOR_DIR=''
+if [[ $ROCOTO == false && $SCHEDULER =~ ^(pbs|slurm|lsf)$ ]]; then
+  JOB_MONITOR_DIR=${RUNDIR_ROOT}/job_monitor
+  mkdir -p ${JOB_MONITOR_DIR}/jobs ${JOB_MONITOR_DIR}/status
+  ${PATHRT}/job_monitor.py ${JOB_MONITOR_DIR} --scheduler ${SCHEDULER} --ppid $$ > ${LOG_DIR}/job_monitor.log 2>&1 &
+  JOB_MONITOR_PID=$!
+fi
+
+##
+## without a batch system, local_scheduler.py runs the job cards on the
+## cores of this machine, RT_LOCAL_CORES (default all)
+##
+
+LOCAL_SCHEDULER_DIR=''
+if [[ $SCHEDULER == local ]]; then
+  [[ $ROCOTO == true ]] && die "Rocoto cannot submit jobs to the local scheduler"
+  LOCAL_SCHEDULER_DIR=${RUNDIR_ROOT}/local_scheduler
+  mkdir -p ${LOCAL_SCHEDULER_DIR}
+  ${PATHRT}/local_scheduler.py start ${LOCAL_SCHEDULER_DIR} --cores ${RT_LOCAL_CORES:-$(nproc)} --ppid $$ > ${LOG_DIR}/local_scheduler.log 2>&1 &
+  LOCAL_SCHEDULER_PID=$!
+fi
+
+##
+## with -a, one allocation of PACK_NODES nodes runs local_scheduler.py, and
+## the tests that fit in it run as its job steps instead of as their own jobs
+##
+
+PACK_DIR=''
+PACK_WLCLK=${RT_PACK_WLCLK:-120}
+if [[ -n $PACK_NODES ]]; then
+  [[ $SCHEDULER == slurm ]] || die "-a needs slurm, not $SCHEDULER"
+  [[ $ROCOTO == false ]] || die "-a cannot be used with Rocoto"
+  PACK_DIR=${RUNDIR_ROOT}/pack
+  mkdir -p ${PACK_DIR}
+  # the #SBATCH lines of the machine's job card, for the whole allocation
+  ( source ${PATHRT}/atparse.bash
+    NODES=${PACK_NODES}; TPN=${TPN_dflt}; WLCLK=${PACK_WLCLK}; JBNME=rt_pack_$$
+    grep -E '^(#!|#SBATCH)' fv3_conf/fv3_slurm.IN | atparse
+  ) > ${PACK_DIR}/job_card
+  cat << EOF >> ${PACK_DIR}/job_card
+
+# concurrent job steps use only the cores they ask for
+export SLURM_EXACT=1
+# jobs that would outlast the allocation are left to run_test.sh to submit
+end=\$(( \$( date +%s ) + ${PACK_WLCLK} * 60 ))
+exec ${PATHRT}/local_scheduler.py start ${PACK_DIR} --cores \${SLURM_NTASKS} --end \${end}
+EOF
+  pack_out=$( cd ${PACK_DIR} && sbatch job_card )
+  re='Submitted batch job ([0-9]+)'
+  [[ "${pack_out}" =~ $re ]] || die "cannot submit the allocation of packed tests: ${pack_out}"
+  PACK_JOB_ID=${BASH_REMATCH[1]}
+  echo "Tests of at most ${PACK_NODES} nodes and ${PACK_WLCLK} minutes run in job ${PACK_JOB_ID}"
+fi
+
 ##
 ## read rt.conf and then either execute the test script directly or create
 ## workflow description file
@@ -657,34 +800,51 @@ in_metatask=false
 
 [[ -f $TESTS_FILE ]] || die "$TESTS_FILE does not exist"
 
-while read -r line || [ "$line" ]; do
-
-  line="${line#"${line%%[![:space:]]*}"}"
-  [[ ${#line} == 0 ]] && continue
-  [[ $line == \#* ]] && continue
+# rt_plan.py parses the conf file once and lists the entries for this machine
+if [[ $CRITICAL_PATH_ORDER == true ]]; then
+  SCHEDULE_LOGS=''
+  [[ -f ${RUNDIR_ROOT}/RegressionTests_previous.log ]] && SCHEDULE_LOGS="--log ${RUNDIR_ROOT}/RegressionTests_previous.log"
+  SCHEDULE_CB=''
+  [[ $CREATE_BASELINE == true ]] && SCHEDULE_CB='--create-baseline'
+  ${PATHRT}/rt_schedule.py $TESTS_FILE --machine ${MACHINE_ID} ${SCHEDULE_LOGS} ${SCHEDULE_CB} \
+    --max-builds ${MAX_BUILDS:-10} --max-jobs ${MAX_JOBS:-30} | tee ${LOG_DIR}/rt_schedule.log
+  ${PATHRT}/rt_schedule.py $TESTS_FILE --machine ${MACHINE_ID} ${SCHEDULE_LOGS} ${SCHEDULE_CB} \
+    --max-builds ${MAX_BUILDS:-10} --max-jobs ${MAX_JOBS:-30} --lines > ${RUNDIR_ROOT}/rt_plan.lines || die "cannot schedule $TESTS_FILE"
+else
+  ${PATHRT}/rt_plan.py lines $TESTS_FILE --machine ${MACHINE_ID} > ${RUNDIR_ROOT}/rt_plan.lines || die "cannot parse $TESTS_FILE"
+fi
 
-  JOB_NR=$( printf '%03d' $(( 10#$JOB_NR + 1 )) )
+while IFS='|' read -r entry JOB_NR f3 f4 f5 f6 f7; do
 
-  if [[ $line == COMPILE* ]] ; then
+  if [[ $entry == COMPILE ]] ; then
 
-    MAKE_OPT=$(echo $line | cut -d'|' -f2 | sed -e 's/^ *//' -e 's/ *$//')
-    MACHINES=$(echo $line | cut -d'|' -f3 | sed -e 's/^ *//' -e 's/ *$//')
-    CB=$(      echo $line | cut -d'|' -f4)
+    MAKE_OPT=$f3
+    CB=$f4
+    SAME_AS=$f5
 
     [[ $CREATE_BASELINE == true && $CB != *fv3* ]] && continue
 
-    if [[ ${MACHINES} != '' ]]; then
-      if [[ ${MACHINES} == -* ]]; then
-        [[ ${MACHINES} =~ ${MACHINE_ID} ]] && continue
-      elif [[ ${MACHINES} == +* ]]; then
-        [[ ${MACHINES} =~ ${MACHINE_ID} ]] || continue
-      else
-        echo "MACHINES=|${MACHINES}|"
-        die "MACHINES spec must be either an empty string or start with either '+' or '-'"
-      fi
+    # Set RT_SUFFIX (regression test run directories and log files) and BL_SUFFIX
+    # (regression test baseline directories) for REPRO or PROD runs
+    if [[ ${MAKE_OPT^^} =~ "-DREPRO=ON" ]]; then
+      RT_SUFFIX="_repro"
+      BL_SUFFIX="_repro"
+    else
+      RT_SUFFIX=""
+      BL_SUFFIX=""
+    fi
+
+    # Same options as an earlier build: run the tests with its executable
+    if [[ -n $SAME_AS && -n ${COMPILE_NR_OF_JOB[$SAME_AS]:-} ]]; then
+      export COMPILE_NR=${COMPILE_NR_OF_JOB[$SAME_AS]}
+      BUILDS_SAVED=$(( BUILDS_SAVED + 1 ))
+      echo "COMPILE ${JOB_NR} is identical to COMPILE ${SAME_AS}, using fv3_${COMPILE_NR}.exe"
+      continue
     fi
 
-    export COMPILE_NR=$( printf '%03d' $(( 10#$COMPILE_NR + 1 )) )
+    NUM_COMPILES=$(( NUM_COMPILES + 1 ))
+    export COMPILE_NR=$( printf '%03d' ${NUM_COMPILES} )
+    COMPILE_NR_OF_JOB[$JOB_NR]=${COMPILE_NR}
 
     cat << EOF > ${RUNDIR_ROOT}/compile_${COMPILE_NR}.env
     export JOB_NR=${JOB_NR}
@@ -701,6 +861,10 @@ while read -r line || [ "$line" ]; do
     export ECFLOW=${ECFLOW}
     export REGRESSIONTEST_LOG=${REGRESSIONTEST_LOG}
     export LOG_DIR=${LOG_DIR}
+    export JOB_MONITOR_DIR=${JOB_MONITOR_DIR}
+    export LOCAL_SCHEDULER_DIR=${LOCAL_SCHEDULER_DIR}
+    export RT_BUILD_CACHE=${RT_BUILD_CACHE:-}
+    export RT_BUILD_CACHE_QUOTA=${RT_BUILD_CACHE_QUOTA:-}
 EOF
 
     if [[ $ROCOTO == true ]]; then
@@ -712,44 +876,23 @@ EOF
       mv compile_${COMPILE_NR}_time.log ${LOG_DIR}
     fi
 
-    # Set RT_SUFFIX (regression test run directories and log files) and BL_SUFFIX
-    # (regression test baseline directories) for REPRO or PROD runs
-    if [[ ${MAKE_OPT^^} =~ "-DREPRO=ON" ]]; then
-      RT_SUFFIX="_repro"
-      BL_SUFFIX="_repro"
-    else
-      RT_SUFFIX=""
-      BL_SUFFIX=""
-    fi
-
     if [[ ${MAKE_OPT^^} =~ "-DAPP=ATMW" ]] || [[ ${MAKE_OPT^^} =~ "-DAPP=S2SW" ]] || [[ ${MAKE_OPT^^} =~ "-DAPP=HAFSW" ]] || [[ ${MAKE_OPT^^} =~ "-DAPP=HAFS-ALL" ]] ; then
        COMPILE_PREV_WW3_NR=${COMPILE_NR}
     fi
 
     continue
 
-  elif [[ $line == RUN* ]] ; then
+  elif [[ $entry == RUN ]] ; then
 
-    TEST_NAME=$(echo $line | cut -d'|' -f2 | sed -e 's/^ *//' -e 's/ *$//')
-    MACHINES=$( echo $line | cut -d'|' -f3 | sed -e 's/^ *//' -e 's/ *$//')
-    CB=$(       echo $line | cut -d'|' -f4)
-    DEP_RUN=$(  echo $line | cut -d'|' -f5 | sed -e 's/^ *//' -e 's/ *$//')
-    DATE_35D=$( echo $line | cut -d'|' -f6 | sed -e 's/^ *//' -e 's/ *$//')
+    TEST_NAME=$f3
+    CB=$f4
+    DEP_RUN=$f5
+    DATE_35D=$f6
+    RESTART_DEPS=$f7
 
     [[ -e "tests/$TEST_NAME" ]] || die "run test file tests/$TEST_NAME does not exist"
     [[ $CREATE_BASELINE == true && $CB != *fv3* ]] && continue
 
-    if [[ ${MACHINES} != '' ]]; then
-      if [[ ${MACHINES} == -* ]]; then
-        [[ ${MACHINES} =~ ${MACHINE_ID} ]] && continue
-      elif [[ ${MACHINES} == +* ]]; then
-        [[ ${MACHINES} =~ ${MACHINE_ID} ]] || continue
-      else
-        echo "MACHINES=|${MACHINES}|"
-        die "MACHINES spec must be either an empty string or start with either '+' or '-'"
-      fi
-    fi
-
     # 35 day tests
     [[ $TEST_35D == true ]] && rt_35d
 
@@ -770,6 +913,24 @@ EOF
     (
       source ${PATHRT}/tests/$TEST_NAME
 
+      # restart tests start once the restart files they read are written
+      RESTART_FILES=''
+      RESTART_EVENTS=''
+      if [[ ($ROCOTO == true || $ECFLOW == true) && ${OPNREQ_TEST} == false ]]; then
+        [[ $DEP_RUN != '' ]] && RESTART_FILES=$( restart_dep_files )
+        rm -f ${RUNDIR_ROOT}/restart_deps/${TEST_NAME}${RT_SUFFIX}
+        for restart_test in ${RESTART_DEPS//,/ }; do
+          [[ -e tests/${restart_test} ]] || continue
+          files=$( unset RESTART_DEP_FILES RESTART_FILE_PREFIX RESTART_FILE_SUFFIX_HRS RESTART_FILE_SUFFIX_SECS OCNRES
+                   source ${PATHRT}/tests/${restart_test}
+                   restart_dep_files )
+          [[ -n $files ]] || continue
+          mkdir -p ${RUNDIR_ROOT}/restart_deps
+          echo "${restart_test}${RT_SUFFIX} ${files}" >> ${RUNDIR_ROOT}/restart_deps/${TEST_NAME}${RT_SUFFIX}
+          RESTART_EVENTS="${RESTART_EVENTS} restart_${restart_test}${RT_SUFFIX}"
+        done
+      fi
+
       NODES=$(( TASKS / TPN ))
       if (( NODES * TPN < TASKS )); then
         NODES=$(( NODES + 1 ))
@@ -798,6 +959,18 @@ EOF
       export REGRESSIONTEST_LOG=${REGRESSIONTEST_LOG}
       export LOG_DIR=${LOG_DIR}
       export DEP_RUN=${DEP_RUN}
+      export PERF_CHECK=${PERF_CHECK}
+      export RT_PERFDB=${RT_PERFDB:-}
+      export RT_WLCLK_MARGIN=${RT_WLCLK_MARGIN:-}
+      export RT_COMPARE_WATCH=${RT_COMPARE_WATCH:-false}
+      export RT_COMPARE_REPORT=${RT_COMPARE_REPORT:-false}
+      export RT_COMPARE_ABORT=${RT_COMPARE_ABORT:-false}
+      export JOB_MONITOR_DIR=${JOB_MONITOR_DIR}
+      export LOCAL_SCHEDULER_DIR=${LOCAL_SCHEDULER_DIR}
+      export PACK_DIR=${PACK_DIR}
+      export PACK_NODES=${PACK_NODES}
+      export PACK_WLCLK=${PACK_WLCLK}
+      export PACK_JOB_ID=${PACK_JOB_ID:-}
 EOF
 
       if [[ $ROCOTO == true ]]; then
@@ -811,9 +984,9 @@ EOF
 
     continue
   else
-    die "Unknown command $line"
+    die "Unknown command $entry"
   fi
-done < $TESTS_FILE
+done < ${RUNDIR_ROOT}/rt_plan.lines
 
 ##
 ## run regression test workflow (currently Rocoto or ecFlow are supported)
@@ -834,6 +1007,9 @@ if [[ $ECFLOW == true ]]; then
   ecflow_run
 fi
 
+job_monitor_stop
+local_scheduler_stop
+
 ##
 ## regression test is either failed or successful
 ##
@@ -867,6 +1043,26 @@ else
   [[ ${ROCOTO} == true ]] && rm -f ${ROCOTO_XML} ${ROCOTO_DB} *_lock.db
   [[ ${TEST_35D} == true ]] && rm -f tests/cpld_bmark*_20*
   [[ ${SINGLE_NAME} != '' ]] && rm -f rt.conf.single
+  [[ ${TESTS_FILE} == *.impact ]] && rm -f ${TESTS_FILE}
+fi
+
+if ls perf_test_* >/dev/null 2>&1; then
+  echo "PERFORMANCE REGRESSIONS: "
+  echo "PERFORMANCE REGRESSIONS: "             >> ${REGRESSIONTEST_LOG}
+  cat perf_test_* | while read -r perf_test_name perf_test_nr perf_details
+  do
+    echo "Test ${perf_test_name} ${perf_test_nr} is slower: ${perf_details}"
+    echo "Test ${perf_test_name} ${perf_test_nr} is slower: ${perf_details}" >> ${REGRESSIONTEST_LOG}
+  done
+  echo
+  echo                                         >> ${REGRESSIONTEST_LOG}
+fi
+
+if [[ $BUILDS_SAVED -gt 0 ]]; then
+  echo "Builds saved by reusing identical executables: ${BUILDS_SAVED}"
+  echo "Builds saved by reusing identical executables: ${BUILDS_SAVED}" >> ${REGRESSIONTEST_LOG}
+  echo
+  echo                                         >> ${REGRESSIONTEST_LOG}
 fi
 
 date >> ${REGRESSIONTEST_LOG}
@@ -874,3 +1070,6 @@ date >> ${REGRESSIONTEST_LOG}
 elapsed_time=$( printf '%02dh:%02dm:%02ds\n' $((SECONDS%86400/3600)) $((SECONDS%3600/60)) $((SECONDS%60)) )
 echo "Elapsed time: ${elapsed_time}. Have a nice day!" >> ${REGRESSIONTEST_LOG}
 echo "Elapsed time: ${elapsed_time}. Have a nice day!"
+
+# add the timings of this run to the performance history (see rt_perfdb.py)
+${PATHRT}/rt_perfdb.py ingest ${REGRESSIONTEST_LOG} || echo "WARNING: could not add ${REGRESSIONTEST_LOG} to the performance database"
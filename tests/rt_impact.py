@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""Select the regression tests affected by the changes since a git revision.
+
+The changed paths are mapped to the model components they belong to, and
+a COMPILE group is affected if its -DAPP enables one of these components
+(as cmake/configure_apps.cmake does) or, for a changed CCPP suite
+definition, if the suite is in its -DCCPP_SUITES.  Changed test
+definitions only affect those tests, and a changed parm/fv3_conf template
+only the tests whose definitions name it.  A template that is also named in
+default_vars.sh, run_test.sh, rt_utils.sh, rt.sh or fv3_conf, where it may
+be the default of all tests of an application, or that no test names,
+affects all tests, as does any other change outside of documentation and
+logs.
+
+All RUNs of an affected build are selected, together with the tests that
+restart from them and the tests these need the output of.  The result is
+printed as a conf file for rt.sh -l.
+
+    rt_impact.py <conf> --ref <git revision> [--machine <MACHINE_ID>]
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+import rt_plan
+
+PATHRT = os.path.dirname(os.path.abspath(__file__))
+PATHTR = os.path.dirname(PATHRT)
+
+# source directory of each component switched on in configure_apps.cmake
+COMPONENT_PATHS = {
+    'FV3': 'FV3',
+    'STOCH_PHYS': 'stochastic_physics',
+    'WW3': 'WW3',
+    'MOM6': 'MOM6-interface',
+    'CICE6': 'CICE-interface',
+    'CMEPS': 'CMEPS-interface',
+    'CDEPS': 'CDEPS-interface',
+    'HYCOM': 'HYCOM-interface',
+    'UFS_GOCART': 'GOCART',
+}
+
+SUITE_RE = re.compile(r'^FV3/ccpp/suites/suite_(.+)\.xml$')
+
+# where templates are used by default, for all tests or those of an export_*
+# function of default_vars.sh
+SHARED_SCRIPTS = ('default_vars.sh', 'run_test.sh', 'rt_utils.sh', 'rt.sh',
+                  'fv3_conf')
+
+# changes that do not affect any test
+IGNORED = (
+    re.compile(r'^doc/'),
+    re.compile(r'^\.github/'),
+    re.compile(r'^[^/]+\.md$'),
+    re.compile(r'^tests/(RegressionTests|OpnReqTests)_.*\.log$'),
+    re.compile(r'^tests/(auto|ci)/'),
+)
+
+
+def app_components(app, cmake_file=None):
+    """Return the components configure_apps.cmake switches on for an APP."""
+    cmake_file = cmake_file or os.path.join(PATHTR, 'cmake',
+                                            'configure_apps.cmake')
+    components = set()
+    # each level: [condition of this branch, a branch was already taken]
+    stack = []
+    with open(cmake_file) as f:
+        for line in f:
+            line = line.split('#')[0].strip()
+            m = re.match(r'^(if|elseif)\s*\(\s*APP\s+MATCHES\s+"([^"]*)"\s*\)',
+                         line)
+            if m and m.group(1) == 'if':
+                stack.append([re.search(m.group(2), app) is not None, False])
+                stack[-1][1] = stack[-1][0]
+            elif m:
+                taken = stack[-1][1]
+                stack[-1][0] = not taken and re.search(m.group(2), app) is not None
+                stack[-1][1] = taken or stack[-1][0]
+            elif re.match(r'^else\s*\(', line):
+                stack[-1][0] = not stack[-1][1]
+            elif re.match(r'^endif\s*\(', line):
+                stack.pop()
+            else:
+                m = re.match(r'^set\s*\(\s*(\w+)\s+ON\b', line)
+                if m and all(active for active, _ in stack):
+                    components.add(m.group(1))
+    return components
+
+
+def compile_flags(make_opt):
+    """Return (APP, set of CCPP suites) of the options of a build."""
+    app = ''
+    suites = set()
+    for opt in make_opt.split():
+        if opt.startswith('-DAPP='):
+            app = opt.split('=', 1)[1]
+        elif opt.startswith('-DCCPP_SUITES='):
+            suites = set(opt.split('=', 1)[1].split(','))
+    return app, suites
+
+
+def git(*args, cwd=PATHTR):
+    return subprocess.run(['git'] + list(args), cwd=cwd, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                          universal_newlines=True).stdout
+
+
+def changed_paths(ref, cwd=PATHTR, prefix=''):
+    """Return the paths changed in the working tree since ref.
+
+    Changed submodules are expanded into the paths changed in them, if both
+    commits are available in the submodule clone; otherwise the submodule
+    path itself is returned.
+    """
+    base = git('merge-base', ref, 'HEAD', cwd=cwd).strip()
+    paths = []
+    diff = git('diff', '--raw', '--no-abbrev', '--no-renames', base, cwd=cwd)
+    for line in diff.splitlines():
+        # :<old mode> <new mode> <old sha> <new sha> <status>\t<path>
+        meta, path = line.split('\t', 1)
+        old_mode, new_mode, old_sha = meta.lstrip(':').split()[:3]
+        if '160000' in (old_mode, new_mode):
+            sub = os.path.join(cwd, path)
+            try:
+                paths += changed_paths(old_sha, sub, prefix + path + '/')
+                continue
+            except (subprocess.CalledProcessError, OSError):
+                pass
+        paths.append(prefix + path)
+    return paths
+
+
+def test_definitions():
+    """Return {test name: text of tests/tests/<name>}."""
+    tests = {}
+    tests_dir = os.path.join(PATHRT, 'tests')
+    for name in os.listdir(tests_dir):
+        with open(os.path.join(tests_dir, name), errors='replace') as f:
+            tests[name] = f.read()
+    return tests
+
+
+def shared_scripts():
+    """Return the text of SHARED_SCRIPTS, the files of directories included."""
+    texts = []
+    for name in SHARED_SCRIPTS:
+        path = os.path.join(PATHRT, name)
+        paths = [os.path.join(path, f) for f in sorted(os.listdir(path))] \
+            if os.path.isdir(path) else [path]
+        for path in paths:
+            with open(path, errors='replace') as f:
+                texts.append(f.read())
+    return '\n'.join(texts)
+
+
+def names_file(text, name):
+    """Return True if text names the file name as a whole word."""
+    return re.search(r'(?<![\w.-])' + re.escape(name) + r'(?![\w.-])',
+                     text) is not None
+
+
+def affected(plan, paths, machine_id=None):
+    """Return the set of RUN indexes in plan affected by the changed paths,
+    or None if all tests are affected."""
+    components = set()
+    suites = set()
+    tests = set()
+    definitions = None
+    shared = None
+    for path in paths:
+        if any(r.match(path) for r in IGNORED):
+            continue
+        m = SUITE_RE.match(path)
+        if m:
+            suites.add(m.group(1))
+            continue
+        component = next((c for c, p in COMPONENT_PATHS.items()
+                          if path == p or path.startswith(p + '/')), None)
+        if component:
+            components.add(component)
+            continue
+        if path.startswith('tests/tests/'):
+            tests.add(os.path.basename(path))
+            continue
+        if path.startswith(('tests/parm/', 'tests/fv3_conf/')):
+            if definitions is None:
+                definitions = test_definitions()
+                shared = shared_scripts()
+            name = os.path.basename(path)
+            users = {t for t, text in definitions.items()
+                     if names_file(text, name)}
+            if users and not names_file(shared, name):
+                tests |= users
+                continue
+        # build system, driver, rt.sh and friends, templates used by default
+        # or under a name made up at run time
+        return None
+
+    apps = {}
+    selected = set()
+    for i, run in enumerate(plan.runs):
+        if machine_id and not rt_plan.machine_match(run.machines, machine_id):
+            continue
+        if run.name in tests:
+            selected.add(i)
+        if run.compile is None:
+            continue
+        app, run_suites = compile_flags(plan.compiles[run.compile].make_opt)
+        if app not in apps:
+            apps[app] = app_components(app)
+        if components & apps[app] or suites & run_suites:
+            selected.add(i)
+    return selected
+
+
+def with_dependencies(plan, selected):
+    """Add the tests restarting from the selected ones and the tests these
+    need the output of."""
+    todo = list(selected)
+    selected = set(selected)
+    while todo:
+        run = plan.runs[todo.pop()]
+        related = [plan.runs.index(r) for r in plan.dependents(run.name)]
+        if run.dep_run:
+            related += plan.by_name.get(run.dep_run, [])
+        for j in related:
+            if j not in selected:
+                selected.add(j)
+                todo.append(j)
+    return selected
+
+
+def conf_lines(plan, selected):
+    """Return the conf file lines running the selected tests."""
+    lines = []
+    last_compile = None
+    for i in sorted(selected, key=lambda i: plan.runs[i].job_nr):
+        run = plan.runs[i]
+        if run.compile is not None and run.compile != last_compile:
+            lines.append(plan.compiles[run.compile].line)
+            last_compile = run.compile
+        lines.append(run.line)
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('conf')
+    parser.add_argument('--ref', required=True,
+                        help='git revision the changes are compared with')
+    parser.add_argument('--machine', help='only tests that run on this machine')
+    args = parser.parse_args()
+
+    plan = rt_plan.load_plan(args.conf)
+    try:
+        paths = changed_paths(args.ref)
+    except subprocess.CalledProcessError:
+        sys.exit(f'ERROR: cannot compare with git revision {args.ref}')
+
+    selected = affected(plan, paths, args.machine)
+    if selected is None:
+        print(f'# all tests of {args.conf} are affected by the changes since '
+              f'{args.ref}')
+        with open(args.conf) as f:
+            sys.stdout.write(f.read())
+        return
+    selected = with_dependencies(plan, selected)
+    print(f'# {len(selected)} tests of {args.conf} are affected by the changes '
+          f'since {args.ref}')
+    for line in conf_lines(plan, selected):
+        print(line)
+    if not selected:
+        print(f'No tests are affected by the changes since {args.ref}',
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
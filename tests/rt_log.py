@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""Read compile and test results from RegressionTests_<machine>.log files.
+
+    rt_log.py [--json] <RegressionTests_machine.log> [...]
+    rt_log.py --follow <log_dir> [--log <RegressionTests_machine.log>]
+
+prints the compile times and the wall time and status of every test, or
+with --json one record per line: compiles, file comparisons, test results
+and the summary, in the order of the log.
+
+--follow prints the records of a running rt.sh as its compile and test
+jobs write their logs to log_dir (log_<MACHINE_ID> in tests/), and exits
+once the RegressionTests log has its summary.  rt.sh adds those logs to
+the RegressionTests log only when all jobs are done.
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import argparse
+from typing import NamedTuple, Optional, Tuple
+
+COMPILE_RE = re.compile(r'^Compile (\d+) elapsed time (\d+) seconds\.\s*(.*)$')
+# run_compile.sh adds this to the options of a build taken from the cache
+CACHED_SUFFIX = ' (build cache)'
+BASELINE_RE = re.compile(r'^baseline dir\s*=\s*(\S+)')
+RUN_DIR_RE = re.compile(r'^working dir\s*=\s*(\S+)')
+CHECK_RE = re.compile(r'^Checking test (\d+) (\S+) results')
+FILE_RE = re.compile(r'^ (Comparing|Moving) (\S+) \.+(?:ALT CHECK\.+)?'
+                     r'(OK|NOT OK|(?:CMP )?ERROR|SKIP)\.?\s*(.*)$')
+WALL_TIME_RE = re.compile(r'The total amount of wall time\s*=\s*([0-9.]+)')
+MAX_RSS_RE = re.compile(r'^\s*max memory \(MaxRSS\)\s*=\s*(\d+) KB')
+RESULT_RE = re.compile(r'^Test (\d+) (\S+) (PASS|FAIL)(?: Tries: (\d+))?')
+FAILED_RE = re.compile(r'^Test (.+?) failed\s*$')
+SUMMARY_RE = re.compile(r'^REGRESSION TEST (WAS SUCCESSFUL|FAILED|WAS NOT RUN)')
+
+
+class Started(NamedTuple):
+    date: str
+
+
+class CompileTime(NamedTuple):
+    nr: str
+    seconds: int
+    options: str
+    cached: bool = False
+
+
+class FileCheck(NamedTuple):
+    test_nr: str
+    test_name: str
+    action: str                       # Comparing, or Moving for baselines
+    file: str
+    status: str                       # OK, NOT OK, ERROR, CMP ERROR or SKIP
+    detail: str                       # reason, or how a baseline was staged
+
+
+class TestResult(NamedTuple):
+    nr: str
+    name: str
+    status: str
+    wall_time: Optional[float]
+    tries: int
+    baseline: Optional[str]
+    max_rss: Optional[int] = None     # KB, where the scheduler reports it
+    run_dir: Optional[str] = None
+
+
+class Summary(NamedTuple):
+    successful: bool
+    failed: Tuple[str, ...]           # as listed under FAILED TESTS
+    ran: bool = True                  # False if -i selected no tests
+
+
+class RegressionLog:
+    """Compile times and test results of one regression test log."""
+
+    def __init__(self):
+        self.started = None
+        self.compiles = []
+        self.checks = []
+        self.tests = []
+        self.summary = None
+
+    def compile_seconds(self, make_opt):
+        """Return the elapsed time of the build with these options, or None.
+
+        compile.sh appends options of its own (-DMPI=ON, the build type,
+        ...), so a build matches if it was made with all options of
+        make_opt; the build with the fewest extra options wins.
+        """
+        wanted = set(make_opt.split())
+        best = None
+        for c in self.compiles:
+            options = set(c.options.split())
+            if wanted <= options:
+                if best is None or len(options) < len(best[0]):
+                    best = (options, c.seconds)
+        return best[1] if best else None
+
+    def wall_times(self):
+        """Return {test name: wall time} of the tests that report one."""
+        return {t.name: t.wall_time for t in self.tests
+                if t.wall_time is not None}
+
+
+class LogParser:
+    """Turns the lines of a log into records, one line at a time.
+
+    With started=False the first line is parsed like any other; rt.sh
+    starts a RegressionTests log with the output of date, the logs of the
+    compile and test jobs start right away.
+    """
+
+    def __init__(self, started=True):
+        self.expect_date = started
+        self.baseline = None
+        self.run_dir = None
+        self.test = (None, None)
+        self.wall_time = None
+        self.max_rss = None
+        self.failed = []
+
+    def feed(self, line):
+        """Return the record a line completes, or None."""
+        line = line.rstrip('\n')
+        if self.expect_date:
+            self.expect_date = False
+            return Started(line.strip())
+        m = COMPILE_RE.match(line)
+        if m:
+            options = m.group(3).rstrip()
+            cached = options.endswith(CACHED_SUFFIX)
+            if cached:
+                options = options[:-len(CACHED_SUFFIX)]
+            return CompileTime(m.group(1), int(m.group(2)), options, cached)
+        m = BASELINE_RE.match(line)
+        if m:
+            self.baseline = m.group(1)
+            return None
+        m = RUN_DIR_RE.match(line)
+        if m:
+            self.run_dir = m.group(1)
+            return None
+        m = CHECK_RE.match(line)
+        if m:
+            self.test = (m.group(1), m.group(2))
+            self.wall_time = None
+            self.max_rss = None
+            return None
+        m = FILE_RE.match(line)
+        if m:
+            return FileCheck(self.test[0], self.test[1], m.group(1),
+                             m.group(2), m.group(3), m.group(4))
+        m = WALL_TIME_RE.search(line)
+        if m:
+            self.wall_time = float(m.group(1))
+            return None
+        m = MAX_RSS_RE.match(line)
+        if m:
+            self.max_rss = int(m.group(1))
+            return None
+        m = RESULT_RE.match(line)
+        if m:
+            result = TestResult(m.group(1), m.group(2), m.group(3),
+                                self.wall_time, int(m.group(4) or 1),
+                                self.baseline, self.max_rss, self.run_dir)
+            self.baseline = None
+            self.run_dir = None
+            self.test = (None, None)
+            self.wall_time = None
+            self.max_rss = None
+            return result
+        m = FAILED_RE.match(line)
+        if m:
+            self.failed.append(m.group(1).strip())
+            return None
+        m = SUMMARY_RE.match(line)
+        if m:
+            return Summary(m.group(1) == 'WAS SUCCESSFUL', tuple(self.failed),
+                           m.group(1) != 'WAS NOT RUN')
+        return None
+
+
+def records(lines, started=True):
+    """Yield the records of the lines of a log."""
+    parser = LogParser(started)
+    for line in lines:
+        record = parser.feed(line)
+        if record is not None:
+            yield record
+
+
+def parse_log(path):
+    """Parse a RegressionTests_<machine>.log file."""
+    with open(path, errors='replace') as f:
+        return read_log(f)
+
+
+def read_log(lines):
+    """Parse the lines of a RegressionTests_<machine>.log file."""
+    log = RegressionLog()
+    for record in records(lines):
+        if isinstance(record, Started):
+            log.started = record.date
+        elif isinstance(record, CompileTime):
+            if not record.cached:
+                log.compiles.append(record)
+        elif isinstance(record, FileCheck):
+            log.checks.append(record)
+        elif isinstance(record, TestResult):
+            log.tests.append(record)
+        elif isinstance(record, Summary):
+            log.summary = record
+    return log
+
+
+def job_log_done(path):
+    """Return the lines of the log of a compile or test job once the job
+    has written all of it, None before."""
+    with open(path, errors='replace') as f:
+        lines = f.readlines()
+    if not lines or not lines[-1].endswith('\n'):
+        return None
+    name = os.path.basename(path)
+    if name.startswith('compile_'):
+        return lines
+    if any(RESULT_RE.match(line) for line in lines):
+        return lines
+    return None
+
+
+def follow(log_dir, regression_log=None, interval=30, since=None):
+    """Yield the records of a running rt.sh as its jobs finish.
+
+    The logs in log_dir written since `since` (default now) are parsed once
+    they are complete; the generator ends with the summary rt.sh writes to
+    regression_log, or never without one.
+    """
+    since = time.time() if since is None else since
+    done = set()
+    while True:
+        for path in sorted(glob.glob(os.path.join(log_dir, 'compile_*_time.log')) +
+                           glob.glob(os.path.join(log_dir, 'rt_*.log'))):
+            try:
+                if path in done or os.path.getmtime(path) < since:
+                    continue
+                lines = job_log_done(path)
+            except OSError:
+                continue
+            if lines is not None:
+                done.add(path)
+                yield from records(lines, started=False)
+        if regression_log and os.path.exists(regression_log) and \
+                os.path.getmtime(regression_log) >= since:
+            summary = parse_log(regression_log).summary
+            if summary is not None:
+                yield summary
+                return
+        time.sleep(interval)
+
+
+def as_json(record):
+    return json.dumps(dict(record._asdict(), record=type(record).__name__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--json', action='store_true',
+                        help='print one JSON record per line')
+    parser.add_argument('--follow', metavar='LOG_DIR',
+                        help='print the records of a running rt.sh')
+    parser.add_argument('--log', help='with --follow, the RegressionTests log')
+    parser.add_argument('--interval', type=float, default=30,
+                        help='with --follow, seconds between checks')
+    parser.add_argument('logs', nargs='*')
+    args = parser.parse_args()
+
+    if args.follow:
+        for record in follow(args.follow, args.log, args.interval):
+            print(as_json(record), flush=True)
+        return
+    if not args.logs:
+        parser.error('no log given')
+    for path in args.logs:
+        if args.json:
+            with open(path, errors='replace') as f:
+                for record in records(f):
+                    print(as_json(record))
+            continue
+        log = parse_log(path)
+        print(path)
+        for c in log.compiles:
+            print(f'  compile {c.nr} {c.seconds:6d} s  {c.options}')
+        for t in log.tests:
+            wall = f'{t.wall_time:9.1f}' if t.wall_time is not None else '        -'
+            print(f'  test {t.nr} {wall} s  {t.status}  {t.name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""Performance history of the regression tests in an SQLite database.
+
+RegressionTests_<machine>.log files are ingested with the compile elapsed
+times and the model wall time of every test, keyed by machine, compiler,
+baseline date (BL_DATE) and the git commit of the log.  A log is only
+ingested once, whatever its path; a log ingested by rt.sh gets its commit
+when ingest-git later finds it in the history.  Runs are ordered by commit
+time, or by ingest time for logs not committed yet.
+
+    rt_perfdb.py ingest [--commit <sha>] <log> [<log> ...]
+    rt_perfdb.py ingest-git [--since <rev>] [<log> ...]
+    rt_perfdb.py trend <test> [--machine <MACHINE_ID>] [--compiler <compiler>]
+    rt_perfdb.py compile-trend [--machine ...] [--compiler ...] -- <MAKE_OPT>
+    rt_perfdb.py summary
+    rt_perfdb.py check <test> --machine <MACHINE_ID> --out <RUNDIR>/out
+                       [--max-rss <KB>]
+    rt_perfdb.py walltime <test> --machine <MACHINE_ID> --default <minutes>
+                          [--margin <factor>]
+
+ingest-git walks the git history of the logs (by default all
+RegressionTests_*.log files next to this script) and ingests every
+committed version of them.  The versions it has read are recorded, so a
+later run only reads the new ones.  The database is $RT_PERFDB, by default
+~/.cache/rt_perf.db.
+
+check compares the wall time (and memory high-water mark) of a finished
+test with its recent history on the same machine and compiler.  It exits
+with status 3 if the test is slower (or larger) than both --threshold
+times the mean and --sigmas standard deviations above it.
+
+walltime prints the minutes of WLCLK to request for a test: the longest
+model wall time of its recent passing runs times --margin, plus the time a
+job spends outside the model.  It is never more than --default, the WLCLK
+of the test file, which is printed for tests with too little history.
+"""
+import os
+import re
+import sys
+import glob
+import sqlite3
+import hashlib
+import math
+import time
+import argparse
+import statistics
+import subprocess
+
+import rt_log
+
+DEFAULT_DB = os.getenv('RT_PERFDB') or os.path.join(
+    os.getenv('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'rt_perf.db')
+
+PERF_REGRESSION = 3
+
+# minutes a job spends before and after the model: loading modules,
+# starting MPI, writing the last output files
+WLCLK_OVERHEAD = 5
+
+LOG_NAME_RE = re.compile(r'RegressionTests_(?:weekly_)?(.+)\.log$')
+BL_DATE_RE = re.compile(r'develop-(\d{8})')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS logs (
+    id        INTEGER PRIMARY KEY,
+    digest    TEXT UNIQUE NOT NULL,
+    machine   TEXT NOT NULL,
+    compiler  TEXT NOT NULL,
+    bl_date   TEXT,
+    git_commit TEXT,
+    committed INTEGER,
+    started   TEXT,
+    path      TEXT,
+    ingested  INTEGER
+);
+CREATE TABLE IF NOT EXISTS compiles (
+    log_id    INTEGER NOT NULL REFERENCES logs(id),
+    nr        TEXT NOT NULL,
+    seconds   INTEGER NOT NULL,
+    options   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tests (
+    log_id    INTEGER NOT NULL REFERENCES logs(id),
+    nr        TEXT NOT NULL,
+    test      TEXT NOT NULL,
+    status    TEXT NOT NULL,
+    wall_time REAL,
+    tries     INTEGER NOT NULL,
+    max_rss   INTEGER
+);
+CREATE TABLE IF NOT EXISTS git_versions (
+    name      TEXT NOT NULL,
+    sha       TEXT NOT NULL,
+    PRIMARY KEY (name, sha)
+);
+CREATE INDEX IF NOT EXISTS logs_machine ON logs(machine, compiler);
+CREATE INDEX IF NOT EXISTS tests_test ON tests(test, log_id);
+CREATE INDEX IF NOT EXISTS compiles_log ON compiles(log_id);
+'''
+
+
+def connect(db=DEFAULT_DB):
+    """Open the database, creating it if necessary."""
+    if os.path.dirname(db):
+        os.makedirs(os.path.dirname(db), exist_ok=True)
+    conn = sqlite3.connect(db, timeout=60)
+    conn.executescript(SCHEMA)
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(tests)')]
+    if 'max_rss' not in columns:
+        # databases created before memory was recorded
+        conn.execute('ALTER TABLE tests ADD COLUMN max_rss INTEGER')
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(logs)')]
+    if 'ingested' not in columns:
+        conn.execute('ALTER TABLE logs ADD COLUMN ingested INTEGER')
+    return conn
+
+
+def machine_compiler(path):
+    """Return (MACHINE_ID, compiler) from the name of a log file.
+
+    Logs of machines with a single compiler (RegressionTests_wcoss2.log)
+    are intel.
+    """
+    m = LOG_NAME_RE.search(os.path.basename(path))
+    if not m:
+        raise ValueError(f'{path} is not a RegressionTests_<machine>.log file')
+    machine = m.group(1)
+    compiler = machine.split('.')[1] if '.' in machine else 'intel'
+    return machine, compiler
+
+
+def ingest(conn, path, text, git_commit=None, committed=None):
+    """Add one log to the database.  Return False if it was already there.
+
+    A log already there without a commit gets git_commit and committed.
+    """
+    digest = hashlib.sha1(text.encode()).hexdigest()
+    if conn.execute('SELECT 1 FROM logs WHERE digest = ?',
+                    (digest,)).fetchone():
+        if git_commit and committed is not None:
+            with conn:
+                conn.execute('UPDATE logs SET git_commit = ?, committed = ?'
+                             ' WHERE digest = ? AND committed IS NULL',
+                             (git_commit, committed, digest))
+        return False
+    machine, compiler = machine_compiler(path)
+    log = rt_log.read_log(text.splitlines())
+    bl_date = None
+    for t in log.tests:
+        m = BL_DATE_RE.search(t.baseline or '')
+        if m:
+            bl_date = m.group(1)
+            break
+
+    with conn:
+        cur = conn.execute(
+            'INSERT INTO logs (digest, machine, compiler, bl_date, git_commit,'
+            ' committed, started, path, ingested)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (digest, machine, compiler, bl_date, git_commit, committed,
+             log.started, os.path.basename(path), int(time.time())))
+        log_id = cur.lastrowid
+        conn.executemany(
+            'INSERT INTO compiles (log_id, nr, seconds, options)'
+            ' VALUES (?, ?, ?, ?)',
+            [(log_id, c.nr, c.seconds, c.options) for c in log.compiles])
+        conn.executemany(
+            'INSERT INTO tests (log_id, nr, test, status, wall_time, tries,'
+            ' max_rss) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(log_id, t.nr, t.name, t.status, t.wall_time, t.tries, t.max_rss)
+             for t in log.tests])
+    return True
+
+
+def git(*args, cwd=None):
+    return subprocess.run(['git'] + list(args), cwd=cwd, check=True,
+                          stdout=subprocess.PIPE,
+                          universal_newlines=True).stdout
+
+
+def ingest_git(conn, paths, since=None):
+    """Ingest every committed version of the given logs.
+
+    Versions read by an earlier call are skipped without git show.
+    Returns the number of versions added.
+    """
+    added = 0
+    for path in paths:
+        cwd = os.path.dirname(os.path.abspath(path))
+        name = os.path.basename(path)
+        revs = f'{since}..HEAD' if since else 'HEAD'
+        history = git('log', '--format=%H %ct', revs, '--', name, cwd=cwd)
+        known = {row[0] for row in conn.execute(
+            'SELECT sha FROM git_versions WHERE name = ?', (name,))}
+        for line in history.splitlines():
+            sha, committed = line.split()
+            if sha in known:
+                continue
+            try:
+                text = git('show', f'{sha}:./{name}', cwd=cwd)
+            except subprocess.CalledProcessError:
+                text = None     # the log was deleted in this commit
+            if text is not None:
+                added += ingest(conn, name, text, sha, int(committed))
+            with conn:
+                conn.execute('INSERT OR IGNORE INTO git_versions (name, sha)'
+                             ' VALUES (?, ?)', (name, sha))
+    return added
+
+
+def history(conn, test, machine=None, compiler=None):
+    """Return (started, git_commit, bl_date, machine, compiler, wall_time)
+    rows of a test, oldest first."""
+    sql = ('SELECT logs.started, logs.git_commit, logs.bl_date, logs.machine,'
+           ' logs.compiler, tests.wall_time FROM tests'
+           ' JOIN logs ON logs.id = tests.log_id'
+           ' WHERE tests.test = ? AND tests.wall_time IS NOT NULL')
+    params = [test]
+    if machine:
+        sql += ' AND logs.machine = ?'
+        params.append(machine)
+    if compiler:
+        sql += ' AND logs.compiler = ?'
+        params.append(compiler)
+    sql += ' ORDER BY COALESCE(logs.committed, logs.ingested), logs.id'
+    return conn.execute(sql, params).fetchall()
+
+
+def compile_history(conn, make_opt, machine=None, compiler=None):
+    """Return (started, git_commit, machine, compiler, seconds, options) rows
+    of the builds made with all options of make_opt, oldest first."""
+    sql = ('SELECT logs.started, logs.git_commit, logs.machine, logs.compiler,'
+           ' compiles.seconds, compiles.options FROM compiles'
+           ' JOIN logs ON logs.id = compiles.log_id WHERE 1')
+    params = []
+    if machine:
+        sql += ' AND logs.machine = ?'
+        params.append(machine)
+    if compiler:
+        sql += ' AND logs.compiler = ?'
+        params.append(compiler)
+    sql += ' ORDER BY COALESCE(logs.committed, logs.ingested), logs.id'
+    wanted = set(make_opt.split())
+    return [row for row in conn.execute(sql, params)
+            if wanted <= set(row[5].split())]
+
+
+def reference(conn, test, machine, compiler=None, column='wall_time',
+              last=10):
+    """Return the last values of a column for passing runs of a test."""
+    sql = (f'SELECT tests.{column} FROM tests JOIN logs ON logs.id = tests.log_id'
+           f' WHERE tests.test = ? AND logs.machine = ? AND tests.status = ?'
+           f' AND tests.{column} IS NOT NULL')
+    params = [test, machine, 'PASS']
+    if compiler:
+        sql += ' AND logs.compiler = ?'
+        params.append(compiler)
+    sql += (' ORDER BY COALESCE(logs.committed, logs.ingested) DESC,'
+            ' logs.id DESC LIMIT ?')
+    params.append(last)
+    return [row[0] for row in conn.execute(sql, params)]
+
+
+def regression(value, history, threshold=0.1, sigmas=3.0):
+    """Return (is slower, mean, limit) of a value against its history.
+
+    A value is a regression if it exceeds the mean of the history both by
+    the relative threshold and by the given number of standard deviations,
+    so neither a noisy history nor a single reference flags small changes.
+    """
+    mean = statistics.mean(history)
+    std = statistics.stdev(history) if len(history) > 1 else 0.0
+    limit = mean + max(threshold * mean, sigmas * std)
+    return value > limit, mean, limit
+
+
+def walltime(history, default, margin=1.5, minimum=10, min_runs=3):
+    """Return the minutes of WLCLK for a test with the given wall times."""
+    if len(history) < min_runs:
+        return default
+    minutes = math.ceil(max(history) * margin / 60) + WLCLK_OVERHEAD
+    return min(default, max(minimum, minutes))
+
+
+def read_wall_time(out):
+    """Return the wall time the model reports in its output, or None."""
+    with open(out, errors='replace') as f:
+        for line in f:
+            m = rt_log.WALL_TIME_RE.search(line)
+            if m:
+                return float(m.group(1))
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--db', default=DEFAULT_DB,
+                        help=f'database file (default {DEFAULT_DB})')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+    p = sub.add_parser('ingest', help='add log files')
+    p.add_argument('logs', nargs='+')
+    p.add_argument('--commit', help='git commit the logs belong to')
+    p = sub.add_parser('ingest-git', help='add the git history of log files')
+    p.add_argument('logs', nargs='*')
+    p.add_argument('--since', help='only commits after this revision')
+    for name in ('trend', 'compile-trend'):
+        p = sub.add_parser(name, help='wall time history of a test' if
+                           name == 'trend' else 'elapsed time history of a build')
+        p.add_argument('test' if name == 'trend' else 'make_opt')
+        p.add_argument('--machine')
+        p.add_argument('--compiler')
+    sub.add_parser('summary', help='logs in the database')
+    p = sub.add_parser('check', help='compare a test with its history')
+    p.add_argument('test')
+    p.add_argument('--machine', required=True)
+    p.add_argument('--compiler')
+    p.add_argument('--out', required=True, help='model output (RUNDIR/out)')
+    p.add_argument('--max-rss', type=int, help='memory high-water mark, KB')
+    p.add_argument('--threshold', type=float, default=0.1,
+                   help='relative slowdown to report (default 0.1)')
+    p.add_argument('--sigmas', type=float, default=3.0,
+                   help='standard deviations above the mean (default 3)')
+    p.add_argument('--last', type=int, default=10,
+                   help='number of earlier runs to compare with (default 10)')
+    p = sub.add_parser('walltime', help='WLCLK to request for a test')
+    p.add_argument('test')
+    p.add_argument('--machine', required=True)
+    p.add_argument('--compiler')
+    p.add_argument('--default', type=int, required=True,
+                   help='WLCLK of the test file, minutes')
+    p.add_argument('--margin', type=float, default=1.5,
+                   help='factor applied to the longest wall time (default 1.5)')
+    p.add_argument('--minimum', type=int, default=10,
+                   help='shortest WLCLK to request, minutes (default 10)')
+    p.add_argument('--last', type=int, default=10,
+                   help='number of earlier runs to consider (default 10)')
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+
+    if args.command == 'ingest':
+        for path in args.logs:
+            with open(path, errors='replace') as f:
+                added = ingest(conn, path, f.read(), args.commit)
+            print(f'{path}: {"added" if added else "already in database"}')
+
+    elif args.command == 'ingest-git':
+        logs = args.logs or sorted(glob.glob(os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'RegressionTests_*.log')))
+        print(f'{ingest_git(conn, logs, args.since)} logs added')
+
+    elif args.command == 'trend':
+        rows = history(conn, args.test, args.machine, args.compiler)
+        if not rows:
+            sys.exit(f'No wall times of {args.test} in {args.db}')
+        for started, sha, bl_date, machine, compiler, wall_time in rows:
+            print(f'{started or "-":30s} {(sha or "-")[:10]:10s} {bl_date or "-":8s} '
+                  f'{machine:16s} {wall_time:10.2f}')
+
+    elif args.command == 'compile-trend':
+        rows = compile_history(conn, args.make_opt, args.machine, args.compiler)
+        if not rows:
+            sys.exit(f'No builds with {args.make_opt} in {args.db}')
+        for started, sha, machine, compiler, seconds, _ in rows:
+            print(f'{started or "-":30s} {(sha or "-")[:10]:10s} {machine:16s} '
+                  f'{seconds:6d}')
+
+    elif args.command == 'summary':
+        for machine, compiler, nlogs, ntests in conn.execute(
+                'SELECT logs.machine, logs.compiler, COUNT(DISTINCT logs.id),'
+                ' COUNT(tests.log_id) FROM logs'
+                ' LEFT JOIN tests ON tests.log_id = logs.id'
+                ' GROUP BY logs.machine, logs.compiler'
+                ' ORDER BY logs.machine, logs.compiler'):
+            print(f'{machine:20s} {compiler:6s} {nlogs:4d} logs {ntests:6d} tests')
+
+    elif args.command == 'check':
+        measured = [('wall time', 'wall_time', read_wall_time(args.out), 's'),
+                    ('max memory', 'max_rss', args.max_rss, 'KB')]
+        slower = False
+        for label, column, value, unit in measured:
+            if value is None:
+                continue
+            runs = reference(conn, args.test, args.machine, args.compiler,
+                             column, args.last)
+            if not runs:
+                print(f'{label} {value} {unit}, no reference')
+                continue
+            bad, mean, limit = regression(value, runs, args.threshold,
+                                          args.sigmas)
+            print(f'{label} {value:.2f} {unit}, reference {mean:.2f} {unit} '
+                  f'({100 * (value / mean - 1):+.1f}%, limit {limit:.2f}, '
+                  f'{len(runs)} runs){" EXCEEDS LIMIT" if bad else ""}')
+            slower = slower or bad
+        sys.exit(PERF_REGRESSION if slower else 0)
+
+    elif args.command == 'walltime':
+        runs = reference(conn, args.test, args.machine, args.compiler,
+                         'wall_time', args.last)
+        print(walltime(runs, args.default, args.margin, args.minimum))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""Parse rt.conf style files into a regression test plan.
+
+A plan is the list of COMPILE groups of a conf file, each with the RUN
+entries that use its executable.  Parsed plans are cached on disk, keyed by
+the path, size and modification time of the conf file, so a conf file is
+only parsed again after it has been edited.
+
+    rt_plan.py lines <conf> --machine <MACHINE_ID> [--create-baseline]
+    rt_plan.py single <conf> --machine <MACHINE_ID> <test>
+    rt_plan.py tests <conf> [--machine <MACHINE_ID>]
+    rt_plan.py compile <conf> <test> [--machine <MACHINE_ID>]
+    rt_plan.py dependents <conf> <test>
+    rt_plan.py builds <conf> [<conf> ...] --machine <MACHINE_ID>
+    rt_plan.py canonical -- <MAKE_OPT>
+
+"lines" prints the entries rt.sh has to process on a machine, one per line
+with '|' separated fields:
+
+    COMPILE|<JOB_NR>|<MAKE_OPT>|<fv3 flag>|<JOB_NR of an identical build>
+    RUN|<JOB_NR>|<test>|<fv3 flag>|<DEP_RUN>|<DATE_35D>|<restarts>
+
+JOB_NR counts all entries of the conf file, whether they run on the
+machine or not, as rt.sh always numbered them.  A COMPILE whose options are
+the same as those of an earlier COMPILE on the machine, up to their order
+(see canonical_options), names that COMPILE in its last field; rt.sh then
+runs its tests with the executable of the earlier build.  The restarts of
+a RUN are the tests on the machine whose DEP_RUN it is, comma separated:
+they restart from its output, and can start as soon as it has written
+their restart files.
+
+"builds" counts the distinct builds of conf files on a machine.  Each conf
+file is run by its own rt.sh, rt_gnu.conf with the GNU compiler, so builds
+are only the same within a conf file.
+"""
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+from typing import NamedTuple, Optional
+
+CACHE_VERSION = 1
+CACHE_DIR = os.getenv('RT_PLAN_CACHE', os.path.join(
+    os.getenv('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'rt_plan'))
+
+
+class Compile(NamedTuple):
+    job_nr: int
+    make_opt: str
+    machines: str
+    fv3: bool
+    line: str
+
+
+class Run(NamedTuple):
+    job_nr: int
+    name: str
+    machines: str
+    fv3: bool
+    dep_run: str
+    date_35d: str
+    compile: Optional[int]      # index in Plan.compiles
+    line: str
+
+
+def machine_match(machines, machine_id):
+    """Return True if an entry with this MACHINES spec runs on machine_id.
+
+    The spec is empty, '+ <machines>' (only these) or '- <machines>' (all
+    but these), matched the way rt.sh does with [[ $MACHINES =~ $MACHINE_ID ]].
+    """
+    if machines == '':
+        return True
+    if machines.startswith('-'):
+        return re.search(machine_id, machines) is None
+    if machines.startswith('+'):
+        return re.search(machine_id, machines) is not None
+    raise ValueError(f"MACHINES=|{machines}|: MACHINES spec must be either an "
+                     "empty string or start with either '+' or '-'")
+
+
+def canonical_options(make_opt):
+    """Return the build options of make_opt in a canonical form.
+
+    Options are sorted, repeated options and CCPP suites removed, a later
+    -D<VAR>= overrides an earlier one as it does for cmake, and the suites
+    of -DCCPP_SUITES are sorted.  Values are not otherwise touched, since
+    compile.sh matches some of them literally.
+    """
+    defines = {}
+    others = set()
+    for opt in make_opt.split():
+        if opt.startswith('-D') and '=' in opt:
+            name, value = opt[2:].split('=', 1)
+            if name == 'CCPP_SUITES':
+                value = ','.join(sorted(set(value.split(',')) - {''}))
+            defines[name] = value
+        else:
+            others.add(opt)
+    return ' '.join(sorted(others | {f'-D{n}={v}' for n, v in defines.items()}))
+
+
+def identical_builds(entries):
+    """Return {JOB_NR: JOB_NR of the first identical build} of the COMPILE
+    entries that build the same executable as an earlier one."""
+    first = {}
+    same = {}
+    for entry in entries:
+        if isinstance(entry, Compile):
+            key = canonical_options(entry.make_opt)
+            if key in first:
+                same[entry.job_nr] = first[key]
+            else:
+                first[key] = entry.job_nr
+    return same
+
+
+def restart_dependents(entries):
+    """Return {test: [tests with it as DEP_RUN]} of the RUN entries."""
+    dependents = {}
+    for entry in entries:
+        if isinstance(entry, Run) and entry.dep_run:
+            dependents.setdefault(entry.dep_run, []).append(entry.name)
+    return dependents
+
+
+def parse_conf(path):
+    """Parse a conf file into lists of Compile and Run entries.
+
+    Raises ValueError for a line that is neither a COMPILE nor a RUN.
+    """
+    compiles = []
+    runs = []
+    job_nr = 0
+    with open(path) as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            job_nr += 1
+            fields = [field.strip() for field in line.split('|')]
+            fields += [''] * (6 - len(fields))
+            if line.startswith('COMPILE'):
+                compiles.append(Compile(job_nr, fields[1], fields[2],
+                                        'fv3' in fields[3], line))
+            elif line.startswith('RUN'):
+                runs.append(Run(job_nr, fields[1], fields[2], 'fv3' in fields[3],
+                                fields[4], fields[5],
+                                len(compiles) - 1 if compiles else None, line))
+            else:
+                raise ValueError(f'{path}:{lineno}: Unknown command {line}')
+    return compiles, runs
+
+
+class Plan:
+    """A parsed conf file with indexes by test name and dependency."""
+
+    def __init__(self, compiles, runs):
+        self.compiles = compiles
+        self.runs = runs
+        self.by_name = {}
+        self.dependents_of = {}
+        for i, run in enumerate(runs):
+            self.by_name.setdefault(run.name, []).append(i)
+            if run.dep_run:
+                self.dependents_of.setdefault(run.dep_run, []).append(i)
+
+    def entries(self):
+        """Return all COMPILE and RUN entries in conf file order."""
+        return sorted(self.compiles + self.runs, key=lambda e: e.job_nr)
+
+    def select(self, machine_id, create_baseline=False):
+        """Return the entries rt.sh processes on machine_id, in order."""
+        selected = []
+        for entry in self.entries():
+            if create_baseline and not entry.fv3:
+                continue
+            if machine_match(entry.machines, machine_id):
+                selected.append(entry)
+        return selected
+
+    def tests_for(self, machine_id=None):
+        """Return the RUN entries that run on machine_id (all if None)."""
+        if machine_id is None:
+            return list(self.runs)
+        return [r for r in self.runs if machine_match(r.machines, machine_id)]
+
+    def build_of(self, test, machine_id=None):
+        """Return (Compile, Run) of the first RUN of a test that has a build.
+
+        With machine_id, the build is the last COMPILE before the test that
+        is built on that machine, as rt.sh -n has always picked it.
+        """
+        for i in self.by_name.get(test, []):
+            run = self.runs[i]
+            for c in range(run.compile if run.compile is not None else -1,
+                           -1, -1):
+                if machine_id is None or machine_match(
+                        self.compiles[c].machines, machine_id):
+                    return self.compiles[c], run
+        return None
+
+    def compile_for(self, test, machine_id=None):
+        """Return the Compile entry that builds the executable of a test."""
+        build = self.build_of(test, machine_id)
+        return build[0] if build else None
+
+    def dependents(self, test, transitive=False):
+        """Return the RUN entries that need the output of a test."""
+        found = []
+        queue = [test]
+        while queue:
+            for i in self.dependents_of.get(queue.pop(0), []):
+                run = self.runs[i]
+                if run not in found:
+                    found.append(run)
+                    if transitive:
+                        queue.append(run.name)
+        return found
+
+
+def cache_file(path):
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    return os.path.join(CACHE_DIR, f'{key}.json')
+
+
+def load_plan(path, use_cache=True):
+    """Return the Plan of a conf file, parsing it only if it has changed."""
+    st = os.stat(path)
+    stamp = [CACHE_VERSION, os.path.abspath(path), st.st_size, st.st_mtime_ns]
+    if use_cache:
+        try:
+            with open(cache_file(path)) as f:
+                cached = json.load(f)
+            if cached['stamp'] == stamp:
+                return Plan([Compile(*c) for c in cached['compiles']],
+                            [Run(*r) for r in cached['runs']])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    compiles, runs = parse_conf(path)
+    if use_cache:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp = f'{cache_file(path)}.{os.getpid()}'
+            with open(tmp, 'w') as f:
+                json.dump({'stamp': stamp, 'compiles': compiles,
+                           'runs': runs}, f)
+            os.replace(tmp, cache_file(path))
+        except OSError:
+            pass
+    return Plan(compiles, runs)
+
+
+def entry_line(entry, same_as=None, restarts=()):
+    """Return the '|' separated line rt.sh reads for an entry.
+
+    same_as is the JOB_NR of an earlier identical build of a COMPILE entry,
+    restarts the tests that restart from a RUN entry.
+    """
+    cb = 'fv3' if entry.fv3 else ''
+    if isinstance(entry, Compile):
+        same = f'{same_as:03d}' if same_as is not None else ''
+        return f'COMPILE|{entry.job_nr:03d}|{entry.make_opt}|{cb}|{same}'
+    return (f'RUN|{entry.job_nr:03d}|{entry.name}|{cb}|{entry.dep_run}|'
+            f'{entry.date_35d}|{",".join(restarts)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--no-cache', action='store_true',
+                        help='always parse the conf file')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+    p = sub.add_parser('lines', help='entries to process on a machine')
+    p.add_argument('conf')
+    p.add_argument('--machine', required=True)
+    p.add_argument('--create-baseline', action='store_true')
+    p = sub.add_parser('single', help='conf file running a single test')
+    p.add_argument('conf')
+    p.add_argument('test')
+    p.add_argument('--machine', required=True)
+    p = sub.add_parser('tests', help='tests that run on a machine')
+    p.add_argument('conf')
+    p.add_argument('--machine')
+    p = sub.add_parser('compile', help='build options of a test')
+    p.add_argument('conf')
+    p.add_argument('test')
+    p.add_argument('--machine')
+    p = sub.add_parser('dependents', help='tests that depend on a test')
+    p.add_argument('conf')
+    p.add_argument('test')
+    p.add_argument('--transitive', action='store_true')
+    p = sub.add_parser('builds', help='distinct builds of conf files')
+    p.add_argument('conf', nargs='+')
+    p.add_argument('--machine', required=True)
+    p = sub.add_parser('canonical', help='build options in canonical form')
+    p.add_argument('make_opt')
+    args = parser.parse_args()
+
+    if args.command == 'canonical':
+        print(canonical_options(args.make_opt))
+        return
+
+    try:
+        if args.command == 'builds':
+            builds = {}
+            total = 0
+            for conf in args.conf:
+                for entry in load_plan(conf, not args.no_cache).select(args.machine):
+                    if isinstance(entry, Compile):
+                        total += 1
+                        # conf files are built with their own compiler
+                        builds.setdefault((conf, canonical_options(entry.make_opt)),
+                                          []).append(f'{conf}:{entry.job_nr:03d}')
+            for (_, options), users in builds.items():
+                print(f'{" ".join(users)}  {options}')
+            print(f'{total} COMPILE lines, {len(builds)} distinct builds, '
+                  f'{total - len(builds)} builds saved')
+            return
+
+        plan = load_plan(args.conf, use_cache=not args.no_cache)
+
+        if args.command == 'lines':
+            entries = plan.select(args.machine, args.create_baseline)
+            same = identical_builds(entries)
+            restarts = restart_dependents(entries)
+            for entry in entries:
+                print(entry_line(entry, same.get(entry.job_nr),
+                                 restarts.get(getattr(entry, 'name', None), ())))
+
+        elif args.command == 'single':
+            build = plan.build_of(args.test, args.machine)
+            if build is None:
+                sys.exit(1)
+            for entry in build:
+                print(entry.line)
+
+        elif args.command == 'tests':
+            for run in plan.tests_for(args.machine):
+                print(run.name)
+
+        elif args.command == 'compile':
+            compile_entry = plan.compile_for(args.test, args.machine)
+            if compile_entry is None:
+                sys.exit(1)
+            print(compile_entry.make_opt)
+
+        elif args.command == 'dependents':
+            for run in plan.dependents(args.test, args.transitive):
+                print(run.name)
+    except ValueError as e:
+        print(f'ERROR: {e}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""Order compile and run jobs of a regression test by their critical path.
+
+The duration of each build and test is taken from earlier
+RegressionTests_<machine>.log files.  Every job is prioritized by the
+longest chain of work that still depends on it (compile -> run -> restart
+run), and the jobs are then packed into the build and job slots with list
+scheduling, the way ecFlow fills its max_builds/max_jobs limits.  Builds of
+WW3 applications run one at a time, as rt.sh serializes them.
+
+    rt_schedule.py <conf> --machine <MACHINE_ID> --log <log> [--log <log> ...]
+                   [--max-builds 10] [--max-jobs 30] [--lines]
+
+By default (dry run) the predicted makespan of the rt.conf order and of the
+critical path order is printed.  With --lines the entries are printed in
+critical path order, in the format of "rt_plan.py lines", for rt.sh to read.
+"""
+import sys
+import heapq
+import argparse
+import statistics
+
+import rt_log
+import rt_plan
+
+WW3_APPS = ('-DAPP=ATMW', '-DAPP=S2SW', '-DAPP=HAFSW', '-DAPP=HAFS-ALL')
+
+# Used when no log has a duration for any build or test
+DEFAULT_COMPILE_SECONDS = 600
+DEFAULT_RUN_SECONDS = 900
+
+
+class Task:
+    """A build or test run with its predicted duration and dependencies."""
+
+    def __init__(self, entry, duration, deps):
+        self.entry = entry
+        self.duration = duration
+        self.deps = deps                # indexes of tasks that must finish first
+        self.successors = []
+        self.critical_path = 0.0        # duration of the longest chain from here
+        self.is_compile = isinstance(entry, rt_plan.Compile)
+        self.ww3 = self.is_compile and any(
+            app in entry.make_opt.upper() for app in WW3_APPS)
+        self.group = None               # index of the task of its build
+
+    @property
+    def name(self):
+        if self.is_compile:
+            return f'compile_{self.entry.job_nr:03d}'
+        return self.entry.name
+
+
+def durations(logs, job_overhead):
+    """Return functions giving the predicted duration of builds and tests."""
+    wall_times = {}
+    for log in logs:
+        for name, seconds in log.wall_times().items():
+            wall_times.setdefault(name, []).append(seconds)
+    runs = {name: statistics.mean(t) + job_overhead
+            for name, t in wall_times.items()}
+    compiles = [c.seconds for log in logs for c in log.compiles]
+    default_run = statistics.median(runs.values()) if runs else DEFAULT_RUN_SECONDS
+    default_compile = (statistics.median(compiles) if compiles
+                       else DEFAULT_COMPILE_SECONDS)
+
+    def compile_seconds(make_opt):
+        known = [s for s in (log.compile_seconds(make_opt) for log in logs)
+                 if s is not None]
+        return statistics.mean(known) if known else default_compile
+
+    def run_seconds(name):
+        return runs.get(name, default_run)
+
+    return compile_seconds, run_seconds
+
+
+def build_tasks(entries, compile_seconds, run_seconds):
+    """Return the tasks of the selected conf file entries.
+
+    A COMPILE identical to an earlier one takes no time, but its tests wait
+    for the earlier build.
+    """
+    tasks = []
+    last_run = {}
+    task_of = {}
+    same = rt_plan.identical_builds(entries)
+    group = None
+    for entry in entries:
+        if isinstance(entry, rt_plan.Compile):
+            group = len(tasks)
+            task_of[entry.job_nr] = group
+            if entry.job_nr in same:
+                task = Task(entry, 0.0, [task_of[same[entry.job_nr]]])
+            else:
+                task = Task(entry, compile_seconds(entry.make_opt), [])
+        else:
+            deps = [group] if group is not None else []
+            if entry.dep_run and entry.dep_run in last_run:
+                deps.append(last_run[entry.dep_run])
+            task = Task(entry, run_seconds(entry.name), deps)
+            last_run[entry.name] = len(tasks)
+        task.group = group if group is not None else len(tasks)
+        tasks.append(task)
+
+    for i, task in enumerate(tasks):
+        for d in task.deps:
+            tasks[d].successors.append(i)
+    # dependencies always come earlier in the conf file
+    for task in reversed(tasks):
+        task.critical_path = task.duration + max(
+            (tasks[s].critical_path for s in task.successors), default=0.0)
+    return tasks
+
+
+def simulate(tasks, priority, max_builds, max_jobs):
+    """Return (makespan, start times) of list scheduling by priority.
+
+    Whenever a slot frees up, the ready task with the lowest priority value
+    starts.
+    """
+    waiting = [len(t.deps) for t in tasks]
+    ready = [(priority(i), i) for i, t in enumerate(tasks) if not t.deps]
+    heapq.heapify(ready)
+    running = []
+    start = [None] * len(tasks)
+    free = {True: max_builds, False: max_jobs}
+    ww3_busy = False
+    now = 0.0
+
+    while ready or running:
+        deferred = []
+        while ready:
+            p, i = heapq.heappop(ready)
+            task = tasks[i]
+            if free[task.is_compile] == 0 or (task.ww3 and ww3_busy):
+                deferred.append((p, i))
+                continue
+            free[task.is_compile] -= 1
+            ww3_busy = ww3_busy or task.ww3
+            start[i] = now
+            heapq.heappush(running, (now + task.duration, i))
+        for item in deferred:
+            heapq.heappush(ready, item)
+
+        now, i = heapq.heappop(running)
+        finished = [i]
+        while running and running[0][0] == now:
+            finished.append(heapq.heappop(running)[1])
+        for i in finished:
+            free[tasks[i].is_compile] += 1
+            ww3_busy = ww3_busy and not tasks[i].ww3
+            for s in tasks[i].successors:
+                waiting[s] -= 1
+                if waiting[s] == 0:
+                    heapq.heappush(ready, (priority(s), s))
+    return now, start
+
+
+def conf_order(tasks):
+    return lambda i: (tasks[i].entry.job_nr,)
+
+
+def critical_path_order(tasks):
+    return lambda i: (-tasks[i].critical_path, tasks[i].entry.job_nr)
+
+
+def ordered_entries(tasks):
+    """Return the entries in critical path order, as rt.sh has to read them.
+
+    rt.sh runs each RUN with the build of the COMPILE above it, so the
+    entries stay in build groups: groups are ordered by the critical path of
+    their build, and runs within a group by their own, with every test after
+    the test it depends on.
+    """
+    groups = {}
+    for i, task in enumerate(tasks):
+        groups.setdefault(task.group, []).append(i)
+
+    def topological(items, deps_of, key):
+        items = set(items)
+        waiting = {i: len(deps_of(i) & items) for i in items}
+        ready = [(key(i), i) for i in items if waiting[i] == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            _, i = heapq.heappop(ready)
+            order.append(i)
+            for j in items:
+                if i in deps_of(j):
+                    waiting[j] -= 1
+                    if waiting[j] == 0:
+                        heapq.heappush(ready, (key(j), j))
+        return order
+
+    def group_deps(g):
+        return {tasks[d].group for i in groups[g] for d in tasks[i].deps} - {g}
+
+    key = critical_path_order(tasks)
+    entries = []
+    for g in topological(groups, group_deps, key):
+        members = groups[g]
+        head = [i for i in members if tasks[i].is_compile]
+        runs = [i for i in members if not tasks[i].is_compile]
+        runs = topological(runs, lambda i: set(tasks[i].deps), key)
+        entries += [tasks[i].entry for i in head + runs]
+    return entries
+
+
+def format_seconds(seconds):
+    seconds = int(round(seconds))
+    return f'{seconds // 3600:02d}h:{seconds % 3600 // 60:02d}m:{seconds % 60:02d}s'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('conf')
+    parser.add_argument('--machine', required=True)
+    parser.add_argument('--log', action='append', default=[],
+                        help='RegressionTests log with earlier timings')
+    parser.add_argument('--max-builds', type=int, default=10)
+    parser.add_argument('--max-jobs', type=int, default=30)
+    parser.add_argument('--job-overhead', type=float, default=60,
+                        help='seconds added to the wall time of each test '
+                             '(default 60)')
+    parser.add_argument('--create-baseline', action='store_true',
+                        help='schedule only the tests that create baselines')
+    parser.add_argument('--lines', action='store_true',
+                        help='print the entries in critical path order')
+    args = parser.parse_args()
+
+    logs = []
+    for path in args.log:
+        try:
+            logs.append(rt_log.parse_log(path))
+        except OSError as e:
+            print(f'WARNING: cannot read {path}: {e}', file=sys.stderr)
+
+    try:
+        entries = rt_plan.load_plan(args.conf).select(args.machine,
+                                                       args.create_baseline)
+    except ValueError as e:
+        sys.exit(f'ERROR: {e}')
+    tasks = build_tasks(entries, *durations(logs, args.job_overhead))
+
+    if args.lines:
+        same = rt_plan.identical_builds(entries)
+        restarts = rt_plan.restart_dependents(entries)
+        for entry in ordered_entries(tasks):
+            print(rt_plan.entry_line(entry, same.get(entry.job_nr),
+                                     restarts.get(getattr(entry, 'name', None), ())))
+        return
+
+    if not tasks:
+        print(f'No tests to run on {args.machine}')
+        return
+    conf_makespan, _ = simulate(tasks, conf_order(tasks),
+                                args.max_builds, args.max_jobs)
+    cp_makespan, start = simulate(tasks, critical_path_order(tasks),
+                                  args.max_builds, args.max_jobs)
+    longest = max(tasks, key=lambda t: t.critical_path)
+    chain = [longest]
+    while chain[-1].successors:
+        chain.append(max((tasks[s] for s in chain[-1].successors),
+                         key=lambda t: t.critical_path))
+
+    print(f'{len(tasks)} jobs, max_builds {args.max_builds}, '
+          f'max_jobs {args.max_jobs}')
+    print(f'Critical path:             {format_seconds(longest.critical_path)}'
+          f'  {" -> ".join(t.name for t in chain)}')
+    print(f'Makespan, rt.conf order:   {format_seconds(conf_makespan)}')
+    print(f'Makespan, critical path:   {format_seconds(cp_makespan)}')
+    print()
+    print('Predicted start of the first jobs in critical path order:')
+    order = sorted(range(len(tasks)), key=lambda i: (start[i], i))
+    for i in order[:20]:
+        task = tasks[i]
+        print(f'  {format_seconds(start[i])}  {format_seconds(task.duration)}'
+              f'  {task.name}')
+
+
+if __name__ == '__main__':
+    main()
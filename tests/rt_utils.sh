@@ -6,10 +6,12 @@ if [[ "$0" = "${BASH_SOURCE[0]}" ]]; then
 fi
 
 OPNREQ_TEST=${OPNREQ_TEST:-false}
+PACK_SQUEUE_CHECKED=-60
 
 qsub_id=0
 slurm_id=0
 bsub_id=0
+local_id=0
 
 interrupt_job() {
   set -x
@@ -22,11 +24,62 @@ interrupt_job() {
   elif [[ $SCHEDULER = 'lsf' ]]; then
     echo "run_util.sh: interrupt_job bsub_id = ${bsub_id}"
     bkill ${bsub_id}
+  elif [[ $SCHEDULER = 'local' ]]; then
+    echo "run_util.sh: interrupt_job local_id = ${local_id}"
+    ${PATHRT}/local_scheduler.py cancel ${LOCAL_SCHEDULER_DIR} ${local_id}
   else
     echo "run_util.sh: interrupt_job unknown SCHEDULER $SCHEDULER"
   fi
 }
 
+# Print the scheduler's status line for a job. If rt.sh started the shared
+# job monitor (job_monitor.py) and it is alive, the line is read from the
+# status file it publishes instead of querying the scheduler.
+job_query() {
+  local -r id=$1
+  if [[ -n ${JOB_MONITOR_DIR:-} && -f ${JOB_MONITOR_DIR}/status/${id} ]] && \
+     [[ -n $( find ${JOB_MONITOR_DIR}/heartbeat -mmin -5 2>/dev/null ) ]]; then
+    cat ${JOB_MONITOR_DIR}/status/${id}
+  elif [[ $SCHEDULER = 'pbs' ]]; then
+    qstat ${id}
+  elif [[ $SCHEDULER = 'slurm' ]]; then
+    squeue -u ${USER} -j ${id}
+  elif [[ $SCHEDULER = 'lsf' ]]; then
+    bjobs ${id}
+  elif [[ $SCHEDULER = 'local' ]]; then
+    ${PATHRT}/local_scheduler.py status ${LOCAL_SCHEDULER_DIR} ${id}
+  fi
+}
+
+# Whether the allocation of packed tests (rt.sh -a) is gone or will never
+# start: its daemon left "stopped" or has a stale heartbeat, or slurm (asked
+# at most once a minute) no longer lists the allocation as pending or running.
+pack_stopped() {
+  [[ -f ${PACK_DIR}/stopped ]] && return 0
+  if [[ -f ${PACK_DIR}/heartbeat && -z $( find ${PACK_DIR}/heartbeat -mmin -5 2>/dev/null ) ]]; then
+    return 0
+  fi
+  if [[ -z ${PACK_JOB_ID:-} ]] || (( SECONDS - PACK_SQUEUE_CHECKED < 60 )); then
+    return 1
+  fi
+  PACK_SQUEUE_CHECKED=$SECONDS
+  local state
+  state=$( squeue -h -j ${PACK_JOB_ID} -o %T 2>&1 ) || true
+  case ${state} in
+    ''|*'Invalid job id'*|COMPLETING|COMPLETED|CANCELLED*|FAILED|TIMEOUT|NODE_FAIL|PREEMPTED|OUT_OF_MEMORY|BOOT_FAIL|DEADLINE)
+      return 0 ;;
+  esac
+  return 1
+}
+
+# Whether a job of $1 minutes can still end within the allocation of packed
+# tests; before the allocation starts, all of its time is ahead.
+pack_has_time() {
+  pack_stopped && return 1
+  [[ -f ${PACK_DIR}/end ]] || return 0
+  (( $( date +%s ) + $1 * 60 <= $( cat ${PACK_DIR}/end ) ))
+}
+
 submit_and_wait() {
 
   [[ -z $1 ]] && exit 1
@@ -40,6 +93,9 @@ submit_and_wait() {
   ECFLOW=${ECFLOW:-false}
 
   local test_status='PASS'
+  PACK_RESUBMIT=false
+  local packed=false
+  [[ $SCHEDULER = 'local' && -n ${PACK_DIR:-} && ${LOCAL_SCHEDULER_DIR} == ${PACK_DIR} ]] && packed=true
 
   if [[ $SCHEDULER = 'pbs' ]]; then
     qsubout=$( qsub $job_card )
@@ -56,6 +112,12 @@ submit_and_wait() {
     re='Job <([0-9]+)> is submitted to queue <(.+)>.'
     [[ "${bsubout}" =~ $re ]] && bsub_id=${BASH_REMATCH[1]}
     echo "Job id ${bsub_id}"
+  elif [[ $SCHEDULER = 'local' ]]; then
+    localout=$( ${PATHRT}/local_scheduler.py submit ${LOCAL_SCHEDULER_DIR} --cores ${JOB_CORES:-1} --name ${JBNME} \
+                  --minutes ${WLCLK:-0} $job_card )
+    re='Submitted local job ([0-9]+)'
+    [[ "${localout}" =~ $re ]] && local_id=${BASH_REMATCH[1]}
+    echo "Job id ${local_id}"
   else
     echo "Unknown SCHEDULER $SCHEDULER"
     exit 1
@@ -74,6 +136,8 @@ submit_and_wait() {
       job_running=$( squeue -u ${USER} -j ${slurm_id} | grep ${slurm_id} | wc -l)
     elif [[ $SCHEDULER = 'lsf' ]]; then
       job_running=$( bjobs ${bsub_id} | grep ${bsub_id} | wc -l)
+    elif [[ $SCHEDULER = 'local' ]]; then
+      job_running=$( job_query ${local_id} | grep "^${local_id} " | wc -l)
     else
       echo "Unknown SCHEDULER $SCHEDULER"
       exit 1
@@ -90,11 +154,16 @@ submit_and_wait() {
     jobid=${slurm_id}
   elif [[ $SCHEDULER = 'lsf' ]]; then
     jobid=${bsub_id}
+  elif [[ $SCHEDULER = 'local' ]]; then
+    jobid=${local_id}
   else
     echo "Unknown SCHEDULER $SCHEDULER"
     exit 1
   fi
   echo "TEST ${TEST_NR} ${TEST_NAME} is submitted "
+  if [[ -n ${JOB_MONITOR_DIR:-} && -d ${JOB_MONITOR_DIR}/jobs ]]; then
+    touch ${JOB_MONITOR_DIR}/jobs/${jobid}
+  fi
   if [[ ${ECFLOW:-false} == true ]]; then
     ecflow_client --label=job_id "${jobid}"
     ecflow_client --label=job_status "submitted"
@@ -103,15 +172,21 @@ submit_and_wait() {
   # wait for the job to finish and compare results
   job_running=1
   local n=1
+  local mismatch_killed=false
+  # local jobs are polled more often, their states are files
+  local poll=60
+  [[ $SCHEDULER = 'local' ]] && poll=5
   until [[ $job_running -eq 0 ]]
   do
 
     if [[ $SCHEDULER = 'pbs' ]]; then
-      job_running=$( qstat ${qsub_id} | grep ${qsub_id} | wc -l )
+      job_running=$( job_query ${qsub_id} | grep ${qsub_id} | wc -l )
     elif [[ $SCHEDULER = 'slurm' ]]; then
-      job_running=$( squeue -u ${USER} -j ${slurm_id} | grep ${slurm_id} | wc -l)
+      job_running=$( job_query ${slurm_id} | grep ${slurm_id} | wc -l)
     elif [[ $SCHEDULER = 'lsf' ]]; then
-      job_running=$( bjobs ${bsub_id} | grep ${bsub_id} | wc -l)
+      job_running=$( job_query ${bsub_id} | grep ${bsub_id} | wc -l)
+    elif [[ $SCHEDULER = 'local' ]]; then
+      job_running=$( job_query ${local_id} | grep "^${local_id} " | wc -l)
     else
       echo "Unknown SCHEDULER $SCHEDULER"
       exit 1
@@ -119,7 +194,7 @@ submit_and_wait() {
 
     if [[ $SCHEDULER = 'pbs' ]]; then
 
-      status=$( qstat ${qsub_id} | grep ${qsub_id} | awk '{print $5}' ); status=${status:--}
+      status=$( job_query ${qsub_id} | grep ${qsub_id} | awk '{print $5}' ); status=${status:--}
       if   [[ $status = 'Q' ]];  then
         status_label='waiting in a queue'
       elif [[ $status = 'H' ]];  then
@@ -139,7 +214,7 @@ submit_and_wait() {
 
     elif [[ $SCHEDULER = 'slurm' ]]; then
 
-      status=$( squeue -u ${USER} -j ${slurm_id} 2>/dev/null | grep ${slurm_id} | awk '{print $5}' ); status=${status:--}
+      status=$( job_query ${slurm_id} 2>/dev/null | grep ${slurm_id} | awk '{print $5}' ); status=${status:--}
       if   [[ $status = 'R'  ]];  then
         status_label='running'
       elif [[ $status = 'PD' ]];  then
@@ -161,7 +236,7 @@ submit_and_wait() {
 
     elif [[ $SCHEDULER = 'lsf' ]]; then
 
-      status=$( bjobs ${bsub_id} 2>/dev/null | grep ${bsub_id} | awk '{print $3}' ); status=${status:--}
+      status=$( job_query ${bsub_id} 2>/dev/null | grep ${bsub_id} | awk '{print $3}' ); status=${status:--}
       if   [[ $status = 'PEND' ]];  then
         status_label='pending'
       elif [[ $status = 'RUN'  ]];  then
@@ -176,30 +251,68 @@ submit_and_wait() {
         echo "bsub unknown status ${status}"
         status_label='finished'
         test_status='DONE'
-        exit_status=$( bjobs ${bsub_id} 2>/dev/null | grep ${bsub_id} | awk '{print $3}' ); status=${status:--}
+        exit_status=$( job_query ${bsub_id} 2>/dev/null | grep ${bsub_id} | awk '{print $3}' ); status=${status:--}
         if [[ $exit_status = 'EXIT' ]];  then
         status_label='failed'
           test_status='FAIL'
         fi
       fi
 
+    elif [[ $SCHEDULER = 'local' ]]; then
+
+      status=$( job_query ${local_id} 2>/dev/null | grep "^${local_id} " | awk '{print $5}' ); status=${status:--}
+      # a queued job never starts once the allocation is gone, a running one was killed with it
+      if [[ $packed == true && ( $status = 'Q' || $status = 'R' ) ]] && pack_stopped; then
+        ${PATHRT}/local_scheduler.py cancel ${LOCAL_SCHEDULER_DIR} ${local_id}
+        [[ $status = 'Q' ]] && status='CA' || status='F'
+      fi
+      if   [[ $status = 'Q'  ]];  then
+        status_label='waiting in a queue'
+      elif [[ $status = 'R'  ]];  then
+        status_label='running'
+      elif [[ $status = 'C'  ]];  then
+        status_label='finished'
+        test_status='DONE'
+      elif [[ $status = 'CA' && $packed == true && $mismatch_killed == false ]];  then
+        status_label='not started in the allocation of packed tests'
+        test_status='RESUBMIT'
+      else
+        status_label='failed'
+        test_status='FAIL'
+      fi
+
     else
       echo "Unknown SCHEDULER $SCHEDULER"
       exit 1
 
     fi
 
-    echo "$n min. TEST ${TEST_NR} ${TEST_NAME} is ${status_label},  status: $status jobid ${jobid}"
+    echo "$(( (n - 1) * poll / 60 + 1 )) min. TEST ${TEST_NR} ${TEST_NAME} is ${status_label},  status: $status jobid ${jobid}"
     [[ ${ECFLOW:-false} == true ]] && ecflow_client --label=job_status "$status_label"
 
-    if [[ $test_status = 'FAIL' || $test_status = 'DONE' ]]; then
+    if [[ $test_status = 'FAIL' || $test_status = 'DONE' || $test_status = 'RESUBMIT' ]]; then
       break
     fi
 
+    if [[ ${RT_COMPARE_ABORT:-false} == true && $mismatch_killed == false && -s ${RUNDIR}/compare_files.mismatch ]]; then
+      echo "TEST ${TEST_NR} ${TEST_NAME} differs from the baseline in $( head -1 ${RUNDIR}/compare_files.mismatch ), killing job ${jobid}"
+      kill_job ${jobid}
+      mismatch_killed=true
+    fi
+
     (( n=n+1 ))
-    sleep 60 & wait $!
+    sleep ${poll} & wait $!
   done
 
+  if [[ -n ${JOB_MONITOR_DIR:-} ]]; then
+    rm -f ${JOB_MONITOR_DIR}/jobs/${jobid} ${JOB_MONITOR_DIR}/status/${jobid}
+  fi
+
+  # run_test.sh submits the job again, as a job of its own
+  if [[ $test_status = 'RESUBMIT' ]]; then
+    PACK_RESUBMIT=true
+  fi
+
   if [[ $test_status = 'FAIL' ]]; then
     if [[ ${OPNREQ_TEST} == false ]]; then
       echo "${TEST_NAME} ${TEST_NR}" >> $PATHRT/fail_test_${TEST_NR}
@@ -224,6 +337,148 @@ submit_and_wait() {
   eval "$set_x"
 }
 
+# Compare wall time and memory of a passing test with its history in the
+# performance database (rt_perfdb.py). A regression does not fail the test,
+# it is reported as PERF and listed in the summary of rt.sh.
+check_performance() {
+  local -r max_rss=$1
+  local args="--machine ${MACHINE_ID} --out ${RUNDIR}/out"
+  [[ -n $max_rss ]] && args="$args --max-rss ${max_rss}"
+
+  local perf
+  perf=$( ${PATHRT}/rt_perfdb.py check ${TEST_NAME} ${args} 2>&1 ) && d=$? || d=$?
+  echo "${perf}"
+  echo "${perf}" >> ${REGRESSIONTEST_LOG}
+  if [[ $d -eq 3 ]]; then
+    echo "Test ${TEST_NR} ${TEST_NAME} PERF" >> ${REGRESSIONTEST_LOG}
+    echo "Test ${TEST_NR} ${TEST_NAME} PERF"
+    echo "${TEST_NAME} ${TEST_NR} ${perf//$'\n'/; }" >> $PATHRT/perf_test_${TEST_NR}
+  elif [[ $d -ne 0 ]]; then
+    echo "WARNING: performance check of ${TEST_NAME} failed"
+  fi
+}
+
+# Options of compare_files.py for this machine and test
+build_modules_env() {
+  # the modules compile.sh loads for MAKE_OPT, with the versions they resolve
+  # to, for the build cache key; loaded in a subshell, as a job would
+  (
+    set +eux
+    local modulefiles=${PATHRT}/../modulefiles
+    if [[ $MACHINE_ID == macosx.* ]] || [[ $MACHINE_ID == linux.* ]]; then
+      source ${modulefiles}/ufs_${MACHINE_ID} >/dev/null 2>&1
+    else
+      source ${PATHRT}/module-setup.sh >/dev/null 2>&1
+      if [[ $MACHINE_ID == gaea.* ]] ; then
+        source /lustre/f2/pdata/esrl/gsd/contrib/lua-5.1.4.9/init/init_lmod.sh
+      fi
+      local modulefile="ufs_${MACHINE_ID}"
+      if [[ "${MAKE_OPT}" == *"-DDEBUG=ON"* ]]; then
+        [[ -f ${modulefiles}/ufs_${MACHINE_ID}_debug ]] && modulefile="ufs_${MACHINE_ID}_debug"
+      fi
+      module use ${modulefiles} >/dev/null 2>&1
+      module load ${modulefile} >/dev/null 2>&1
+    fi
+    echo "${LOADEDMODULES:-}"
+  )
+}
+
+compare_files_options() {
+  local options="--compiler ${RT_COMPILER}"
+  if [[ ${MACHINE_ID} =~ orion || ${MACHINE_ID} =~ hera || ${MACHINE_ID} =~ wcoss_dell_p3 || ${MACHINE_ID} =~ wcoss_cray || ${MACHINE_ID} =~ cheyenne || ${MACHINE_ID} =~ gaea || ${MACHINE_ID} =~ jet || ${MACHINE_ID} =~ s4 ]] ; then
+    options="${options} --alt-check"
+  fi
+  # per variable tolerances (JSON file relative to tests/) for tests that are not bit-for-bit
+  if [[ -n ${COMPARE_TOLERANCES:-} ]]; then
+    options="${options} --tolerances ${PATHRT}/${COMPARE_TOLERANCES}"
+  fi
+  # statistics read differing netCDF files in full, so they are opt-in
+  if [[ ${RT_COMPARE_REPORT:-false} == true ]]; then
+    options="${options} --stats"
+  fi
+  echo "${options}"
+}
+
+# With RT_COMPARE_WATCH=true, the netCDF output files are compared while the
+# job runs, as the model completes them, and check_results only compares the
+# other files and those written last. With RT_COMPARE_ABORT=true as well,
+# submit_and_wait kills the job as soon as the values of a netCDF file differ
+# from the baseline.
+compare_watch_start() {
+  rm -f ${RUNDIR}/compare_files.done ${RUNDIR}/compare_files.state ${RUNDIR}/compare_files.mismatch
+  ${PATHRT}/compare_files.py $( compare_files_options ) --watch ${RUNDIR}/compare_files.done \
+                             --state ${RUNDIR}/compare_files.state --mismatch ${RUNDIR}/compare_files.mismatch --ppid $$ \
+                             ${RTPWD}/${CNTL_DIR} ${RUNDIR} ${LIST_FILES} > ${RUNDIR}/compare_files.log 2>&1 &
+  COMPARE_WATCH_PID=$!
+}
+
+compare_watch_stop() {
+  [[ -n ${COMPARE_WATCH_PID:-} ]] || return 0
+  touch ${RUNDIR}/compare_files.done
+  wait ${COMPARE_WATCH_PID} || echo "WARNING: comparing the output of ${TEST_NAME} while it ran failed, see ${RUNDIR}/compare_files.log"
+  COMPARE_WATCH_PID=''
+}
+
+# The files of its DEP_RUN a restart test reads, as file names or globs
+# relative to the run directory of DEP_RUN: RESTART_DEP_FILES of the test,
+# or else the RESTART files named by RESTART_FILE_PREFIX and
+# _SUFFIX_HRS/_SECS. A name must exist, a glob match at least one file.
+# FV3 writes the coupler.res of a restart time after its other restart
+# files, so that it marks them complete. Empty if the test names none, it
+# then waits for DEP_RUN to complete.
+restart_dep_files() {
+  if [[ -n ${RESTART_DEP_FILES:-} ]]; then
+    echo "${RESTART_DEP_FILES}"
+  elif [[ -n ${RESTART_FILE_PREFIX:-} ]]; then
+    local files="RESTART/${RESTART_FILE_PREFIX}.coupler.res RESTART/${RESTART_FILE_PREFIX}.*"
+    if [[ -n ${RESTART_FILE_SUFFIX_HRS:-} ]]; then
+      files="${files} RESTART/MOM.res.${RESTART_FILE_SUFFIX_HRS}-00-00.nc"
+      if [[ ${OCNRES:-} == 025 ]]; then
+        files="${files} RESTART/MOM.res.${RESTART_FILE_SUFFIX_HRS}-00-00_1.nc"
+        files="${files} RESTART/MOM.res.${RESTART_FILE_SUFFIX_HRS}-00-00_2.nc"
+        files="${files} RESTART/MOM.res.${RESTART_FILE_SUFFIX_HRS}-00-00_3.nc"
+      fi
+    fi
+    if [[ -n ${RESTART_FILE_SUFFIX_SECS:-} ]]; then
+      files="${files} RESTART/ufs.cpld.cpl.r.${RESTART_FILE_SUFFIX_SECS}.nc"
+      files="${files} RESTART/iced.${RESTART_FILE_SUFFIX_SECS}.nc"
+    fi
+    echo "${files}"
+  fi
+}
+
+# With ecFlow or Rocoto, the tests restarting from this one start as soon
+# as it has written their restart files: rt.sh lists them with their files
+# in restart_deps/<test>, and restart_ready.py creates restart_ready.<test>
+# in RUNDIR, and sets the ecFlow event restart_<test>, once they are there.
+restart_watch_start() {
+  local -r deps=${RUNDIR_ROOT}/restart_deps/${TEST_NAME}${RT_SUFFIX}
+  [[ -f ${deps} ]] || return 0
+  local restart_test files
+  while read -r restart_test files; do
+    ( set -f
+      ${PATHRT}/restart_ready.py --ppid $$ ${RUNDIR} ${RUNDIR}/restart_ready.${restart_test} ${files} || exit 0
+      if [[ ${ECFLOW} == true ]]; then
+        ecflow_client --event=restart_${restart_test}
+      fi
+    ) >> ${RUNDIR}/restart_ready.log 2>&1 &
+  done < ${deps}
+}
+
+# A retry of a test deletes its run directory, which a restart test started
+# before the first try ended may be copying from. run_test.sh holds the
+# lock ${RUNDIR_ROOT}/<test>.lock of the test exclusively while it deletes
+# the directory, and the one of DEP_RUN shared while fv3_run copies from it.
+rundir_lock() {
+  local -r test_dir=$1 mode=$2
+  exec {RUNDIR_LOCK_FD}>${RUNDIR_ROOT}/${test_dir}.lock
+  flock ${mode} ${RUNDIR_LOCK_FD}
+}
+
+rundir_unlock() {
+  exec {RUNDIR_LOCK_FD}>&-
+}
+
 check_results() {
 
   [ -o xtrace ] && set_x='set -x' || set_x='set +x'
@@ -248,66 +503,21 @@ check_results() {
 
   if [[ ${CREATE_BASELINE} = false ]]; then
     #
-    # --- regression test comparison
+    # --- regression test comparison, of the files not compared while the
+    #     job ran (see compare_watch_start)
     #
-    for i in ${LIST_FILES} ; do
-      printf %s " Comparing " $i " ....." >> ${REGRESSIONTEST_LOG}
-      printf %s " Comparing " $i " ....."
-
-      if [[ ! -f ${RUNDIR}/$i ]] ; then
-
-        echo ".......MISSING file" >> ${REGRESSIONTEST_LOG}
-        echo ".......MISSING file"
-        test_status='FAIL'
-
-      elif [[ ! -f ${RTPWD}/${CNTL_DIR}/$i ]] ; then
-
-        echo ".......MISSING baseline" >> ${REGRESSIONTEST_LOG}
-        echo ".......MISSING baseline"
-        test_status='FAIL'
-
-      elif [[ $RT_COMPILER == "gnu" && $i == "RESTART/fv_core.res.nc" ]] ; then
-
-        # Although identical in ncdiff, RESTART/fv_core.res.nc differs in byte 469, line 3,
-        # for the fv3_control_32bit test between each run (without changing the source code)
-        # for GNU compilers - skip comparison.
-        echo ".......SKIP for gnu compilers" >> ${REGRESSIONTEST_LOG}
-        echo ".......SKIP for gnu compilers"
-
-      else
-
-        cmp ${RTPWD}/${CNTL_DIR}/$i ${RUNDIR}/$i >/dev/null 2>&1 && d=$? || d=$?
-        if [[ $d -eq 2 ]]; then
-          echo "....CMP ERROR" >> ${REGRESSIONTEST_LOG}
-          echo "....CMP ERROR"
-          exit 1
-        fi
-
-        if [[ $d -eq 1 && ${i##*.} == 'nc' ]] ; then
-          if [[ ${MACHINE_ID} =~ orion || ${MACHINE_ID} =~ hera || ${MACHINE_ID} =~ wcoss_dell_p3 || ${MACHINE_ID} =~ wcoss_cray || ${MACHINE_ID} =~ cheyenne || ${MACHINE_ID} =~ gaea || ${MACHINE_ID} =~ jet || ${MACHINE_ID} =~ s4 ]] ; then
-            printf ".......ALT CHECK.." >> ${REGRESSIONTEST_LOG}
-            printf ".......ALT CHECK.."
-            ${PATHRT}/compare_ncfile.py ${RTPWD}/${CNTL_DIR}/$i ${RUNDIR}/$i >/dev/null 2>&1 && d=$? || d=$?
-            if [[ $d -eq 1 ]]; then
-              echo "....ERROR" >> ${REGRESSIONTEST_LOG}
-              echo "....ERROR"
-              exit 1
-            fi
-          fi
-        fi
-
-        if [[ $d -ne 0 ]]; then
-          echo "....NOT OK" >> ${REGRESSIONTEST_LOG}
-          echo "....NOT OK"
-          test_status='FAIL'
-        else
-          echo "....OK" >> ${REGRESSIONTEST_LOG}
-          echo "....OK"
-        fi
-
-      fi
-
-    done
+    local report=''
+    if [[ ${RT_COMPARE_REPORT:-false} == true ]]; then
+      report="--report ${REGRESSIONTEST_LOG%.log}.json"
+    fi
+    ${PATHRT}/compare_files.py $( compare_files_options ) --log ${REGRESSIONTEST_LOG} \
+                               ${report} --state ${RUNDIR}/compare_files.state \
+                               ${RTPWD}/${CNTL_DIR} ${RUNDIR} ${LIST_FILES} && d=$? || d=$?
+    if [[ $d -eq 1 ]]; then
+      exit 1
+    elif [[ $d -ne 0 ]]; then
+      test_status='FAIL'
+    fi
 
   else
     #
@@ -316,27 +526,37 @@ check_results() {
     echo;echo "Moving baseline ${TEST_NR} ${TEST_NAME} files ...."
     echo;echo "Moving baseline ${TEST_NR} ${TEST_NAME} files ...." >> ${REGRESSIONTEST_LOG}
 
-    for i in ${LIST_FILES} ; do
-      printf %s " Moving " $i " ....."
-      printf %s " Moving " $i " ....."   >> ${REGRESSIONTEST_LOG}
-      if [[ -f ${RUNDIR}/$i ]] ; then
-        mkdir -p ${NEW_BASELINE}/${CNTL_DIR}/$(dirname ${i})
-        cp ${RUNDIR}/${i} ${NEW_BASELINE}/${CNTL_DIR}/${i}
-        echo "....OK" >>${REGRESSIONTEST_LOG}
-        echo "....OK"
-      else
-        echo "....NOT OK. Missing " ${RUNDIR}/$i >>${REGRESSIONTEST_LOG}
-        echo "....NOT OK. Missing " ${RUNDIR}/$i
-        test_status='FAIL'
-      fi
-    done
+    # reflink the files into the baseline where possible, copy them otherwise,
+    # and record their size and content hash in the baseline manifest
+    ${PATHRT}/baseline_stage.py --log ${REGRESSIONTEST_LOG} \
+                                ${RUNDIR} ${NEW_BASELINE}/${CNTL_DIR} ${LIST_FILES} && d=$? || d=$?
+    if [[ $d -eq 2 ]]; then
+      test_status='FAIL'
+    elif [[ $d -ne 0 ]]; then
+      exit 1
+    fi
 
   fi
 
   echo                                               >> ${REGRESSIONTEST_LOG}
   grep "The total amount of wall time" ${RUNDIR}/out >> ${REGRESSIONTEST_LOG}
+
+  # memory high-water mark of the job, where the scheduler accounts for it
+  local max_rss=''
+  local job=${jobid:-${SLURM_JOB_ID:-}}
+  if [[ $SCHEDULER = 'slurm' && -n $job ]] && command -v sacct >/dev/null 2>&1; then
+    max_rss=$( sacct -j ${job} -n -P -o MaxRSS 2>/dev/null | \
+               awk '/[0-9]/ {v=$1+0; if ($1 ~ /M$/) v*=1024; if ($1 ~ /G$/) v*=1048576; if (v>m) m=v} END {if (m) printf "%d", m}' )
+  fi
+  if [[ -n $max_rss ]]; then
+    echo "  max memory (MaxRSS) = ${max_rss} KB"       >> ${REGRESSIONTEST_LOG}
+  fi
   echo                                               >> ${REGRESSIONTEST_LOG}
 
+  if [[ ${PERF_CHECK:-false} == true && ${CREATE_BASELINE} == false && $test_status == 'PASS' ]]; then
+    check_performance "${max_rss}"
+  fi
+
   TRIES=''
   if [[ $ECFLOW == true ]]; then
     if [[ $ECF_TRYNO -gt 1 ]]; then
@@ -376,6 +596,8 @@ kill_job() {
     scancel ${jobid}
   elif [[ $SCHEDULER = 'lsf' ]]; then
     bkill ${jobid}
+  elif [[ $SCHEDULER = 'local' ]]; then
+    ${PATHRT}/local_scheduler.py cancel ${LOCAL_SCHEDULER_DIR} ${jobid}
   fi
 }
 
@@ -434,7 +656,9 @@ EOF
 
 rocoto_create_run_task() {
 
-  if [[ $DEP_RUN != '' ]]; then
+  if [[ $DEP_RUN != '' && -n ${RESTART_FILES:-} ]]; then
+    DEP_STRING="<and> <taskdep task=\"compile_${COMPILE_NR}\"/> <or> <taskdep task=\"${DEP_RUN}${RT_SUFFIX}\"/> <datadep>&RUNDIR_ROOT;/${DEP_RUN}${RT_SUFFIX}/restart_ready.${TEST_NAME}${RT_SUFFIX}</datadep> </or> </and>"
+  elif [[ $DEP_RUN != '' ]]; then
     DEP_STRING="<and> <taskdep task=\"compile_${COMPILE_NR}\"/> <taskdep task=\"${DEP_RUN}${RT_SUFFIX}\"/> </and>"
   else
     DEP_STRING="<taskdep task=\"compile_${COMPILE_NR}\"/>"
@@ -532,8 +756,13 @@ EOF
   echo "      label job_id ''" >> ${ECFLOW_RUN}/${ECFLOW_SUITE}.def
   echo "      label job_status ''" >> ${ECFLOW_RUN}/${ECFLOW_SUITE}.def
   echo "      inlimit max_jobs" >> ${ECFLOW_RUN}/${ECFLOW_SUITE}.def
+  for event in ${RESTART_EVENTS:-}; do
+    echo "      event ${event}" >> ${ECFLOW_RUN}/${ECFLOW_SUITE}.def
+  done
   if [[ $DEP_RUN != '' ]]; then
-    if [[ ${OPNREQ_TEST} == false ]]; then
+    if [[ ${OPNREQ_TEST} == false && -n ${RESTART_FILES:-} ]]; then
+      echo "      trigger compile_${COMPILE_NR} == complete and (${DEP_RUN}${RT_SUFFIX} == complete or ${DEP_RUN}${RT_SUFFIX}:restart_${TEST_NAME}${RT_SUFFIX})" >> ${ECFLOW_RUN}/${ECFLOW_SUITE}.def
+    elif [[ ${OPNREQ_TEST} == false ]]; then
       echo "      trigger compile_${COMPILE_NR} == complete and ${DEP_RUN}${RT_SUFFIX} == complete" >> ${ECFLOW_RUN}/${ECFLOW_SUITE}.def
     else
       echo "      trigger compile_${COMPILE_NR} == complete and ${DEP_RUN} == complete" >> ${ECFLOW_RUN}/${ECFLOW_SUITE}.def
@@ -581,7 +810,9 @@ ecflow_run() {
     sleep 10 & wait $!
     active_tasks=$( ecflow_client --get_state /${ECFLOW_SUITE} | grep "task " | grep -E 'state:active|state:submitted|state:queued' | wc -l )
     echo "ecflow tasks remaining: ${active_tasks}"
-    ${PATHRT}/abort_dep_tasks.py
+    # cancel the jobs that need a failed job, or all once MAX_FAILURES failed
+    ${PATHRT}/abort_dep_tasks.py --suite ${ECFLOW_SUITE} --fail-file ${PATHRT}/fail_test_cancelled \
+                                 ${MAX_FAILURES:+--max-failures ${MAX_FAILURES}}
   done
   sleep 65 # wait one ECF_INTERVAL plus 5 seconds
   ecflow_client --delete=yes /${ECFLOW_SUITE}
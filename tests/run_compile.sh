@@ -54,29 +54,61 @@ rm -rf ${RUNDIR}
 mkdir -p ${RUNDIR}
 cd $RUNDIR
 
-if [[ $SCHEDULER = 'slurm' ]]; then
-  atparse < $PATHRT/fv3_conf/compile_slurm.IN > job_card
-elif [[ $SCHEDULER = 'lsf' ]]; then
-  atparse < $PATHRT/fv3_conf/compile_bsub.IN > job_card
-elif [[ $SCHEDULER = 'pbs' ]]; then
-  atparse < $PATHRT/fv3_conf/compile_qsub.IN > job_card
-fi
-
 ################################################################################
-# Submit compile job
+# Skip the compile job if the build is in the build cache
 ################################################################################
 
-if [[ $ROCOTO = 'false' ]]; then
-  submit_and_wait job_card
+# Key of the build, computed here before building from the sources: the
+# batch job does not see RT_BUILD_CACHE on every scheduler
+BUILD_KEY=''
+if [[ -n ${RT_BUILD_CACHE:-} ]]; then
+  BUILD_KEY=$( ${PATHRT}/build_cache.py key --machine ${MACHINE_ID} --make-opt="${MAKE_OPT}" \
+                 --modules-env="$( build_modules_env )" ) || BUILD_KEY=''
+fi
+
+if [[ -n ${BUILD_KEY} ]] && ${PATHRT}/build_cache.py fetch --key ${BUILD_KEY} \
+     --exe ${PATHRT}/fv3_${COMPILE_NR}.exe --modules ${PATHRT}/modules.fv3_${COMPILE_NR}; then
+
+  echo "Compile ${COMPILE_NR} elapsed time ${SECONDS} seconds. ${MAKE_OPT} (build cache)" > ${LOG_DIR}/compile_${COMPILE_NR}_time.log
+  echo -n " $( date +%s ), $( date +%s )," >> ${LOG_DIR}/job_${JOB_NR}_timestamp.txt
+
 else
-  chmod u+x job_card
-  ./job_card
+
+  if [[ $SCHEDULER = 'slurm' ]]; then
+    atparse < $PATHRT/fv3_conf/compile_slurm.IN > job_card
+  elif [[ $SCHEDULER = 'lsf' ]]; then
+    atparse < $PATHRT/fv3_conf/compile_bsub.IN > job_card
+  elif [[ $SCHEDULER = 'pbs' ]]; then
+    atparse < $PATHRT/fv3_conf/compile_qsub.IN > job_card
+  elif [[ $SCHEDULER = 'local' ]]; then
+    BUILD_JOBS=${BUILD_JOBS:-8}
+    export JOB_CORES=${BUILD_JOBS}
+    atparse < $PATHRT/fv3_conf/compile_local.IN > job_card
+  fi
+
+  ################################################################################
+  # Submit compile job
+  ################################################################################
+
+  if [[ $ROCOTO = 'false' ]]; then
+    submit_and_wait job_card
+  else
+    chmod u+x job_card
+    ./job_card
+  fi
+
+  cp ${RUNDIR}/compile_*_time.log ${LOG_DIR}
+  cat ${RUNDIR}/job_timestamp.txt >> ${LOG_DIR}/job_${JOB_NR}_timestamp.txt
+
+  if [[ -n ${BUILD_KEY} ]]; then
+    ${PATHRT}/build_cache.py store --key ${BUILD_KEY} --machine ${MACHINE_ID} --make-opt="${MAKE_OPT}" \
+      --exe ${PATHRT}/fv3_${COMPILE_NR}.exe --modules ${PATHRT}/modules.fv3_${COMPILE_NR} \
+      --quota ${RT_BUILD_CACHE_QUOTA:-50} || echo "WARNING: cannot add fv3_${COMPILE_NR}.exe to the build cache"
+  fi
+
 fi
 
 ls -l ${PATHTR}/tests/fv3_${COMPILE_NR}.exe
-
-cp ${RUNDIR}/compile_*_time.log ${LOG_DIR}
-cat ${RUNDIR}/job_timestamp.txt >> ${LOG_DIR}/job_${JOB_NR}_timestamp.txt
 ################################################################################
 # End compile job
 ################################################################################
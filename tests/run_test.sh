@@ -42,6 +42,18 @@ source default_vars.sh
 source tests/$TEST_NAME
 [[ -e ${RUNDIR_ROOT}/opnreq_test_${TEST_NR}.env ]] && source ${RUNDIR_ROOT}/opnreq_test_${TEST_NR}.env
 
+# Request the wall clock time the history of the test predicts, except when
+# ecFlow retries it, as the first try may have run out of time
+if [[ -n ${RT_WLCLK_MARGIN:-} && ${ECF_TRYNO:-1} -le 1 ]]; then
+  if wlclk=$( ${PATHRT}/rt_perfdb.py walltime ${TEST_NAME} --machine ${MACHINE_ID} \
+                --default ${WLCLK} --margin ${RT_WLCLK_MARGIN} ); then
+    echo "WLCLK ${wlclk} minutes (${WLCLK} in tests/${TEST_NAME})"
+    export WLCLK=${wlclk}
+  else
+    echo "WARNING: could not predict the wall clock time of ${TEST_NAME}, using WLCLK=${WLCLK}"
+  fi
+fi
+
 # Save original CNTL_DIR name as INPUT_DIR for regression
 # tests that try to copy input data from CNTL_DIR
 export INPUT_DIR=${CNTL_DIR}
@@ -66,10 +78,14 @@ echo "Test ${TEST_NR} ${TEST_NAME} ${TEST_DESCR}"
 source rt_utils.sh
 source atparse.bash
 
+rundir_lock ${TEST_NAME}${RT_SUFFIX} -x
 rm -rf ${RUNDIR}
 mkdir -p ${RUNDIR}
+rundir_unlock
 cd $RUNDIR
 
+restart_watch_start
+
 ###############################################################################
 # Make configure and run files
 ###############################################################################
@@ -87,6 +103,9 @@ cp ${PATHRT}/module-setup.sh                       module-setup.sh
 SRCD="${PATHTR}"
 RUND="${RUNDIR}"
 
+# the templates of the test are rendered in one atparse.py process
+atparse_start
+
 # FV3_RUN could have multiple entry seperated by space
 for i in ${FV3_RUN:-fv3_run.IN}
 do
@@ -140,22 +159,27 @@ if [[ "Q${FIELD_TABLE:-}" != Q ]] ; then
   cp ${PATHRT}/parm/field_table/${FIELD_TABLE} field_table
 fi
 
-# fix files
-if [[ $FV3 == true ]]; then
-  cp ${INPUTDATA_ROOT}/FV3_fix/*.txt .
-  cp ${INPUTDATA_ROOT}/FV3_fix/*.f77 .
-  cp ${INPUTDATA_ROOT}/FV3_fix/*.dat .
-  cp ${INPUTDATA_ROOT}/FV3_fix/fix_co2_proj/* .
-  if [[ $TILEDFIX != .true. ]]; then
-    cp ${INPUTDATA_ROOT}/FV3_fix/*.grb .
-  fi
-fi
-
 # Field Dictionary
 cp ${PATHRT}/parm/fd_nems.yaml fd_nems.yaml
 
 # Set up the run directory
+if [[ -n ${DEP_RUN:-} ]]; then
+  rundir_lock ${DEP_RUN}${RT_SUFFIX} -s
+fi
 source ./fv3_run
+if [[ -n ${DEP_RUN:-} ]]; then
+  rundir_unlock
+fi
+
+# fix files, copied once per rt.sh run into a cache and linked from there;
+# files fv3_run has set up take precedence, as they used to overwrite these
+if [[ $FV3 == true ]]; then
+  FIX_PATTERNS=('*.txt' '*.f77' '*.dat' 'fix_co2_proj/*')
+  if [[ $TILEDFIX != .true. ]]; then
+    FIX_PATTERNS+=('*.grb')
+  fi
+  ${PATHRT}/fix_stage.py --no-clobber ${RUNDIR_ROOT}/fix_cache ${RUNDIR} ${INPUTDATA_ROOT}/FV3_fix "${FIX_PATTERNS[@]}"
+fi
 
 if [[ $CPLWAV == .true. ]]; then
   atparse < ${PATHRT}/parm/ww3_multi.inp.IN > ww3_multi.inp
@@ -202,6 +226,16 @@ elif [[ $SCHEDULER = 'slurm' ]]; then
     NODES=$(( NODES + 1 ))
   fi
   atparse < $PATHRT/fv3_conf/fv3_slurm.IN > job_card
+  # with rt.sh -a, a test that fits runs as a job step of the shared allocation
+  if [[ -n ${PACK_DIR:-} ]] && (( NODES <= PACK_NODES && WLCLK <= PACK_WLCLK )) && \
+     pack_has_time ${WLCLK}; then
+    echo "TEST ${TEST_NR} ${TEST_NAME} runs in the allocation of packed tests"
+    SCHEDULER=local
+    LOCAL_SCHEDULER_DIR=${PACK_DIR}
+    SLURM_JOB_MONITOR_DIR=${JOB_MONITOR_DIR:-}
+    JOB_MONITOR_DIR=''
+    export JOB_CORES=$(( TASKS * ${THRD:-1} ))
+  fi
 elif [[ $SCHEDULER = 'lsf' ]]; then
   if (( TASKS < TPN )); then
     TPN=${TASKS}
@@ -211,12 +245,22 @@ elif [[ $SCHEDULER = 'lsf' ]]; then
     NODES=$(( NODES + 1 ))
   fi
   atparse < $PATHRT/fv3_conf/fv3_bsub.IN > job_card
+elif [[ $SCHEDULER = 'local' ]]; then
+  NODES=1
+  export JOB_CORES=$(( TASKS * ${THRD:-1} ))
+  atparse < $PATHRT/fv3_conf/fv3_local.IN > job_card
 fi
 
+atparse_stop
+
 ################################################################################
 # Submit test job
 ################################################################################
 
+if [[ ${RT_COMPARE_WATCH:-false} == true && ${CREATE_BASELINE} == false && $skip_check_results == false ]]; then
+  compare_watch_start
+fi
+
 if [[ $SCHEDULER = 'none' ]]; then
 
   ulimit -s unlimited
@@ -230,6 +274,13 @@ else
 
   if [[ $ROCOTO = 'false' ]]; then
     submit_and_wait job_card
+    # a packed test the allocation did not start is queued as its own job
+    if [[ ${PACK_RESUBMIT:-false} == true ]]; then
+      echo "TEST ${TEST_NR} ${TEST_NAME} did not start in the allocation of packed tests, submitting it as its own job"
+      SCHEDULER=slurm
+      JOB_MONITOR_DIR=${SLURM_JOB_MONITOR_DIR}
+      submit_and_wait job_card
+    fi
   else
     chmod u+x job_card
     ./job_card
@@ -237,6 +288,8 @@ else
 
 fi
 
+compare_watch_stop
+
 if [[ $skip_check_results = false ]]; then
   check_results
 fi
@@ -0,0 +1,65 @@
+"""atparse.py against the atparse shell function."""
+import io
+import os
+import sys
+import glob
+import tempfile
+import subprocess
+import unittest
+
+TESTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, TESTS)
+import atparse  # noqa: E402
+
+
+def request(text, values):
+    """The fields the atparse shell function sends for one template."""
+    names = atparse.template_variables(text)
+    fields = [text] + ['=' + values[name] if name in values else '-'
+                       for name in names]
+    return ''.join(field + '\0' for field in fields)
+
+
+class ServeTest(unittest.TestCase):
+
+    def serve(self, data):
+        out = io.BytesIO()
+        atparse.serve(io.BytesIO(data.encode()), out)
+        return out.getvalue().decode().split('\0')[:-1]
+
+    def test_render(self):
+        text = "a @[x] @['b'] @[@] @ c\n"
+        self.assertEqual(self.serve(request(text, {'x': '1'})),
+                         ['x', '', '0', 'a 1 b @ @ c\n'])
+
+    def test_undefined(self):
+        text = 'a\n@[x]\n'
+        self.assertEqual(self.serve(request(text, {}) + request(text, {'x': ''})),
+                         ['x', '', '1', '<stdin>:2: @[x]: x is not defined',
+                          'x', '', '0', 'a\n\n'])
+
+    def test_shell_function(self):
+        """atparse through the server renders every template as atparse_bash."""
+        templates = sorted(glob.glob(os.path.join(TESTS, 'fv3_conf', '*.IN')))
+        names = set()
+        for path in templates:
+            with open(path) as f:
+                names.update(atparse.template_variables(f.read()))
+        script = ['set -eu', 'source atparse.bash']
+        script += [f"{name}='{name} \"v\" $x\\n @[{name}]'" for name in sorted(names)]
+        script.append('atparse_start')
+        for n, path in enumerate(templates):
+            script.append(f'atparse < {path} > "$1/py.{n}"')
+            script.append(f'atparse_bash < {path} > "$1/sh.{n}"')
+        script.append('atparse_stop')
+        with tempfile.TemporaryDirectory() as tmp:
+            subprocess.run(['bash', '-c', '\n'.join(script), 'bash', tmp],
+                           cwd=TESTS, check=True)
+            for n, path in enumerate(templates):
+                with open(os.path.join(tmp, f'py.{n}'), 'rb') as py, \
+                        open(os.path.join(tmp, f'sh.{n}'), 'rb') as sh:
+                    self.assertEqual(py.read(), sh.read(), path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""baseline_stage.py staging and baseline_manifest.py entries."""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import baseline_stage  # noqa: E402
+import baseline_manifest  # noqa: E402
+
+
+class StageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.run_dir = os.path.join(self.tmp.name, 'run')
+        self.baseline_dir = os.path.join(self.tmp.name, 'baseline')
+        os.makedirs(self.run_dir)
+        self.write('out.nc', b'0123456789')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, data):
+        with open(os.path.join(self.run_dir, name), 'wb') as f:
+            f.write(data)
+
+    def stage(self, methods=baseline_stage.DEFAULT_METHODS):
+        results = baseline_stage.stage_files(self.run_dir, self.baseline_dir,
+                                             ['out.nc'], methods, 1)
+        method, entry = results['out.nc']
+        baseline_manifest.update_manifest(self.baseline_dir, {'out.nc': entry})
+        return method
+
+    def lookup(self):
+        manifest = baseline_manifest.load_manifest(self.baseline_dir)
+        return baseline_manifest.lookup(manifest, 'out.nc', os.path.join(
+            self.baseline_dir, 'out.nc'))
+
+    def test_run_dir_writes_keep_baseline(self):
+        self.assertIn(self.stage(), ('reflink', 'copy'))
+        self.write('out.nc', b'abcdefghij')
+        with open(os.path.join(self.baseline_dir, 'out.nc'), 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+        self.assertIsNotNone(self.lookup())
+
+    def test_link_is_read_only(self):
+        self.assertEqual(self.stage(('link', 'copy')), 'link')
+        mode = os.stat(os.path.join(self.run_dir, 'out.nc')).st_mode
+        self.assertEqual(mode & 0o222, 0)
+
+    def test_entry_of_rewritten_file(self):
+        self.stage()
+        baseline = os.path.join(self.baseline_dir, 'out.nc')
+        st = os.stat(baseline)
+        with open(baseline, 'r+b') as f:
+            f.write(b'abcdefghij')
+        # same size and inode, later modification time
+        os.utime(baseline, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertIsNone(self.lookup())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""ci/check_status.py against a local stand-in for the GitHub API."""
+import os
+import sys
+import json
+import asyncio
+import threading
+import subprocess
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ci'))
+import check_status  # noqa: E402
+
+
+class FakeAPI(BaseHTTPRequestHandler):
+    """Serves server.pages[path], a list of (status, body) answered in turn;
+    the last one repeats.  A body is sent with its ETag, and a request that
+    sends that ETag back gets 304."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get('If-None-Match')))
+        pages = server.pages[self.path]
+        status, body = pages.pop(0) if len(pages) > 1 else pages[0]
+        etag = '"%d"' % hash(json.dumps(body, sort_keys=True))
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            status, body = 304, None
+        self.send_response(status)
+        self.send_header('ETag', etag)
+        self.send_header('X-RateLimit-Remaining', '4999')
+        self.send_header('X-RateLimit-Reset', '0')
+        self.end_headers()
+        if body is not None and status != 304:
+            self.wfile.write(json.dumps(body).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class CheckStatusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), FakeAPI)
+        self.server.pages = {}
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = 'http://127.0.0.1:%d' % self.server.server_port
+        self.min_interval = check_status.MIN_INTERVAL
+        check_status.MIN_INTERVAL = 0.01
+        self.client = check_status.Client()
+
+    def tearDown(self):
+        check_status.MIN_INTERVAL = self.min_interval
+        self.client.pool.shutdown()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def run_poll(self, coroutine):
+        return asyncio.run(asyncio.wait_for(coroutine, timeout=30))
+
+    def test_conditional_request(self):
+        self.server.pages['/run'] = [(200, {'status': 'queued'})]
+        url = self.base + '/run'
+        self.assertEqual(self.client.fetch(url), ({'status': 'queued'}, True))
+        self.assertEqual(self.client.fetch(url), ({'status': 'queued'}, False))
+        first, second = self.server.requests
+        self.assertIsNone(first[1])
+        self.assertEqual(second[1], self.client.cache[url][0])
+        self.assertEqual(self.client.rate_remaining, 4999)
+
+    def test_poll_until_completed(self):
+        self.server.pages['/run'] = [(200, {'status': 'queued'}),
+                                     (200, {'status': 'queued'}),
+                                     (502, None),
+                                     (200, {'status': 'completed'})]
+        url = self.base + '/run'
+        self.assertTrue(self.run_poll(check_status.check_test(self.client, url)))
+        self.assertEqual(len(self.server.requests), 4)
+        # the unchanged second answer was a 304 to the ETag of the first
+        self.assertIsNotNone(self.server.requests[1][1])
+
+    def test_poll_client_error(self):
+        self.server.pages['/run'] = [(404, {'message': 'Not Found'})]
+        with self.assertRaises(check_status.HTTPError):
+            self.run_poll(check_status.check_test(self.client, self.base + '/run'))
+
+    def test_check_build(self):
+        running = {'jobs': [{'id': 1, 'name': 'Build (intel)',
+                             'status': 'in_progress', 'conclusion': None},
+                            {'id': 2, 'name': 'Build (gnu)',
+                             'status': 'completed', 'conclusion': 'success'}]}
+        done = {'jobs': [dict(job, status='completed', conclusion='success')
+                         for job in running['jobs']]}
+        self.server.pages['/jobs'] = [(200, running), (200, done)]
+        self.assertTrue(self.run_poll(
+            check_status.check_build(self.client, self.base + '/jobs')))
+
+    def test_check_ec2_waits_for_earlier_runs(self):
+        runs = {'workflow_runs': [
+            {'id': 3, 'name': 'Helpers', 'created_at': '2021-01-01T00:03:00Z'},
+            {'id': 2, 'name': 'Helpers', 'created_at': '2021-01-01T00:02:00Z'},
+            {'id': 4, 'name': 'Helpers', 'created_at': '2021-01-01T00:04:00Z'},
+            {'id': 1, 'name': 'Other', 'created_at': '2021-01-01T00:01:00Z'}]}
+        started = {'jobs': [{'name': 'Start runners', 'status': 'completed'},
+                            {'name': 'Stop runners', 'status': 'in_progress'}]}
+        stopped = {'jobs': [{'name': 'Start runners', 'status': 'completed'},
+                            {'name': 'Stop runners', 'status': 'completed'}]}
+        self.server.pages['/runs'] = [(200, runs)]
+        self.server.pages['/runs/2/jobs'] = [(200, started), (200, stopped)]
+        self.run_poll(check_status.check_ec2(self.client, self.base + '/runs', 3))
+        paths = [path for path, _ in self.server.requests]
+        self.assertEqual(paths.count('/runs/2/jobs'), 2)
+        self.assertNotIn('/runs/4/jobs', paths)
+
+    def test_main(self):
+        self.server.pages['/jobs'] = [(200, {'jobs': [
+            {'id': 1, 'name': 'Build', 'status': 'completed',
+             'conclusion': 'failure'}]})]
+        script = os.path.join(os.path.dirname(check_status.__file__),
+                              'check_status.py')
+        result = subprocess.run([sys.executable, '-W', 'error', script, 'build'],
+                                input=self.base + '/jobs', check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True)
+        self.assertEqual(result.stdout, 'failure\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
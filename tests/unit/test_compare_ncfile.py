@@ -0,0 +1,69 @@
+"""compare_ncfile.py statistics against its default comparison."""
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+from netCDF4 import Dataset
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import compare_ncfile  # noqa: E402
+
+FILL = -999.0
+BUDGET = compare_ncfile.DEFAULT_CHUNK_MB * 1024 * 1024
+
+
+class CompareStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, values):
+        path = os.path.join(self.tmp.name, name)
+        with Dataset(path, 'w') as nc:
+            nc.createDimension('x', len(values))
+            var = nc.createVariable('t', 'f8', ('x',), fill_value=FILL)
+            var[:] = np.ma.masked_values(np.array(values, dtype='f8'), FILL)
+        return path
+
+    def check(self, base, test, differ, strict_differ):
+        file1 = self.write('base.nc', base)
+        file2 = self.write('test.nc', test)
+        self.assertEqual(compare_ncfile.compare(file1, file2, BUDGET) is not None,
+                         differ)
+        self.assertEqual(compare_ncfile.compare_stats(file1, file2, BUDGET)['failed'],
+                         differ)
+        self.assertEqual(compare_ncfile.compare_stats(
+            file1, file2, BUDGET, strict_missing=True)['failed'], strict_differ)
+        self.assertEqual(compare_ncfile.compare_stats(
+            file1, file2, BUDGET, first_failure=True)['failed'], differ)
+
+    def test_equal(self):
+        self.check([1, 2, 3], [1, 2, 3], False, False)
+
+    def test_value_differs(self):
+        self.check([1, 2, 3], [1, 2, 4], True, True)
+
+    def test_masked_in_one_file(self):
+        self.check([1, FILL, 3], [1, 2, 3], False, True)
+
+    def test_nan_in_one_file(self):
+        self.check([1, np.nan, 3], [1, 2, 3], True, True)
+
+    def test_nan_in_both_files(self):
+        self.check([1, np.nan, 3], [1, np.nan, 3], True, False)
+
+    def test_rms_over_common_points(self):
+        file1 = self.write('base.nc', [1, 2, 3, FILL])
+        file2 = self.write('test.nc', [1, 2, 4, 5])
+        stats = compare_ncfile.compare_stats(file1, file2, BUDGET)['variables']['t']
+        self.assertEqual(stats['npoints'], 3)
+        self.assertAlmostEqual(stats['rms'], (1 / 3) ** 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+"""job_monitor.py against a stand-in for squeue."""
+import os
+import sys
+import stat
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import job_monitor  # noqa: E402
+
+# Prints the jobs listed in $STUB_DIR/queue, as squeue does for the ids of
+# -j; $STUB_DIR/mode makes it fail, report purged jobs or hang instead.
+FAKE_SQUEUE = """#!/bin/bash
+while [[ $# -gt 0 ]]; do
+  [[ $1 == -j ]] && ids=$2
+  shift
+done
+mode=$( cat $STUB_DIR/mode 2>/dev/null || echo ok )
+echo "called $ids" >> $STUB_DIR/calls
+case $mode in
+  down) echo "slurm_load_jobs error: Unable to contact slurm controller" >&2; exit 1 ;;
+  hang) exec sleep 30 ;;
+esac
+echo "JOBID PARTITION NAME USER ST TIME NODES NODELIST(REASON)"
+listed=0
+for id in ${ids//,/ }; do
+  if grep -q "^$id " $STUB_DIR/queue 2>/dev/null; then
+    grep "^$id " $STUB_DIR/queue
+    listed=1
+  fi
+done
+if [[ $listed == 0 ]]; then
+  echo "slurm_load_jobs error: Invalid job id specified" >&2
+  exit 1
+fi
+"""
+
+
+class JobMonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.stub_dir = os.path.join(self.dir, 'stub')
+        os.makedirs(self.stub_dir)
+        os.environ['STUB_DIR'] = self.stub_dir
+        self.squeue = os.path.join(self.stub_dir, 'squeue')
+        with open(self.squeue, 'w') as f:
+            f.write(FAKE_SQUEUE)
+        os.chmod(self.squeue, stat.S_IRWXU)
+        self.monitor = os.path.join(self.dir, 'monitor')
+        os.makedirs(os.path.join(self.monitor, 'jobs'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, text):
+        with open(os.path.join(self.stub_dir, name), 'w') as f:
+            f.write(text)
+
+    def register(self, *ids):
+        for jobid in ids:
+            open(os.path.join(self.monitor, 'jobs', jobid), 'w').close()
+
+    def status(self, jobid):
+        with open(os.path.join(self.monitor, 'status', jobid)) as f:
+            return f.read()
+
+    def update(self):
+        return job_monitor.update(self.monitor, 'slurm', self.squeue)
+
+    def test_one_query_for_all_jobs(self):
+        self.write('queue', '11 hera run_1 me R 1:00 1 h1\n'
+                            '12 hera run_2 me PD 0:00 1 (Priority)\n')
+        self.register('11', '12', '13')
+        self.assertTrue(self.update())
+        self.assertEqual(self.status('11'), '11 hera run_1 me R 1:00 1 h1\n')
+        self.assertIn(' PD ', self.status('12'))
+        self.assertEqual(self.status('13'), '')
+        with open(os.path.join(self.stub_dir, 'calls')) as f:
+            self.assertEqual(f.read(), 'called 11,12,13\n')
+        self.assertTrue(os.path.exists(os.path.join(self.monitor, 'heartbeat')))
+
+    def test_all_jobs_gone(self):
+        self.register('21')
+        self.assertTrue(self.update())
+        self.assertEqual(self.status('21'), '')
+
+    def test_failed_query_keeps_status(self):
+        self.write('queue', '31 hera run_1 me R 1:00 1 h1\n')
+        self.register('31')
+        self.assertTrue(self.update())
+        os.remove(os.path.join(self.monitor, 'heartbeat'))
+        self.write('mode', 'down')
+        self.assertFalse(self.update())
+        self.assertEqual(self.status('31'), '31 hera run_1 me R 1:00 1 h1\n')
+        self.assertFalse(os.path.exists(os.path.join(self.monitor, 'heartbeat')))
+
+    def test_query_timeout_keeps_status(self):
+        self.write('queue', '41 hera run_1 me R 1:00 1 h1\n')
+        self.register('41')
+        self.assertTrue(self.update())
+        self.write('mode', 'hang')
+        timeout = job_monitor.QUERY_TIMEOUT
+        job_monitor.QUERY_TIMEOUT = 1
+        try:
+            self.assertFalse(self.update())
+        finally:
+            job_monitor.QUERY_TIMEOUT = timeout
+        self.assertIn(' R ', self.status('41'))
+
+
+if __name__ == '__main__':
+    unittest.main()
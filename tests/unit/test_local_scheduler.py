@@ -0,0 +1,90 @@
+"""local_scheduler.py Daemon, stepped by hand."""
+import os
+import sys
+import time
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import local_scheduler  # noqa: E402
+
+
+class DaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = os.path.join(self.tmp.name, 'scheduler')
+        self.daemon = local_scheduler.Daemon(self.dir, 4)
+
+    def tearDown(self):
+        for job, proc in self.daemon.running.values():
+            self.daemon.kill(proc, local_scheduler.signal.SIGKILL)
+            proc.wait()
+        self.tmp.cleanup()
+
+    def submit(self, name, cores, script='sleep 30\n', minutes=0):
+        run_dir = os.path.join(self.tmp.name, name)
+        os.makedirs(run_dir)
+        card = os.path.join(run_dir, 'job_card')
+        with open(card, 'w') as f:
+            f.write(script)
+        jobid = local_scheduler.submit(self.dir, card, cores, minutes=minutes)
+        # ordered by submission time, which must differ
+        time.sleep(0.01)
+        return jobid
+
+    def state(self, jobid):
+        return local_scheduler.status(self.dir, [jobid])[0].split()[4]
+
+    def test_oldest_first(self):
+        small = self.submit('small', 2)
+        large = self.submit('large', 4)
+        later = self.submit('later', 1)
+        self.daemon.step()
+        # later would fit next to small, but large is older
+        self.assertEqual([self.state(j) for j in (small, large, later)],
+                         ['R', 'Q', 'Q'])
+        local_scheduler.cancel(self.dir, [small])
+        for _ in range(50):
+            self.daemon.step()
+            if self.state(large) == 'R':
+                break
+            time.sleep(0.1)
+        self.assertEqual([self.state(j) for j in (small, large, later)],
+                         ['CA', 'R', 'Q'])
+
+    def test_jobs_past_the_end_are_cancelled(self):
+        self.daemon.end = time.time() + 10 * 60
+        long = self.submit('long', 1, minutes=30)
+        short = self.submit('short', 1, minutes=5)
+        self.daemon.step()
+        self.assertEqual([self.state(j) for j in (long, short)], ['CA', 'R'])
+
+    def test_stop_kills_jobs_ignoring_sigterm(self):
+        stubborn = self.submit('stubborn', 1,
+                               "trap '' TERM\ntouch started\n"
+                               "while true; do sleep 1; done\n")
+        queued = self.submit('queued', 4)
+        self.daemon.step()
+        started = os.path.join(self.tmp.name, 'stubborn', 'started')
+        for _ in range(50):
+            if os.path.exists(started):
+                break
+            time.sleep(0.1)
+        timeout = local_scheduler.KILL_TIMEOUT
+        local_scheduler.KILL_TIMEOUT = 1
+        try:
+            begin = time.time()
+            # the parent process is gone: run() stops at once
+            self.daemon.run(ppid=2 ** 22 + 1)
+        finally:
+            local_scheduler.KILL_TIMEOUT = timeout
+        self.assertLess(time.time() - begin, 10)
+        self.assertEqual(local_scheduler.status(self.dir, [stubborn])[0].split()[4:],
+                         ['F', '-9'])
+        self.assertEqual(self.state(queued), 'CA')
+        self.assertTrue(os.path.exists(os.path.join(self.dir, 'stopped')))
+
+
+if __name__ == '__main__':
+    unittest.main()
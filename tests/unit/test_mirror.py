@@ -0,0 +1,118 @@
+"""auto/jobs/mirror.py against local repositories with a submodule."""
+import os
+import sys
+import subprocess
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'auto'))
+from jobs import mirror  # noqa: E402
+
+# local clones of submodules need file:// allowed; commits need a name
+GIT_ENV = {'GIT_CONFIG_COUNT': '1',
+           'GIT_CONFIG_KEY_0': 'protocol.file.allow',
+           'GIT_CONFIG_VALUE_0': 'always',
+           'GIT_AUTHOR_NAME': 'rt', 'GIT_AUTHOR_EMAIL': 'rt@localhost',
+           'GIT_COMMITTER_NAME': 'rt', 'GIT_COMMITTER_EMAIL': 'rt@localhost'}
+
+
+def git(cwd, *args):
+    return subprocess.run(['git'] + list(args), cwd=cwd, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          universal_newlines=True).stdout.strip()
+
+
+class MirrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = dict(os.environ)
+        os.environ.update(GIT_ENV)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        # upstream: ufs.git with the submodule fv3.git
+        self.fv3 = self.make_repo('fv3')
+        self.ufs = self.make_repo('ufs')
+        work = os.path.join(self.dir, 'ufs-work')
+        git(self.dir, 'clone', '-q', self.ufs, work)
+        git(work, 'submodule', 'add', '-q', self.fv3, 'FV3')
+        git(work, 'commit', '-q', '-m', 'add FV3')
+        git(work, 'push', '-q', 'origin', 'main')
+        self.workdir = os.path.join(self.dir, 'autort', 'pr')
+        os.makedirs(self.workdir)
+        self.fetch_interval = mirror.FETCH_INTERVAL
+
+    def tearDown(self):
+        mirror.FETCH_INTERVAL = self.fetch_interval
+        os.environ.clear()
+        os.environ.update(self.env)
+        self.tmp.cleanup()
+
+    def make_repo(self, name):
+        """Create the bare repo <name>.git with one commit on main."""
+        bare = os.path.join(self.dir, f'{name}.git')
+        git(self.dir, 'init', '-q', '--bare', '-b', 'main', bare)
+        work = os.path.join(self.dir, f'{name}-init')
+        git(self.dir, 'clone', '-q', bare, work)
+        git(work, 'checkout', '-q', '-b', 'main')
+        with open(os.path.join(work, 'README'), 'w') as f:
+            f.write(f'{name}\n')
+        git(work, 'add', 'README')
+        git(work, 'commit', '-q', '-m', f'{name}')
+        git(work, 'push', '-q', 'origin', 'main')
+        return bare
+
+    def job(self, url):
+        base = SimpleNamespace(repo=SimpleNamespace(html_url=url), ref='main')
+        return SimpleNamespace(preq_dict={'preq': SimpleNamespace(base=base)})
+
+    def push_commit(self, name):
+        work = os.path.join(self.dir, 'ufs-work')
+        with open(os.path.join(work, name), 'w') as f:
+            f.write(name)
+        git(work, 'add', name)
+        git(work, 'commit', '-q', '-m', name)
+        git(work, 'push', '-q', 'origin', 'main')
+        return git(work, 'rev-parse', 'HEAD')
+
+    def test_update_mirror(self):
+        root = mirror.mirror_root(self.workdir)
+        path = mirror.update_mirror(self.ufs, root, 'main')
+        self.assertEqual(path, os.path.join(self.dir, 'autort', 'mirror', 'ufs.git'))
+        self.assertTrue(os.path.isdir(os.path.join(path, '.git', 'modules', 'FV3')))
+        # fetched again only once FETCH_INTERVAL has passed
+        head = self.push_commit('second')
+        mirror.update_mirror(self.ufs, root, 'main')
+        self.assertNotEqual(git(path, 'rev-parse', 'HEAD'), head)
+        mirror.FETCH_INTERVAL = 0
+        mirror.update_mirror(self.ufs, root, 'main')
+        self.assertEqual(git(path, 'rev-parse', 'HEAD'), head)
+
+    def test_clone_borrows_objects(self):
+        clone_opts, submodule_opts = mirror.clone_options(self.job(self.ufs),
+                                                          self.workdir)
+        self.assertIn('--reference-if-able', clone_opts)
+        # the commands of rt.py and bl.py clone_pr_repo
+        subprocess.run(f'git clone -q {clone_opts}-b main {self.ufs} pr',
+                       shell=True, check=True, cwd=self.workdir)
+        clone = os.path.join(self.workdir, 'pr')
+        subprocess.run(f'git {submodule_opts}submodule update --init --recursive',
+                       shell=True, check=True, cwd=clone,
+                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        mirror_git = os.path.join(mirror.mirror_root(self.workdir), 'ufs.git', '.git')
+        for git_dir, objects in ((os.path.join(clone, '.git'), mirror_git),
+                                 (os.path.join(clone, '.git', 'modules', 'FV3'),
+                                  os.path.join(mirror_git, 'modules', 'FV3'))):
+            with open(os.path.join(git_dir, 'objects', 'info', 'alternates')) as f:
+                self.assertEqual(os.path.realpath(f.read().strip()),
+                                 os.path.realpath(os.path.join(objects, 'objects')))
+        self.assertEqual(git(os.path.join(clone, 'FV3'), 'log', '--format=%s'), 'fv3')
+
+    def test_no_mirror(self):
+        missing = os.path.join(self.dir, 'missing.git')
+        self.assertEqual(mirror.clone_options(self.job(missing), self.workdir),
+                         ('', ''))
+
+
+if __name__ == '__main__':
+    unittest.main()
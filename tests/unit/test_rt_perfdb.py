@@ -0,0 +1,147 @@
+"""rt_perfdb.py check and walltime, run as rt_utils.sh and run_test.sh run
+them, on a temporary database."""
+import os
+import sys
+import tempfile
+import unittest
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+import rt_perfdb  # noqa: E402
+
+RT_PERFDB = os.path.join(HERE, '..', 'rt_perfdb.py')
+
+
+class PerfCheckTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, 'rt_perf.db')
+        conn = rt_perfdb.connect(self.db)
+        with conn:
+            for i, wall_time in enumerate([100.0, 102.0, 98.0, 101.0, 99.0]):
+                log_id = conn.execute(
+                    'INSERT INTO logs (digest, machine, compiler, committed)'
+                    ' VALUES (?, ?, ?, ?)',
+                    (f'log{i}', 'hera.intel', 'intel', i)).lastrowid
+                conn.execute(
+                    'INSERT INTO tests (log_id, nr, test, status, wall_time,'
+                    ' tries, max_rss) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (log_id, '001', 'control', 'PASS', wall_time, 1,
+                     1000000))
+        conn.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_perfdb(self, *args):
+        return subprocess.run(
+            [sys.executable, RT_PERFDB, '--db', self.db] + list(args),
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            universal_newlines=True)
+
+    def check(self, wall_time, *args):
+        out = os.path.join(self.tmp.name, 'out')
+        with open(out, 'w') as f:
+            f.write(f' The total amount of wall time                        = '
+                    f'{wall_time}\n')
+        return self.run_perfdb('check', 'control', '--machine', 'hera.intel',
+                               '--out', out, *args)
+
+    def test_pass(self):
+        proc = self.check(103.5, '--max-rss', '1010000')
+        self.assertEqual(proc.returncode, 0, proc.stdout)
+        self.assertIn('5 runs', proc.stdout)
+        self.assertNotIn('EXCEEDS LIMIT', proc.stdout)
+
+    def test_regression(self):
+        proc = self.check(130.0)
+        self.assertEqual(proc.returncode, rt_perfdb.PERF_REGRESSION,
+                         proc.stdout)
+        self.assertIn('EXCEEDS LIMIT', proc.stdout)
+
+    def test_memory_regression(self):
+        proc = self.check(100.0, '--max-rss', '1500000')
+        self.assertEqual(proc.returncode, rt_perfdb.PERF_REGRESSION,
+                         proc.stdout)
+        self.assertIn('max memory', proc.stdout)
+
+    def test_trend(self):
+        proc = self.run_perfdb('trend', 'control', '--machine', 'hera.intel')
+        self.assertEqual(proc.returncode, 0, proc.stdout)
+        self.assertEqual(len(proc.stdout.splitlines()), 5)
+
+    def walltime(self, *args):
+        proc = self.run_perfdb('walltime', 'control', '--machine', 'hera.intel',
+                               *args)
+        self.assertEqual(proc.returncode, 0, proc.stdout)
+        return int(proc.stdout)
+
+    def test_walltime(self):
+        # 102 s x 10 = 17 minutes, plus the overhead
+        self.assertEqual(self.walltime('--default', '30', '--margin', '10'),
+                         17 + rt_perfdb.WLCLK_OVERHEAD)
+        # never less than --minimum, never more than --default
+        self.assertEqual(self.walltime('--default', '30'), 10)
+        self.assertEqual(self.walltime('--default', '20', '--margin', '30'), 20)
+
+    def test_walltime_too_little_history(self):
+        self.assertEqual(self.walltime('--default', '30', '--last', '2',
+                                       '--margin', '10'), 30)
+        proc = self.run_perfdb('walltime', 'unknown_test', '--machine',
+                               'hera.intel', '--default', '25')
+        self.assertEqual(proc.stdout.strip(), '25')
+
+    def test_uncommitted_log_is_recent(self):
+        conn = rt_perfdb.connect(self.db)
+        with conn:
+            log_id = conn.execute(
+                'INSERT INTO logs (digest, machine, compiler, ingested)'
+                ' VALUES (?, ?, ?, ?)',
+                ('local', 'hera.intel', 'intel', 2 ** 40)).lastrowid
+            conn.execute(
+                'INSERT INTO tests (log_id, nr, test, status, wall_time,'
+                ' tries) VALUES (?, ?, ?, ?, ?, ?)',
+                (log_id, '001', 'control', 'PASS', 200.0, 1))
+        self.assertEqual(rt_perfdb.reference(conn, 'control', 'hera.intel',
+                                             last=1), [200.0])
+        conn.close()
+
+    def test_commit_of_ingested_log(self):
+        path = os.path.join(HERE, '..', 'RegressionTests_hera.intel.log')
+        with open(path, errors='replace') as f:
+            text = f.read()
+        conn = rt_perfdb.connect(self.db)
+        self.assertTrue(rt_perfdb.ingest(conn, path, text))
+        self.assertFalse(rt_perfdb.ingest(conn, path, text, 'abc', 1000))
+        self.assertEqual(conn.execute(
+            'SELECT git_commit, committed FROM logs WHERE committed = 1000'
+            ).fetchall(), [('abc', 1000)])
+        conn.close()
+
+    def test_ingest_git_reads_new_versions_only(self):
+        shows = []
+        git = rt_perfdb.git
+
+        def counting_git(*args, cwd=None):
+            if args[0] == 'show':
+                shows.append(args[1])
+            return git(*args, cwd=cwd)
+
+        path = os.path.join(HERE, '..', 'RegressionTests_hera.intel.log')
+        conn = rt_perfdb.connect(self.db)
+        rt_perfdb.git = counting_git
+        try:
+            rt_perfdb.ingest_git(conn, [path])
+            read = len(shows)
+            rt_perfdb.ingest_git(conn, [path])
+        finally:
+            rt_perfdb.git = git
+            conn.close()
+        self.assertGreater(read, 0)
+        self.assertEqual(len(shows), read)
+
+
+if __name__ == '__main__':
+    unittest.main()